@@ -27,8 +27,13 @@ setup(
     install_requires=[
         'grpcio<1.6dev',
         'google-cloud',
+        'numpy',
         'requests>=2.13.0'
     ],
+    extras_require={
+        'async': ['aiohttp>=3.0'],
+        'parquet': ['pyarrow>=7.0'],
+    },
     classifiers=CLASSIFIERS,
     include_package_data=True
 )
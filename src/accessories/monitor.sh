@@ -6,6 +6,66 @@ echo Total Disk Space \(KB\): $(df -k | grep cromwell_root | awk '{ print $2}')
 echo
 echo --- Runtime Information ---
 
+# --- begin monitor_functions.sh: verbatim copy, edit that file instead ---
+function timestamp() {
+        # sets now_us to microseconds since the epoch (whole seconds before bash 5)
+        if [[ -n $EPOCHREALTIME ]]; then
+                now_us=${EPOCHREALTIME//[!0-9]/}
+        else
+                printf -v now_us '%(%s)T000000' -1
+        fi
+}
+
+function activity() {
+        # sets cpu_percent, load_average and the disk and network throughputs (KB/s) since the
+        # previous call, from counters in /proc
+        local cpu user nice system idle iowait irq softirq steal rest
+        read -r cpu user nice system idle iowait irq softirq steal rest < /proc/stat
+        local cpu_total=$((user + nice + system + idle + iowait + irq + softirq + steal))
+        local cpu_busy=$((cpu_total - idle - iowait))
+
+        # whole disks only: partitions and device-mapper volumes would count the same I/O twice
+        local major minor name reads merged sectors_read ms writes write_merged sectors_written
+        local disk_read_kb=0 disk_write_kb=0
+        while read -r major minor name reads merged sectors_read ms writes write_merged \
+                        sectors_written rest; do
+                if [[ $name =~ ^(sd[a-z]+|vd[a-z]+|xvd[a-z]+|nvme[0-9]+n[0-9]+)$ ]]; then
+                        disk_read_kb=$((disk_read_kb + sectors_read / 2))  # 512 byte sectors
+                        disk_write_kb=$((disk_write_kb + sectors_written / 2))
+                fi
+        done < /proc/diskstats
+
+        local line rx tx net_rx_bytes=0 net_tx_bytes=0
+        while read -r line; do
+                [[ $line == *:* && ${line%%:*} != lo ]] || continue  # skip headers and loopback
+                read -r rx _ _ _ _ _ _ _ tx rest <<< "${line#*:}"
+                net_rx_bytes=$((net_rx_bytes + rx))
+                net_tx_bytes=$((net_tx_bytes + tx))
+        done < /proc/net/dev
+
+        read -r load_average rest < /proc/loadavg
+
+        timestamp
+        if [[ -z $last_us ]]; then  # first call: nothing to compare with yet
+                cpu_percent= disk_read_kbps= disk_write_kbps= net_rx_kbps= net_tx_kbps=
+        else
+                local elapsed_us=$((now_us > last_us ? now_us - last_us : 1))
+                local cpu_elapsed=$((cpu_total > last_cpu_total ? cpu_total - last_cpu_total : 1))
+                local cpu_permille=$((1000 * (cpu_busy - last_cpu_busy) / cpu_elapsed))
+                cpu_percent=$((cpu_permille / 10)).$((cpu_permille % 10))
+                disk_read_kbps=$(((disk_read_kb - last_disk_read_kb) * 1000000 / elapsed_us))
+                disk_write_kbps=$(((disk_write_kb - last_disk_write_kb) * 1000000 / elapsed_us))
+                net_rx_kbps=$(((net_rx_bytes - last_net_rx_bytes) * 1000000 / 1024 / elapsed_us))
+                net_tx_kbps=$(((net_tx_bytes - last_net_tx_bytes) * 1000000 / 1024 / elapsed_us))
+        fi
+
+        last_us=$now_us last_cpu_busy=$cpu_busy last_cpu_total=$cpu_total
+        last_disk_read_kb=$disk_read_kb last_disk_write_kb=$disk_write_kb
+        last_net_rx_bytes=$net_rx_bytes last_net_tx_bytes=$net_tx_bytes
+}
+# --- end monitor_functions.sh ---
+
+
 function runtimeInfo() {
         # echo [$(date)]  # we don't really care about the date that much.
 
@@ -18,6 +78,18 @@ function runtimeInfo() {
         # print disk usage in 1024 k blocks
         echo \* Disk usage \(KB\): $(df -k | grep cromwell_root | awk '{ print $3; }')
 
+        activity
+        # the first sample only starts the counters, see activity
+        [[ -n $cpu_percent ]] || return
+        # print the percentage of cpu time spent busy, and the 1 minute load average
+        echo \* CPU usage \(%\): ${cpu_percent}%
+        echo \* Load average: $load_average
+        # print disk and network throughput since the previous sample, in KB/s
+        echo \* Disk read \(KB/s\): $disk_read_kbps
+        echo \* Disk write \(KB/s\): $disk_write_kbps
+        echo \* Network received \(KB/s\): $net_rx_kbps
+        echo \* Network sent \(KB/s\): $net_tx_kbps
+
 }
 
 while true; do runtimeInfo; sleep 5; done
\ No newline at end of file
@@ -0,0 +1,123 @@
+#!/bin/bash
+# Compact alternative to monitor.sh: writes a short header, then one CSV record per sample.
+#
+# monitor.sh forks free, df, grep and awk for every value it prints. Here memory, CPU, load,
+# disk I/O and network counters are read from /proc with bash builtins, the timestamp is
+# formatted by printf, and the pause between samples is a timed read, so the only process
+# started per sample is one `stat -f` (bash cannot call statfs itself).
+#
+# cromwell_manager.ResourceUtilization detects this format from the first line.
+#
+# Environment:
+#   MONITOR_INTERVAL  seconds between samples (default 5)
+#   MONITOR_DISK      mount point whose usage is recorded (default /cromwell_root)
+
+interval=${MONITOR_INTERVAL:-5}
+disk=${MONITOR_DISK:-/cromwell_root}
+
+function memoryUsage() {
+        # sets total_memory_mb and memory_mb; used memory is MemTotal - MemAvailable, as in free
+        local key value total=0 available=0
+        while read -r key value _; do
+                case $key in
+                        MemTotal:) total=$value ;;
+                        MemAvailable:) available=$value; break ;;
+                esac
+        done < /proc/meminfo
+        total_memory_mb=$((total / 1024))
+        memory_mb=$(((total - available) / 1024))
+}
+
+function diskUsage() {
+        # sets total_disk_kb and disk_kb from one statfs call; used space is total - free, as in df
+        local blocks free size
+        read -r blocks free size <<< "$(stat -f -c '%b %f %S' "$disk")"
+        total_disk_kb=$((blocks * size / 1024))
+        disk_kb=$(((blocks - free) * size / 1024))
+}
+
+# --- begin monitor_functions.sh: verbatim copy, edit that file instead ---
+function timestamp() {
+        # sets now_us to microseconds since the epoch (whole seconds before bash 5)
+        if [[ -n $EPOCHREALTIME ]]; then
+                now_us=${EPOCHREALTIME//[!0-9]/}
+        else
+                printf -v now_us '%(%s)T000000' -1
+        fi
+}
+
+function activity() {
+        # sets cpu_percent, load_average and the disk and network throughputs (KB/s) since the
+        # previous call, from counters in /proc
+        local cpu user nice system idle iowait irq softirq steal rest
+        read -r cpu user nice system idle iowait irq softirq steal rest < /proc/stat
+        local cpu_total=$((user + nice + system + idle + iowait + irq + softirq + steal))
+        local cpu_busy=$((cpu_total - idle - iowait))
+
+        # whole disks only: partitions and device-mapper volumes would count the same I/O twice
+        local major minor name reads merged sectors_read ms writes write_merged sectors_written
+        local disk_read_kb=0 disk_write_kb=0
+        while read -r major minor name reads merged sectors_read ms writes write_merged \
+                        sectors_written rest; do
+                if [[ $name =~ ^(sd[a-z]+|vd[a-z]+|xvd[a-z]+|nvme[0-9]+n[0-9]+)$ ]]; then
+                        disk_read_kb=$((disk_read_kb + sectors_read / 2))  # 512 byte sectors
+                        disk_write_kb=$((disk_write_kb + sectors_written / 2))
+                fi
+        done < /proc/diskstats
+
+        local line rx tx net_rx_bytes=0 net_tx_bytes=0
+        while read -r line; do
+                [[ $line == *:* && ${line%%:*} != lo ]] || continue  # skip headers and loopback
+                read -r rx _ _ _ _ _ _ _ tx rest <<< "${line#*:}"
+                net_rx_bytes=$((net_rx_bytes + rx))
+                net_tx_bytes=$((net_tx_bytes + tx))
+        done < /proc/net/dev
+
+        read -r load_average rest < /proc/loadavg
+
+        timestamp
+        if [[ -z $last_us ]]; then  # first call: nothing to compare with yet
+                cpu_percent= disk_read_kbps= disk_write_kbps= net_rx_kbps= net_tx_kbps=
+        else
+                local elapsed_us=$((now_us > last_us ? now_us - last_us : 1))
+                local cpu_elapsed=$((cpu_total > last_cpu_total ? cpu_total - last_cpu_total : 1))
+                local cpu_permille=$((1000 * (cpu_busy - last_cpu_busy) / cpu_elapsed))
+                cpu_percent=$((cpu_permille / 10)).$((cpu_permille % 10))
+                disk_read_kbps=$(((disk_read_kb - last_disk_read_kb) * 1000000 / elapsed_us))
+                disk_write_kbps=$(((disk_write_kb - last_disk_write_kb) * 1000000 / elapsed_us))
+                net_rx_kbps=$(((net_rx_bytes - last_net_rx_bytes) * 1000000 / 1024 / elapsed_us))
+                net_tx_kbps=$(((net_tx_bytes - last_net_tx_bytes) * 1000000 / 1024 / elapsed_us))
+        fi
+
+        last_us=$now_us last_cpu_busy=$cpu_busy last_cpu_total=$cpu_total
+        last_disk_read_kb=$disk_read_kb last_disk_write_kb=$disk_write_kb
+        last_net_rx_bytes=$net_rx_bytes last_net_tx_bytes=$net_tx_bytes
+}
+# --- end monitor_functions.sh ---
+
+cpus=0
+while read -r key _; do
+        [[ $key == processor ]] && ((cpus++))
+done < /proc/cpuinfo
+
+memoryUsage
+diskUsage
+echo '#cromwell-monitor-csv 1'
+echo "#cpus=$cpus"
+echo "#total_memory_mb=$total_memory_mb"  # prints in mb
+echo "#total_disk_kb=$total_disk_kb"  # prints in kb
+echo "#interval=$interval"
+echo '#columns=time,memory_mb,disk_kb,cpu_percent,load_average,disk_read_kbps,disk_write_kbps,net_rx_kbps,net_tx_kbps'
+
+# a pipe that is never written to: reading it with a timeout sleeps without forking `sleep`
+exec {sleeper}<> <(:)
+
+while true; do
+        memoryUsage
+        diskUsage
+        activity
+        # the activity columns are empty in the first record, see activity
+        printf '%(%s)T,%d,%d,%s,%s,%s,%s,%s,%s\n' -1 "$memory_mb" "$disk_kb" "$cpu_percent" \
+                "$load_average" "$disk_read_kbps" "$disk_write_kbps" "$net_rx_kbps" "$net_tx_kbps"
+        read -r -t "$interval" -u "$sleeper"
+done
@@ -1,2 +1,4 @@
 from .cromwell import Cromwell
 from .workflow import Workflow
+from .metadata_store import MetadataStore
+from .submission import SubmissionBundle
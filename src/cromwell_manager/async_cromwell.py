@@ -0,0 +1,457 @@
+import re
+import json
+import time
+import asyncio
+import aiohttp
+from .cromwell import _query_tags, _metadata_tags
+from .resilience import RetryPolicy, CircuitBreaker, parse_retry_after
+from .ratelimit import RateLimiter
+from .metrics import MetricsRegistry
+
+
+def _client_timeout(timeout):
+    """Convert a RetryPolicy timeout to an aiohttp.ClientTimeout."""
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+    return aiohttp.ClientTimeout(total=timeout)
+
+
+class AsyncCromwell:
+    """Non-blocking wrapper for the Cromwell REST API, built on asyncio and aiohttp.
+
+    Mirrors the endpoint surface of `cromwell_manager.cromwell.Cromwell`, but every endpoint is a
+    coroutine. At most `max_concurrency` requests are in flight at any time, so the gather helpers
+    (`statuses`, `metadata_many`, ...) can be handed thousands of workflow ids without flooding
+    the server.
+
+    Usage::
+
+        async with AsyncCromwell('http://localhost:8000') as cromwell:
+            statuses = await cromwell.statuses(workflow_ids)
+    """
+
+    def __init__(self, cromwell_url, username=None, password=None, api_version='v1',
+                 max_concurrency=50, limit_per_host=0, retry_policy=None, circuit_breaker=None,
+                 rate_limiter=None, metrics=None):
+        """API wrapper for a running cromwell server
+
+        :param str cromwell_url: url of a running cromwell instance
+        :param str | None username: (optional) username for the cromwell instance
+        :param str | None password: (optional) password for the cromwell instance
+        :param str api_version: version of the cromwell API
+        :param int max_concurrency: maximum number of requests in flight at once (default 50)
+        :param int limit_per_host: maximum number of open connections to the cromwell host,
+          0 for no limit beyond max_concurrency (default 0)
+        :param RetryPolicy retry_policy: (optional) retry, backoff and timeout settings. Defaults
+          to RetryPolicy(); pass RetryPolicy(max_attempts=1) to disable retries.
+        :param CircuitBreaker circuit_breaker: (optional) breaker shared by every request made
+          by this server object
+        :param RateLimiter rate_limiter: (optional) request rate and concurrency limits, which
+          may also be shared with a `Cromwell` object
+        :param MetricsRegistry metrics: (optional) registry in which requests are recorded
+        """
+        if not isinstance(cromwell_url, str):
+            raise TypeError('cromwell_url must be a str, not %s' % type(cromwell_url))
+        if not re.match('https?://', cromwell_url):
+            raise ValueError('cromwell_url must be an http or https address.')
+        self.cromwell_url = cromwell_url.rstrip('/')  # trailing slash is not accepted by cromwell
+
+        for name, value in (('username', username), ('password', password)):
+            if not (isinstance(value, str) or value is None):
+                raise TypeError('If provided, %s must be a str, not %s' % (name, type(value)))
+
+        if isinstance(api_version, str):
+            self.api_version = api_version
+        else:
+            raise ValueError('version must be a str, not %s' % type(api_version))
+
+        if not isinstance(max_concurrency, int) or max_concurrency < 1:
+            raise ValueError('max_concurrency must be a positive int, not %r' % max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.limit_per_host = limit_per_host
+
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        elif not isinstance(retry_policy, RetryPolicy):
+            raise TypeError('If provided, retry_policy must be a RetryPolicy, not %s'
+                            % type(retry_policy))
+        if not (circuit_breaker is None or isinstance(circuit_breaker, CircuitBreaker)):
+            raise TypeError('If provided, circuit_breaker must be a CircuitBreaker, not %s'
+                            % type(circuit_breaker))
+        if not (rate_limiter is None or isinstance(rate_limiter, RateLimiter)):
+            raise TypeError('If provided, rate_limiter must be a RateLimiter, not %s'
+                            % type(rate_limiter))
+        if not (metrics is None or isinstance(metrics, MetricsRegistry)):
+            raise TypeError('If provided, metrics must be a MetricsRegistry, not %s'
+                            % type(metrics))
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+
+        self.auth = aiohttp.BasicAuth(username, password) if username and password else None
+        self.url_prefix = '{cromwell_url}/api/workflows/{version}'.format(
+            cromwell_url=self.cromwell_url, version=self.api_version)
+
+        # created lazily so that they are bound to the running event loop
+        self._session = None
+        self._semaphore = None
+
+    def __repr__(self):
+        return '<AsyncCromwell Server: ip: %s>' % self.cromwell_url
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def session(self):
+        """aiohttp session shared by every request made by this server object."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency, limit_per_host=self.limit_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, auth=self.auth)
+        return self._session
+
+    @property
+    def semaphore(self):
+        """Semaphore bounding the number of concurrent requests."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def close(self):
+        """Close the underlying session and all of its pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @staticmethod
+    def print_request(request_type, request_string, response, body):
+        """Print a request to console.
+
+        :param str request_type: {GET, POST} type of REST operation
+        :param str request_string: full request url
+        :param aiohttp.ClientResponse response: response from request operation
+        :param bytes body: content of the response
+        """
+        try:
+            formatted_response = json.dumps(json.loads(body.decode()), indent=2)
+            print('{request_type} Request: {request_string}\nResponse: {response}\n'
+                  'Response Content:\n{response_content}'.format(
+                    request_type=request_type, request_string=request_string,
+                    response=response.status, response_content=formatted_response))
+        except (json.decoder.JSONDecodeError, UnicodeDecodeError):  # no content obtained
+            print('{request_type} Request: {request_string}\nResponse: {response}\n'
+                  .format(request_type=request_type, request_string=request_string,
+                          response=response.status))
+
+    async def _request(self, method, url, verbose=False, endpoint=None, idempotent=True,
+                       form=None, **kwargs):
+        """Make a REST query to url, bounded by the concurrency semaphore.
+
+        The response body is read before the connection is released, so `response.json()` and
+        `response.text()` can be awaited after this coroutine returns. Failures are retried
+        according to this server's retry_policy; the semaphore is not held while waiting to retry.
+        If this server has a rate_limiter, each attempt waits for its permission, and if it has a
+        metrics registry, each attempt is recorded in it.
+
+        :param str method: {GET, POST} type of REST operation
+        :param str url: query url
+        :param bool verbose: if True, print the query, response code, and content (default False)
+        :param str endpoint: (optional) endpoint name, used to look up the request's timeout
+        :param bool idempotent: whether the request can safely be repeated (default True)
+        :param dict form: (optional) multipart form fields, name mapped to bytes. The form is
+          rebuilt for each attempt, as aiohttp.FormData can only be sent once.
+        :param kwargs: additional keyword args to pass to aiohttp.ClientSession.request
+        :return aiohttp.ClientResponse: response object
+        """
+        policy, breaker, limiter = self.retry_policy, self.circuit_breaker, self.rate_limiter
+        metrics = self.metrics
+        kwargs.setdefault('timeout', _client_timeout(policy.timeout(endpoint)))
+
+        def record(started, status_code=None, size=None, error=None):
+            latency = time.monotonic() - started
+            if breaker is not None:
+                breaker.record(status_code)
+            if limiter is not None:
+                limiter.after_request(latency, status_code)
+            if metrics is not None:
+                metrics.observe(endpoint, method, url, status_code, latency, size, attempt,
+                                None if error is None else type(error).__name__)
+
+        attempt = 0
+        while True:
+            # wait for the limiter before consulting the breaker, so that a cancelled wait cannot
+            # leave the trial request of a half-open circuit claimed forever
+            if limiter is not None:
+                await limiter.before_request_async(endpoint)
+            trial = recorded = False
+            try:
+                if breaker is not None:
+                    trial = breaker.before_request()
+                attempt += 1
+                if form is not None:
+                    kwargs['data'] = aiohttp.FormData()
+                    for name, value in form.items():
+                        kwargs['data'].add_field(name, value, filename=name)
+                started = time.monotonic()
+                try:
+                    async with self.semaphore:
+                        async with self.session.request(method, url, **kwargs) as response:
+                            body = await response.read()
+                except Exception as e:
+                    recorded = True
+                    record(started, error=e)
+                    if not (isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+                            and policy.should_retry(attempt, idempotent=idempotent)):
+                        raise
+                    delay = policy.delay(attempt)
+                else:
+                    recorded = True
+                    record(started, response.status, len(body))
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    if not policy.should_retry(attempt, response.status, idempotent, retry_after):
+                        break
+                    delay = policy.delay(attempt, retry_after)
+            finally:
+                if not recorded:  # abandoned before it was sent, or interrupted
+                    if breaker is not None:
+                        breaker.cancel(trial)
+                    if limiter is not None:
+                        limiter.cancel()
+            await asyncio.sleep(delay)
+        if verbose:
+            self.print_request(method, url, response, body)
+        return response
+
+    async def get(self, url, verbose=False, endpoint=None, **kwargs):
+        """Make a REST GET query to url.
+
+        :param str url: GET query url
+
+        :param bool verbose: if True, print the query, response code, and content (default False)
+        :param str endpoint: (optional) endpoint name, used to look up the request's timeout
+        :param kwargs: additional keyword args to pass to aiohttp.ClientSession.get
+        :return aiohttp.ClientResponse: response object
+        """
+        return await self._request('GET', url, verbose=verbose, endpoint=endpoint, **kwargs)
+
+    async def post(self, url, verbose=False, endpoint=None, idempotent=False, **kwargs):
+        """Make a REST POST query to url.
+
+        :param str url: POST query url
+
+        :param bool verbose: if True, print the query, response code, and content (default False)
+        :param str endpoint: (optional) endpoint name, used to look up the request's timeout
+        :param bool idempotent: if True, the request is retried after any retryable failure;
+          otherwise only after a 429 response (default False)
+        :param kwargs: additional keyword args to pass to aiohttp.ClientSession.post
+        :return aiohttp.ClientResponse: response object
+        """
+        return await self._request('POST', url, verbose=verbose, endpoint=endpoint,
+                                   idempotent=idempotent, **kwargs)
+
+    async def server_is_running(self, **kwargs):
+        """Return True if the server is running, else False."""
+        try:
+            response = await self.get(self.cromwell_url, endpoint='health', **kwargs)
+        except aiohttp.ClientError:
+            return False
+        return response.status == 200
+
+    async def wait_for_status(self, status, workflow_id, verbose=False, timeout=15, delay=3):
+        """Wait until any status in a list of potentially many statuses is achieved for a workflow.
+
+        :param Iterable status: Iterable of one or more statuses to wait for
+        :param str workflow_id: identifier hash code for a workflow
+        :param bool verbose: if True, print the requests made
+        :param int timeout: maximum time to wait, None to wait forever
+        :param int delay: time between status queries
+        :return aiohttp.ClientResponse: the last status response retrieved for workflow_id
+        """
+        status = set(status)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        while True:
+            response = await self.status(workflow_id, verbose=verbose)
+            if (await response.json(content_type=None))['status'] in status:
+                return response
+            if deadline is not None and loop.time() + delay > deadline:
+                print('Workflow {id} took more than {n!s} seconds to achieve {status}'
+                      ''.format(id=workflow_id, n=timeout, status=status))
+                return response
+            await asyncio.sleep(delay)
+
+    async def abort_workflow(self, workflow_id, **kwargs):
+        """Abort a workflow.
+
+        :param str workflow_id: hash for workflow to abort
+        :return aiohttp.ClientResponse: response object
+        """
+        url = self.url_prefix + '/{id}/abort'.format(id=workflow_id)
+        return await self.post(url, endpoint='abort', idempotent=True, **kwargs)
+
+    async def submit(self, files, wait=True, timeout=15, delay=3, verbose=False, **kwargs):
+        """Submit a new workflow.
+
+        :param dict files: dictionary of files from workflow._submission_json
+
+        :param bool wait: if True, wait until workflow recognizes as submitted
+        :param int timeout: maximum time to wait
+        :param int delay: time between status queries
+        :param bool verbose: if True, print request results
+        :param kwargs: additional keyword args to pass to aiohttp.ClientSession.post
+        :return aiohttp.ClientResponse: response object
+        """
+        form = {name: value.read() if hasattr(value, 'read') else value
+                for name, value in files.items()}
+
+        submit_response = await self.post(
+            self.url_prefix, form=form, endpoint='submit', verbose=verbose, **kwargs)
+        if submit_response.status > 201:
+            print('Request: {url}\nWorkflow failed to start!\nResponse Code: {code}\n'
+                  'Reason: {reason}\n'.format(url=submit_response.url,
+                                             code=submit_response.status,
+                                             reason=submit_response.reason))
+            return submit_response
+        if wait:
+            workflow_id = (await submit_response.json(content_type=None))['id']
+            await self.wait_for_status(
+                ['Running', 'Submitted', 'Succeeded'], workflow_id=workflow_id,
+                timeout=timeout, delay=delay, verbose=verbose)
+        return submit_response
+
+    async def outputs(self, workflow_id, **kwargs):
+        """Retrieve outputs for workflow_id.
+
+        :param str workflow_id: hash for workflow
+        :return aiohttp.ClientResponse: response object
+        """
+        url = self.url_prefix + '/{id}/outputs'.format(id=workflow_id)
+        return await self.get(url, endpoint='outputs', **kwargs)
+
+    async def query(self, start=None, end=None, names=None, ids=None, status=None, labels=None,
+                    page=None, page_size=None, submission=None, additional_fields=None,
+                    **kwargs):
+        """Query cromwell for workflows matching specified metadata information.
+
+        See `Cromwell.query` for a description of the parameters.
+
+        :return aiohttp.ClientResponse: response object
+        """
+        tags = _query_tags(start=start, end=end, names=names, ids=ids, status=status,
+                           labels=labels, page=page, page_size=page_size, submission=submission,
+                           additional_fields=additional_fields)
+        url = self.url_prefix + '/query?' + '&'.join(tags)
+        return await self.get(url, endpoint='query', **kwargs)
+
+    async def status(self, workflow_id, **kwargs):
+        """Retrieve status for workflow_id.
+
+        :param str workflow_id: hash for workflow
+        :return aiohttp.ClientResponse: response object
+        """
+        url = self.url_prefix + '/{id}/status'.format(id=workflow_id)
+        return await self.get(url, endpoint='status', **kwargs)
+
+    async def logs(self, workflow_id, **kwargs):
+        """Retrieve logs for workflow_id.
+
+        :param str workflow_id: hash for workflow
+        :return aiohttp.ClientResponse: response object
+        """
+        url = self.url_prefix + '/{id}/logs'.format(id=workflow_id)
+        return await self.get(url, endpoint='logs', **kwargs)
+
+    async def metadata(self, workflow_id, *, include_keys=None, exclude_keys=None,
+                       expand_subworkflows=False, **kwargs):
+        """Retrieve metadata for workflow_id.
+
+        See `Cromwell.metadata` for how include_keys and exclude_keys select metadata fields.
+
+        :param str workflow_id: hash for workflow
+        :param Iterable include_keys: (optional) only retrieve these metadata keys
+        :param Iterable exclude_keys: (optional) retrieve all metadata keys except these
+        :param bool expand_subworkflows: if True, embed the metadata of each subworkflow in the
+          call that launched it (default False)
+        :return aiohttp.ClientResponse: response object
+        """
+        tags = _metadata_tags(include_keys, exclude_keys, expand_subworkflows)
+        url = self.url_prefix + '/{id}/metadata'.format(id=workflow_id)
+        if tags:
+            url += '?' + '&'.join(tags)
+        return await self.get(url, endpoint='metadata', **kwargs)
+
+    async def backends(self, **kwargs):
+        """Retrieve backends for this cromwell instance.
+
+        :return aiohttp.ClientResponse: response object
+        """
+        return await self.get(self.url_prefix + '/backends', endpoint='backends', **kwargs)
+
+    async def version(self, **kwargs):
+        """Retrieve the cromwell version
+
+        :return aiohttp.ClientResponse: response object
+        """
+        url = '{cromwell_url}/engine/{version}/version'.format(
+            cromwell_url=self.cromwell_url, version=self.api_version)
+        return await self.get(url, endpoint='version', **kwargs)
+
+    async def stats(self, **kwargs):
+        """Retrieve cromwell statistics on number of running jobs
+
+        :return aiohttp.ClientResponse: response object
+        """
+        url = '{cromwell_url}/engine/{version}/stats'.format(
+            cromwell_url=self.cromwell_url, version=self.api_version)
+        return await self.get(url, endpoint='stats', **kwargs)
+
+    async def _gather_json(self, endpoint, workflow_ids, **kwargs):
+        """Call endpoint concurrently for each workflow id, returning the decoded json bodies.
+
+        :param coroutine endpoint: bound endpoint method taking a workflow id
+        :param Iterable workflow_ids: workflow ids to look up
+        :return list: json responses, in the order of workflow_ids
+        """
+        async def fetch(workflow_id):
+            response = await endpoint(workflow_id, **kwargs)
+            return await response.json(content_type=None)
+        return await asyncio.gather(*(fetch(i) for i in workflow_ids))
+
+    async def statuses(self, workflow_ids, **kwargs):
+        """Retrieve the status of many workflows concurrently.
+
+        :param Iterable workflow_ids: workflow ids to look up
+        :return list: status dictionaries, in the order of workflow_ids
+        """
+        return await self._gather_json(self.status, workflow_ids, **kwargs)
+
+    async def metadata_many(self, workflow_ids, **kwargs):
+        """Retrieve the metadata of many workflows concurrently.
+
+        :param Iterable workflow_ids: workflow ids to look up
+        :param kwargs: additional keyword args to pass to `metadata`, e.g. include_keys
+        :return list: metadata dictionaries, in the order of workflow_ids
+        """
+        return await self._gather_json(self.metadata, workflow_ids, **kwargs)
+
+    async def outputs_many(self, workflow_ids, **kwargs):
+        """Retrieve the outputs of many workflows concurrently.
+
+        :param Iterable workflow_ids: workflow ids to look up
+        :return list: output dictionaries, in the order of workflow_ids
+        """
+        return await self._gather_json(self.outputs, workflow_ids, **kwargs)
+
+    async def abort_many(self, workflow_ids, **kwargs):
+        """Abort many workflows concurrently.
+
+        :param Iterable workflow_ids: workflow ids to abort
+        :return list: abort responses, in the order of workflow_ids
+        """
+        return await self._gather_json(self.abort_workflow, workflow_ids, **kwargs)
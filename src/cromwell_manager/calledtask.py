@@ -1,26 +1,59 @@
-from .resource_utilization import ResourceUtilization
+from concurrent.futures import ThreadPoolExecutor
+from .resource_utilization import (
+    ResourceUtilization, UtilizationDistribution, MonitoringLogParser)
 from .io_util import GSObject
 
 
+def prefetch_resource_utilization(shards, max_workers=16):
+    """Download and parse the monitoring logs of many shards concurrently.
+
+    :param Iterable shards: Shards whose resource utilization should be retrieved. Shards that
+      have already retrieved it are skipped.
+    :param int max_workers: maximum number of concurrent downloads (default 16)
+    """
+    shards = [s for s in shards if not s.has_resource_utilization]
+    if not shards:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(shards))) as executor:
+        for _ in executor.map(Shard.fetch_resource_utilization, shards):
+            pass
+
+
+def update_resource_utilization(shards, max_workers=16):
+    """Bring the resource utilization of many running shards up to date concurrently.
+
+    Each shard downloads only the part of its monitoring log written since its last update.
+
+    :param Iterable shards: Shards to update
+    :param int max_workers: maximum number of concurrent downloads (default 16)
+    """
+    shards = list(shards)
+    if not shards:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(shards))) as executor:
+        for _ in executor.map(Shard.update_resource_utilization, shards):
+            pass
+
+
 class Shard:
     """at the moment, shard is a simple named dictionary class containing shard information"""
 
     def __init__(self, metadata, client):
         """
 
+        The monitoring log for this shard is not downloaded until `resource_utilization` is first
+        accessed, or it is fetched in bulk with `prefetch_resource_utilization`.
+
         :param dict metadata: shard metadata
+        :param google.cloud.storage.Client client: Authenticated google storage client
         """
 
         self._data = metadata
-
-        gs_log = GSObject(self._data['monitoringLog'], client)
-        try:
-            fileobj = gs_log.download_to_bytes_readable()
-            self._resource_utilization = ResourceUtilization.from_file(
-                task_name=self._data['labels']['wdl-task-name'],
-                open_log_file_object=fileobj)
-        except AttributeError:  # monitoringLog does not exist for this task
-            self._resource_utilization = None
+        self._client = client
+        self._resource_utilization = None
+        self._fetched = False
+        self._log = None  # followed monitoring log, see update_resource_utilization
+        self._parser = None
 
     def __repr__(self):
         return '<Google Compute Shard: %s>' % self._data['labels']['wdl-task-name']
@@ -34,8 +67,80 @@ class Shard:
     def __len__(self):
         return len(self._data)
 
+    @property
+    def index(self):
+        """Scatter index of this shard (-1 if the task is not scattered), or None if unknown."""
+        return self._data.get('shardIndex')
+
+    @property
+    def has_resource_utilization(self):
+        """True if the monitoring log for this shard has already been retrieved."""
+        return self._fetched
+
+    def read_resource_utilization(self):
+        """Download and parse the monitoring log for this shard, one chunk at a time, without
+        keeping the result (see `fetch_resource_utilization`).
+
+        :return ResourceUtilization | None: resource utilization, or None if this shard has no
+          monitoring log
+        """
+        try:
+            # monitoring logs are read once, so they are not worth a place in the object cache
+            gs_log = GSObject(self._data['monitoringLog'], self._client, cache=False)
+            return ResourceUtilization.from_stream(
+                task_name=self._data['labels']['wdl-task-name'],
+                chunks=gs_log.iter_chunks())
+        except (KeyError, AttributeError):  # monitoringLog does not exist for this task
+            return None
+
+    def fetch_resource_utilization(self):
+        """Download and parse the monitoring log for this shard, and keep the result.
+
+        :return ResourceUtilization | None: resource utilization, or None if this shard has no
+          monitoring log
+        """
+        self._resource_utilization = self.read_resource_utilization()
+        self._fetched = True
+        return self._resource_utilization
+
+    def update_resource_utilization(self, chunk_size=2 ** 20):
+        """Follow the monitoring log of a running shard, updating its resource utilization.
+
+        The first call reads the whole log. Later calls retrieve the log's current size and
+        download only the bytes appended since the previous call, and update the
+        ResourceUtilization object returned by earlier calls in place. If the log has been
+        replaced by a shorter one, it is read again from the start.
+
+        :param int chunk_size: maximum number of bytes per ranged request (default 1 MiB)
+        :return ResourceUtilization | None: resource utilization so far, or None if this shard
+          has no monitoring log, or it has not yet been written
+        """
+        try:
+            if self._log is None:
+                self._log = GSObject(self._data['monitoringLog'], self._client, cache=False)
+            else:
+                self._log.reload()
+            task_name = self._data['labels']['wdl-task-name']
+        except KeyError:  # monitoringLog does not exist for this task
+            self._fetched = True
+            return None
+        if self._log.blob is None:  # not yet written
+            return self._resource_utilization
+
+        if self._parser is None or self._log.blob.size < self._parser.offset:
+            self._parser = MonitoringLogParser(task_name)
+            self._resource_utilization = None
+        for chunk in self._log.iter_chunks(chunk_size, start=self._parser.offset):
+            self._parser.feed(chunk)
+        # as when a log is read at once, totals that were not recorded are reported as 0
+        self._resource_utilization = self._parser.summarize(self._resource_utilization)
+        self._fetched = True
+        return self._resource_utilization
+
     @property
     def resource_utilization(self):
+        if not self._fetched:
+            self.fetch_resource_utilization()
         return self._resource_utilization
 
 
@@ -69,12 +174,38 @@ class CalledTask:
     def name(self):
         return self._name
 
+    @property
+    def shards(self):
+        return self._shards
+
+    def prefetch_resource_utilization(self, max_workers=16):
+        """Download the monitoring logs of all shards of this task concurrently.
+
+        :param int max_workers: maximum number of concurrent downloads (default 16)
+        """
+        prefetch_resource_utilization(self._shards, max_workers=max_workers)
+
+    def update_resource_utilization(self, max_workers=16):
+        """Follow the monitoring logs of all shards of this running task, concurrently.
+
+        :param int max_workers: maximum number of concurrent downloads (default 16)
+        """
+        update_resource_utilization(self._shards, max_workers=max_workers)
+
     @property
     def resource_utilization(self):
         if self.is_singleton:
             return self._shards[0].resource_utilization
         else:
-            first = self._shards[0].resource_utilization
-            for next_shard in self._shards[1:]:
-                first = ResourceUtilization.merge(first, next_shard.resource_utilization)
-            return first
+            return self.utilization_distribution.to_resource_utilization()
+
+    @property
+    def utilization_distribution(self):
+        """Utilization of every shard of this task, stacked into columns.
+
+        :return UtilizationDistribution: per-shard utilization
+        """
+        self.prefetch_resource_utilization()
+        return UtilizationDistribution.from_utilizations(
+            [s.resource_utilization for s in self._shards],
+            shard_indices=[i if s.index is None else s.index for i, s in enumerate(self._shards)])
@@ -0,0 +1,252 @@
+import datetime
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from .cromwell import TERMINAL_STATUSES, WorkflowRecord
+
+
+def _timestamp(value):
+    """Convert a cromwell datetime string, datetime, or number to seconds since the epoch.
+
+    :param str | datetime.datetime | float | None value: time to convert. Naive datetimes are
+      assumed to be in UTC.
+    :return float | None: seconds since the epoch
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.timestamp()
+    raise TypeError('times must be datetime strings, datetimes or numbers, not %s' % type(value))
+
+
+class _TimeIndex:
+    """Index of workflow ids by a timestamp.
+
+    Additions and removals are buffered, and applied with a single sort when the index is next
+    searched, so that a bulk update costs O(n log n) rather than O(n) per workflow.
+    """
+
+    def __init__(self):
+        self._keys = []  # (timestamp, workflow id) pairs, sorted when self._sorted is True
+        self._sorted = True
+        self._removed = set()  # pairs still in self._keys that have been removed
+
+    def add(self, workflow_id, timestamp):
+        if timestamp is not None:
+            key = (timestamp, workflow_id)
+            if key in self._removed:  # removed, but not yet dropped from self._keys
+                self._removed.discard(key)
+            else:
+                self._keys.append(key)
+                self._sorted = False
+
+    def remove(self, workflow_id, timestamp):
+        if timestamp is not None:
+            self._removed.add((timestamp, workflow_id))
+
+    def _compact(self):
+        """Drop removed pairs and sort the remaining ones."""
+        if self._removed:
+            self._keys = [k for k in self._keys if k not in self._removed]
+            self._removed.clear()
+        if not self._sorted:
+            self._keys.sort()
+            self._sorted = True
+
+    def between(self, after=None, before=None):
+        """Return the set of ids whose timestamp is in [after, before]."""
+        self._compact()
+        lo = 0 if after is None else bisect_left(self._keys, (after,))
+        hi = len(self._keys) if before is None else bisect_right(self._keys, (before, '\uffff'))
+        return set(workflow_id for _, workflow_id in self._keys[lo:hi])
+
+
+class WorkflowCatalog:
+    """Local, indexed catalog of workflow summaries, kept up to date from cromwell queries.
+
+    Workflows are indexed by status, name, label (key, value) pairs, backend, and submission,
+    start and end times, so that `select` can answer questions such as "all Failed runs of
+    workflow X with label project=Y in the last week" without querying the server.
+
+    `update` keeps the catalog current incrementally: it retrieves workflows submitted since the
+    last update, and re-checks only workflows that had not yet reached a terminal state.
+    """
+
+    _time_fields = ('submission', 'start', 'end')
+    _ids_per_query = 100  # keeps id-filtered query urls to a reasonable length
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._records = {}
+        self._backends = {}
+        self._by_status = defaultdict(set)
+        self._by_name = defaultdict(set)
+        self._by_label = defaultdict(set)
+        self._by_backend = defaultdict(set)
+        self._by_time = {field: _TimeIndex() for field in self._time_fields}
+        self._last_submission = None  # latest submission datetime string seen by update
+
+    def __repr__(self):
+        return '<WorkflowCatalog: %d workflows>' % len(self)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, workflow_id):
+        return workflow_id in self._records
+
+    def __getitem__(self, workflow_id):
+        return self._records[workflow_id]
+
+    def add(self, record, backend=None):
+        """Add a workflow to the catalog, replacing any previous record for the same id.
+
+        :param WorkflowRecord | dict record: workflow summary, or a cromwell query result
+        :param str backend: (optional) backend the workflow ran on. If not provided, any backend
+          previously recorded for this workflow is kept.
+        """
+        if isinstance(record, dict):
+            record = WorkflowRecord.from_json(record)
+        with self._lock:
+            previous = self._records.get(record.id)
+            if previous is not None:
+                self._unindex(previous)
+            if backend is not None:
+                self._backends[record.id] = backend
+            self._records[record.id] = record
+            self._index(record)
+
+    def _index(self, record):
+        self._by_status[record.status].add(record.id)
+        self._by_name[record.name].add(record.id)
+        for item in (record.labels or {}).items():
+            self._by_label[item].add(record.id)
+        if record.id in self._backends:
+            self._by_backend[self._backends[record.id]].add(record.id)
+        for field in self._time_fields:
+            self._by_time[field].add(record.id, _timestamp(getattr(record, field)))
+
+    def _unindex(self, record):
+        self._by_status[record.status].discard(record.id)
+        self._by_name[record.name].discard(record.id)
+        for item in (record.labels or {}).items():
+            self._by_label[item].discard(record.id)
+        if record.id in self._backends:
+            self._by_backend[self._backends[record.id]].discard(record.id)
+        for field in self._time_fields:
+            self._by_time[field].remove(record.id, _timestamp(getattr(record, field)))
+
+    def backend(self, workflow_id):
+        """Backend recorded for workflow_id, or None if it is not known."""
+        return self._backends.get(workflow_id)
+
+    def update(self, cromwell_server, page_size=1000, backends=False, max_workers=8):
+        """Bring the catalog up to date with cromwell_server.
+
+        The first update retrieves every workflow. Later updates retrieve only workflows submitted
+        since the previous update, plus the current state of workflows that had not finished.
+
+        :param Cromwell cromwell_server: an authenticated cromwell server object
+        :param int page_size: number of workflows to request per query page (default 1000)
+        :param bool backends: if True, look up the backend of workflows whose backend is not yet
+          known, from their metadata (default False)
+        :param int max_workers: maximum number of concurrent metadata requests used to look up
+          backends (default 8)
+        :return int: number of workflows added or changed
+        """
+        with self._lock:
+            unfinished = [i for i, r in self._records.items() if r.status not in TERMINAL_STATUSES]
+            since = self._last_submission
+
+        fields = ['labels']
+        queries = [dict(submission=since)]
+        for i in range(0, len(unfinished), self._ids_per_query):
+            queries.append(dict(ids=unfinished[i:i + self._ids_per_query]))
+
+        changed = 0
+        for query in queries:
+            for record in cromwell_server.iter_query(
+                    page_size=page_size, additional_fields=fields, **query):
+                with self._lock:
+                    if self._records.get(record.id) != record:
+                        self.add(record)
+                        changed += 1
+                    if record.submission is not None and (
+                            self._last_submission is None or
+                            _timestamp(record.submission) > _timestamp(self._last_submission)):
+                        self._last_submission = record.submission
+
+        if backends:
+            missing = [i for i in self._records if i not in self._backends]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for workflow_id, backend in zip(missing, executor.map(
+                        lambda i: self._lookup_backend(cromwell_server, i), missing)):
+                    if backend is not None:
+                        self.add(self._records[workflow_id], backend=backend)
+        return changed
+
+    @staticmethod
+    def _lookup_backend(cromwell_server, workflow_id):
+        """Find the backend of the first call of workflow_id, or None if it has no calls."""
+        response = cromwell_server.metadata(workflow_id, include_keys=['backend'])
+        if response.status_code != 200:
+            return None
+        for shards in response.json().get('calls', {}).values():
+            for shard in shards:
+                if 'backend' in shard:
+                    return shard['backend']
+        return None
+
+    def select(self, status=None, name=None, labels=None, backend=None, submitted_after=None,
+               submitted_before=None, started_after=None, started_before=None,
+               ended_after=None, ended_before=None):
+        """Select workflows from the catalog. All provided criteria must match.
+
+        :param str | Iterable status: (optional) status, or statuses, to match
+        :param str | Iterable name: (optional) workflow name, or names, to match
+        :param dict labels: (optional) label key:value pairs, all of which must match
+        :param str | Iterable backend: (optional) backend, or backends, to match
+        :param submitted_after: (optional) earliest submission time, as a cromwell datetime
+          string, datetime, or seconds since the epoch. The other time criteria are specified in
+          the same way.
+        :param submitted_before: (optional) latest submission time
+        :param started_after: (optional) earliest start time
+        :param started_before: (optional) latest start time
+        :param ended_after: (optional) earliest end time
+        :param ended_before: (optional) latest end time
+        :return list: matching WorkflowRecords, ordered by submission time, then id
+        """
+        def union(index, keys):
+            keys = [keys] if isinstance(keys, str) else keys
+            return set().union(*(index.get(k, ()) for k in keys))
+
+        with self._lock:
+            candidates = []
+            if status is not None:
+                candidates.append(union(self._by_status, status))
+            if name is not None:
+                candidates.append(union(self._by_name, name))
+            if backend is not None:
+                candidates.append(union(self._by_backend, backend))
+            for item in (labels or {}).items():
+                candidates.append(self._by_label.get(item, set()))
+            for field, after, before in (('submission', submitted_after, submitted_before),
+                                         ('start', started_after, started_before),
+                                         ('end', ended_after, ended_before)):
+                if after is not None or before is not None:
+                    candidates.append(self._by_time[field].between(
+                        _timestamp(after), _timestamp(before)))
+
+            if candidates:
+                candidates.sort(key=len)
+                ids = candidates[0].intersection(*candidates[1:])
+            else:
+                ids = self._records.keys()
+            records = [self._records[i] for i in ids]
+
+        return sorted(records, key=lambda r: (_timestamp(r.submission) or 0, r.id))
@@ -1,23 +1,175 @@
 import re
 import json
 import webbrowser
-from time import sleep
+from time import sleep, monotonic
+from collections import namedtuple, OrderedDict
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from itertools import repeat
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from .io_util import load_bytes
+from .resilience import RetryPolicy, CircuitBreaker, parse_retry_after
+from .ratelimit import RateLimiter
+from .metrics import MetricsRegistry
+from .submission import SubmissionBundle, load_dependencies
+
+# statuses after which a workflow, and its metadata, no longer change
+TERMINAL_STATUSES = frozenset(('Succeeded', 'Failed', 'Aborted'))
+
+
+def _query_tags(start=None, end=None, names=None, ids=None, status=None, labels=None, page=None,
+                page_size=None, submission=None, additional_fields=None):
+    """Build the list of key=value tags for a cromwell query url.
+
+    See `Cromwell.query` for a description of the parameters.
+
+    :return list: query tags, to be joined with '&'
+    """
+    tags = []
+    if start and isinstance(start, str):
+        tags.append('start={}'.format(start))
+    if end and isinstance(end, str):
+        tags.append('end={}'.format(end))
+    if names and isinstance(names, Iterable):
+        tags.extend(('name={}'.format(n) for n in names))
+    if ids and isinstance(ids, Iterable):
+        tags.extend(('id={}'.format(i) for i in ids))
+    if status and isinstance(status, Iterable):
+        tags.extend(('status={}'.format(s) for s in status))
+    if labels and isinstance(labels, dict):
+        tags.extend(('{k}={v}'.format(k=k, v=v) for k, v in labels.items()))
+    if submission and isinstance(submission, str):
+        tags.append('submission={}'.format(submission))
+    if additional_fields and isinstance(additional_fields, Iterable):
+        tags.extend(('additionalQueryResultFields={}'.format(f) for f in additional_fields))
+    if page is not None:
+        tags.append('page={:d}'.format(page))
+    if page_size is not None:
+        tags.append('pageSize={:d}'.format(page_size))
+    return tags
+
+
+def _metadata_tags(include_keys=None, exclude_keys=None, expand_subworkflows=False):
+    """Build the list of key=value tags for a cromwell metadata url.
+
+    See `Cromwell.metadata` for a description of the parameters.
+
+    :return list: metadata tags, to be joined with '&'
+    """
+    if include_keys and exclude_keys:
+        raise ValueError('cromwell does not accept include_keys and exclude_keys together.')
+    tags = []
+    if include_keys:
+        tags.extend('includeKey={}'.format(k) for k in include_keys)
+    if exclude_keys:
+        tags.extend('excludeKey={}'.format(k) for k in exclude_keys)
+    if expand_subworkflows:
+        tags.append('expandSubWorkflows=true')
+    return tags
+
+
+def _include_keys(value, include_keys):
+    """Keep only the include_keys of a metadata document, at every level, as cromwell does.
+
+    :param value: metadata document, or part of one
+    :param set include_keys: metadata keys to keep, with everything nested beneath them
+    :return: the projected value, or None if no key within it matched
+    """
+    if isinstance(value, dict):
+        projected = {}
+        for key, item in value.items():
+            item = item if key in include_keys else _include_keys(item, include_keys)
+            if item is not None:
+                projected[key] = item
+        return projected or None
+    if isinstance(value, list):
+        projected = [p for p in (_include_keys(item, include_keys) for item in value)
+                     if p is not None]
+        return projected or None
+    return None
+
+
+def _reason(response):
+    """Describe a failed response, even if the server sent no reason phrase."""
+    return response.reason or 'HTTP status %d' % response.status_code
+
+
+class BatchResult(namedtuple('BatchResult', ['index', 'workflow_id', 'status_code', 'error'])):
+    """Outcome of submitting a single item of a `Cromwell.batch` call.
+
+    :ivar int index: position of the item in the submitted iterable
+    :ivar str | None workflow_id: id assigned by cromwell, None if submission failed
+    :ivar int | None status_code: http status of the submission request, None if no request was
+      made
+    :ivar str | None error: description of the failure, None if submission succeeded
+    """
+    __slots__ = ()
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+class WorkflowRecord(namedtuple(
+        'WorkflowRecord', ['id', 'name', 'status', 'submission', 'start', 'end', 'labels'])):
+    """Lightweight summary of a workflow, as returned by a cromwell query.
+
+    Fields that cromwell did not report (e.g. `end` for a running workflow, or `labels` unless
+    they were requested as an additional field) are None.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, record):
+        """Create a WorkflowRecord from one element of a query response's results.
+
+        :param dict record: query result
+        :return WorkflowRecord: workflow summary
+        """
+        return cls(*(record.get(field) for field in cls._fields))
 
 
 class Cromwell:
     """Wrapper for the Cromwell REST API"""
 
-    def __init__(self, cromwell_url, username=None, password=None, api_version='v1'):
+    def __init__(self, cromwell_url, username=None, password=None, api_version='v1',
+                 pool_connections=10, pool_maxsize=10, pool_block=False, metadata_store=None,
+                 catalog=None, retry_policy=None, circuit_breaker=None, rate_limiter=None,
+                 metrics=None):
         """API wrapper for a running cromwell server
 
+        Requests are made through a pooled, keep-alive session, so repeated status polls and
+        metadata fetches re-use open connections instead of paying for a new TCP/TLS handshake
+        each time. Call `close()` (or use the server as a context manager) to release them.
+
+        Failed requests are retried according to `retry_policy`, and, if a `circuit_breaker` is
+        provided, requests fail fast with CircuitOpenError while the server keeps failing. A
+        `rate_limiter` keeps the request rate and concurrency within a budget. If a `metrics`
+        registry is provided, the count, latency, response size, errors and retries of requests
+        are recorded in it, per endpoint.
+
         :param str cromwell_url: url of a running cromwell instance
         :param str | None username: (optional) username for the cromwell instance
         :param str | None password: (optional) password for the cromwell instance
         :param str api_version: version of the cromwell API
+        :param int pool_connections: number of per-host connection pools to cache (default 10)
+        :param int pool_maxsize: maximum number of connections kept open to each host
+          (default 10)
+        :param bool pool_block: if True, block when all connections to a host are in use rather
+          than opening a throwaway connection (default False)
+        :param MetadataStore metadata_store: (optional) on-disk store consulted by `metadata`
+          before querying the server, and filled with the metadata of finished workflows
+        :param WorkflowCatalog catalog: (optional) local index of workflow summaries used by
+          `filter`. Created on first use if not provided.
+        :param RetryPolicy retry_policy: (optional) retry, backoff and timeout settings. Defaults
+          to RetryPolicy(); pass RetryPolicy(max_attempts=1) to disable retries.
+        :param CircuitBreaker circuit_breaker: (optional) breaker shared by every request made
+          by this server object
+        :param RateLimiter rate_limiter: (optional) request rate and concurrency limits shared by
+          every request made by this server object
+        :param MetricsRegistry metrics: (optional) registry in which requests are recorded
         """
 
         if isinstance(cromwell_url, str):
@@ -40,7 +192,34 @@ class Cromwell:
         else:
             raise ValueError('version must be a str, not %s' % type(api_version))
 
+        for name, value in (('pool_connections', pool_connections),
+                            ('pool_maxsize', pool_maxsize)):
+            if not isinstance(value, int) or value < 1:
+                raise ValueError('%s must be a positive int, not %r' % (name, value))
+
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        elif not isinstance(retry_policy, RetryPolicy):
+            raise TypeError('If provided, retry_policy must be a RetryPolicy, not %s'
+                            % type(retry_policy))
+        if not (circuit_breaker is None or isinstance(circuit_breaker, CircuitBreaker)):
+            raise TypeError('If provided, circuit_breaker must be a CircuitBreaker, not %s'
+                            % type(circuit_breaker))
+        if not (rate_limiter is None or isinstance(rate_limiter, RateLimiter)):
+            raise TypeError('If provided, rate_limiter must be a RateLimiter, not %s'
+                            % type(rate_limiter))
+        if not (metrics is None or isinstance(metrics, MetricsRegistry)):
+            raise TypeError('If provided, metrics must be a MetricsRegistry, not %s'
+                            % type(metrics))
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+
         self.auth = HTTPBasicAuth(username, password) if username and password else None
+        self.session = self._create_session(pool_connections, pool_maxsize, pool_block)
+        self.metadata_store = metadata_store
+        self.catalog = catalog
         self.url_prefix = '{cromwell_url}/api/workflows/{version}'.format(
             cromwell_url=self.cromwell_url, version=self.api_version)
 
@@ -52,6 +231,32 @@ class Cromwell:
     def __repr__(self):
         return '<Cromwell Server: ip: %s>' % self.cromwell_url
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _create_session(self, pool_connections, pool_maxsize, pool_block):
+        """Create a keep-alive session whose connection pool is shared by every request.
+
+        :param int pool_connections: number of per-host connection pools to cache
+        :param int pool_maxsize: maximum number of connections kept open to each host
+        :param bool pool_block: if True, block when the pool for a host is exhausted
+        :return requests.Session: pooled session
+        """
+        session = requests.Session()
+        session.auth = self.auth
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def close(self):
+        """Close all pooled connections held by this server object."""
+        self.session.close()
+
     @property
     def cromwell_url(self):
         """URL for the cromwell REST endpoints."""
@@ -136,33 +341,123 @@ class Cromwell:
         self.print_failure(response, message)
         return response
 
-    def post(self, url, verbose=False, *args, **kwargs):
+    @staticmethod
+    def _rewind(files):
+        """Seek file objects in a files dictionary back to their start, before a retry."""
+        for value in (files or {}).values():
+            if hasattr(value, 'seek'):
+                value.seek(0)
+
+    def _request(self, method, url, endpoint=None, idempotent=True, **kwargs):
+        """Make a REST query to url, retrying failures according to this server's retry_policy.
+
+        If this server has a rate_limiter, each attempt waits for its permission, and if it has a
+        metrics registry, each attempt is recorded in it.
+
+        :param str method: {GET, POST} type of REST operation
+        :param str url: query url
+        :param str endpoint: (optional) endpoint name, used to look up the request's timeout and
+          to label its metrics
+        :param bool idempotent: whether the request can safely be repeated (default True)
+        :param kwargs: additional keyword args to pass to requests.Session.request
+        :return requests.Response: requests response object
+        """
+        policy, breaker, limiter = self.retry_policy, self.circuit_breaker, self.rate_limiter
+        metrics = self.metrics
+        kwargs.setdefault('timeout', policy.timeout(endpoint))
+
+        def record(started, response=None, error=None):
+            latency = monotonic() - started
+            status_code = None if response is None else response.status_code
+            if breaker is not None:
+                breaker.record(status_code)
+            if limiter is not None:
+                limiter.after_request(latency, status_code)
+            if metrics is not None:
+                if response is None:
+                    size = None
+                elif kwargs.get('stream'):  # body not read yet
+                    size = response.headers.get('Content-Length')
+                    size = int(size) if size is not None else None
+                else:
+                    size = len(response.content)
+                metrics.observe(endpoint, method, url, status_code, latency, size, attempt,
+                                None if error is None else type(error).__name__)
+
+        attempt = 0
+        while True:
+            # wait for the limiter before consulting the breaker, so that an interrupted wait
+            # cannot leave the trial request of a half-open circuit claimed forever
+            if limiter is not None:
+                limiter.before_request(endpoint)
+            trial = recorded = False
+            try:
+                if breaker is not None:
+                    trial = breaker.before_request()
+                attempt += 1
+                started = monotonic()
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except Exception as e:
+                    recorded = True
+                    record(started, error=e)
+                    if not (isinstance(e, (requests.ConnectionError, requests.Timeout))
+                            and policy.should_retry(attempt, idempotent=idempotent)):
+                        raise
+                    delay = policy.delay(attempt)
+                else:
+                    recorded = True
+                    record(started, response)
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    if not policy.should_retry(
+                            attempt, response.status_code, idempotent, retry_after):
+                        return response
+                    delay = policy.delay(attempt, retry_after)
+                    response.close()
+            finally:
+                if not recorded:  # abandoned before it was sent, or interrupted
+                    if breaker is not None:
+                        breaker.cancel(trial)
+                    if limiter is not None:
+                        limiter.cancel()
+            sleep(delay)
+            self._rewind(kwargs.get('files'))
+
+    def post(self, url, verbose=False, endpoint=None, idempotent=False, *args, **kwargs):
         """Make a REST POST query to url.
 
         :param str url: POST query url
 
         :param bool verbose: if True, print the query, response code, and content (default False)
-        :param args: additional arguments to pass to requests.post
-        :param kwargs: additional arguments to pass to requests.post
+        :param str endpoint: (optional) endpoint name, used to look up the request's timeout
+        :param bool idempotent: if True, the request is retried after any retryable failure;
+          otherwise only after a 429 response (default False)
+        :param args: additional arguments to pass to requests.Session.post
+        :param kwargs: additional arguments to pass to requests.Session.post
         :return requests.Response: requests response object
         """
-        response = requests.post(url, auth=self.auth, *args, **kwargs)
+        if args:  # positional arguments of requests.Session.post: data, json
+            kwargs.update(zip(('data', 'json'), args))
+        response = self._request('POST', url, endpoint, idempotent, **kwargs)
         if verbose:
             self.print_request('POST', url, response)
         return response
 
-    def get(self, url, verbose=False, open_browser=False, *args, **kwargs):
+    def get(self, url, verbose=False, open_browser=False, endpoint=None, *args, **kwargs):
         """Make a REST GET query to url.
 
         :param str url: GET query url
 
         :param bool verbose: if True, print the query, response code, and content (default False)
         :param bool open_browser: if True, display the GET result in browser (default False)
-        :param args: additional positional args to pass to requests.get
-        :param kwargs: additional keyword args to pass to request.get
+        :param str endpoint: (optional) endpoint name, used to look up the request's timeout
+        :param args: additional positional args to pass to requests.Session.get
+        :param kwargs: additional keyword args to pass to requests.Session.get
         :return requests.Response: requests response object
         """
-        response = requests.get(url, auth=self.auth, *args, **kwargs)
+        if args:  # positional argument of requests.Session.get: params
+            kwargs['params'] = args[0]
+        response = self._request('GET', url, endpoint, **kwargs)
         if verbose:
             self.print_request('GET', url, response)
         if open_browser:
@@ -175,7 +470,8 @@ class Cromwell:
         :param bool verbose: if True, print the query, response code, and content (default False)
         :param bool open_browser: if True, display the GET result in browser (default False)
         """
-        return True if self.get(self.cromwell_url, *args, **kwargs).status_code == 200 else False
+        response = self.get(self.cromwell_url, endpoint='health', *args, **kwargs)
+        return True if response.status_code == 200 else False
 
     def abort_workflow(self, workflow_id, *args, **kwargs):
         """Abort a workflow.
@@ -188,7 +484,7 @@ class Cromwell:
         :return response.Response: requests response object
         """
         url = self.url_prefix + '/{id}/abort'.format(id=workflow_id)
-        return self.post(url, *args, **kwargs)
+        return self.post(url, endpoint='abort', idempotent=True, *args, **kwargs)
 
     def submit(self, files, wait=True, timeout=15, delay=3, verbose=False, *args, **kwargs):
         """Submit a new workflow.
@@ -203,7 +499,8 @@ class Cromwell:
         :param kwargs: additional keyword args to pass to request.post
         :return response.Response: requests response object
         """
-        submit_response = self.post(self.url_prefix, files=files, *args, **kwargs)
+        submit_response = self.post(
+            self.url_prefix, files=files, endpoint='submit', *args, **kwargs)
         if submit_response.status_code > 201:
             self.print_failure(submit_response, 'Workflow failed to start!')
             return submit_response
@@ -214,8 +511,150 @@ class Cromwell:
                 timeout=timeout, delay=delay, verbose=verbose)
         return submit_response
 
-    def batch(self):
-        raise NotImplementedError
+    def batch(self, submissions, workflow_dependencies=None, storage_client=None, max_workers=8,
+              batch_size=100, use_batch_endpoint=True, verbose=False):
+        """Submit many workflows, without waiting for any of them to start.
+
+        Submissions that share a wdl, options and labels are grouped and sent to cromwell's batch
+        endpoint in chunks of `batch_size`. If the server does not expose a batch endpoint, each
+        workflow is submitted individually. Requests are made from a pool of `max_workers`
+        threads; set `pool_maxsize` on this server to at least `max_workers` to keep all of their
+        connections alive.
+
+        Shared files (wdl, options, labels and the dependency archive) are loaded once per call,
+        regardless of how many submissions reference them. To reuse them across calls, submit
+        (SubmissionBundle, inputs_json) pairs instead.
+
+        :param Iterable submissions: iterable of (wdl, inputs_json, options_json, custom_labels)
+          tuples. options_json and custom_labels may be omitted or None. Each element may be a
+          dictionary or a google storage, http(s), or local path, as in
+          `Workflow.from_submission`, and wdl may be a SubmissionBundle.
+
+        :param str | dict workflow_dependencies: dependencies shared by every submission; a dict
+          of (name, path) pairs or a path to a pre-zipped dependency archive. Bundles that
+          contain dependencies keep their own.
+        :param google.cloud.storage.Client storage_client: (optional) authenticated google storage
+          client, used for google storage paths
+        :param int max_workers: maximum number of concurrent submission requests (default 8)
+        :param int batch_size: maximum number of workflows per batch request (default 100)
+        :param bool use_batch_endpoint: if False, always submit workflows individually
+          (default True)
+        :param bool verbose: if True, print the requests made
+        :return list: BatchResult for each submission, in the order of submissions
+        """
+        submissions = list(submissions)
+        results = [None] * len(submissions)
+        shared = {}
+
+        def load_shared(source):
+            """load a file shared across submissions exactly once, remembering failures."""
+            if source is None:
+                return None
+            key = json.dumps(source, sort_keys=True) if isinstance(source, dict) else source
+            if key not in shared:
+                try:
+                    shared[key] = load_bytes(source, storage_client)
+                except Exception as e:
+                    shared[key] = e
+            if isinstance(shared[key], Exception):
+                raise shared[key]
+            return shared[key]
+
+        # package the dependencies once for every submission
+        dependencies = load_dependencies(workflow_dependencies, storage_client)
+
+        # group submissions that differ only by their inputs; equal bundles share a group
+        groups = OrderedDict()
+        for index, submission in enumerate(submissions):
+            try:
+                if not 2 <= len(submission) <= 4:
+                    raise ValueError('submissions must be (wdl, inputs_json[, options_json[, '
+                                     'custom_labels]]) tuples')
+                wdl, inputs, options, labels = tuple(submission) + (None,) * (4 - len(submission))
+                if wdl is None or inputs is None:
+                    raise ValueError('wdl and inputs_json are required.')
+                if isinstance(wdl, SubmissionBundle):
+                    if options is not None or labels is not None:
+                        raise ValueError('options_json and custom_labels must be provided by the '
+                                         'SubmissionBundle, not passed separately')
+                    bundle = wdl
+                    if bundle.dependencies is None and dependencies is not None:
+                        bundle = bundle._replace(dependencies=dependencies)
+                else:
+                    bundle = SubmissionBundle(
+                        load_shared(wdl), load_shared(options), dependencies, load_shared(labels))
+            except Exception as e:
+                results[index] = BatchResult(index, None, None, repr(e))
+                continue
+            if bundle not in groups:
+                groups[bundle] = (bundle.files(), [])
+            groups[bundle][1].append((index, inputs))
+
+        def submit_one(files, index, inputs):
+            try:
+                files = dict(files, workflowInputs=load_bytes(inputs, storage_client))
+                response = self.post(
+                    self.url_prefix, files=files, endpoint='submit', verbose=verbose)
+            except Exception as e:
+                return [BatchResult(index, None, None, repr(e))]
+            if response.status_code > 201:
+                return [BatchResult(index, None, response.status_code, _reason(response))]
+            return [BatchResult(index, response.json()['id'], response.status_code, None)]
+
+        def submit_chunk(files, chunk):
+            """submit a chunk through the batch endpoint; return None if it is unavailable."""
+            loaded, failed = [], []
+            for index, inputs in chunk:
+                try:
+                    loaded.append((index, json.loads(load_bytes(inputs, storage_client).decode())))
+                except Exception as e:
+                    failed.append(BatchResult(index, None, None, repr(e)))
+            if not loaded:
+                return failed
+            files = dict(files, workflowInputs=json.dumps([i for _, i in loaded]).encode())
+            try:
+                response = self.post(
+                    self.url_prefix + '/batch', files=files, endpoint='batch', verbose=verbose)
+            except Exception as e:
+                return failed + [BatchResult(i, None, None, repr(e)) for i, _ in loaded]
+            if response.status_code in (404, 405):
+                return None
+            if response.status_code > 201:
+                return failed + [BatchResult(i, None, response.status_code, _reason(response))
+                                 for i, _ in loaded]
+            return failed + [BatchResult(i, r['id'], response.status_code, None)
+                             for (i, _), r in zip(loaded, response.json())]
+
+        chunks = [(files, items[i:i + batch_size]) for files, items in groups.values()
+                  for i in range(0, len(items), batch_size)]
+
+        # probe the batch endpoint with the first chunk; fall back if it does not exist
+        individual = []
+        if use_batch_endpoint and chunks:
+            probe = submit_chunk(*chunks[0])
+            if probe is None:
+                individual, chunks = chunks, []
+            else:
+                for result in probe:
+                    results[result.index] = result
+                chunks = chunks[1:]
+        else:
+            individual, chunks = chunks, []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(submit_chunk, files, chunk) for files, chunk in chunks]
+            futures.extend(executor.submit(submit_one, files, index, inputs)
+                           for files, chunk in individual for index, inputs in chunk)
+            for future in futures:
+                for result in future.result() or ():
+                    results[result.index] = result
+
+        # items of a chunk whose batch request was unexpectedly rejected after a successful probe
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = BatchResult(index, None, None, 'batch endpoint unavailable')
+
+        return results
 
     def outputs(self, workflow_id, *args, **kwargs):
         """Retrieve outputs for workflow_id.
@@ -229,10 +668,11 @@ class Cromwell:
         :return response.Response: requests response object
         """
         url = self.url_prefix + '/{id}/outputs'.format(id=workflow_id)
-        return self.get(url, *args, **kwargs)
+        return self.get(url, endpoint='outputs', *args, **kwargs)
 
     # todo add formatting to correct datetime string
-    def query(self, start=None, end=None, names=None, ids=None, status=None, labels=None, *args,
+    def query(self, start=None, end=None, names=None, ids=None, status=None, labels=None,
+              *args, page=None, page_size=None, submission=None, additional_fields=None,
               **kwargs):
         """Query cromwell for workflows matching specified metadata information.
 
@@ -243,30 +683,91 @@ class Cromwell:
         :param list status: list of one or more workflow status(es). Must be a valid status:
           {Submitted, Running, Aborting, Failed, Succeeded, Aborted}
         :param dict labels: dictionary of custom label:value pairs
+        :param int page: (optional) 1-based page of results to return; requires page_size
+        :param int page_size: (optional) number of results per page
+        :param str submission: (optional) only return workflows submitted at or after this
+          datetime string
+        :param list additional_fields: (optional) additional fields to include in each result,
+          e.g. ['labels']
 
         :param bool verbose: if True, print the query, response code, and content (default False)
         :param bool open_browser: if True, display the GET result in browser (default False)
         :return requests.Response:
         """
-        tags = []
-        if start and isinstance(start, str):
-            tags.append('start={}'.format(start))
-        if end and isinstance(end, str):
-            tags.append('end={}'.format(end))
-        if names and isinstance(names, Iterable):
-            tags.extend(('name={}'.format(n) for n in names))
-        if ids and isinstance(ids, Iterable):
-            tags.extend(('id={}'.format(i) for i in ids))
-        if status and isinstance(status, Iterable):
-            tags.extend(('status={}'.format(s) for s in status))
-        if labels and isinstance(labels, dict):
-            tags.extend(('{k}={v}'.format(k=k, v=v) for k, v in labels.items()))
+        tags = _query_tags(start=start, end=end, names=names, ids=ids, status=status,
+                           labels=labels, page=page, page_size=page_size, submission=submission,
+                           additional_fields=additional_fields)
         url = self.url_prefix + '/query?' + '&'.join(tags)
-        return self.get(url, *args, **kwargs)
+        return self.get(url, endpoint='query', *args, **kwargs)
+
+    def iter_query(self, start=None, end=None, names=None, ids=None, status=None, labels=None,
+                   page_size=100, prefetch=True, **kwargs):
+        """Iterate over the workflows matching a query, one page of results at a time.
+
+        Only one page of results is held in memory at once, so arbitrarily large query results can
+        be scanned in constant memory. If prefetch is True, the next page is requested in the
+        background while the current page is being consumed.
 
-    # todo implement a way to filter queries by metadata information
-    def filter(self, **kwargs):
-        raise NotImplementedError
+        See `query` for a description of the filtering parameters.
+
+        :param int page_size: number of results to request per page (default 100)
+        :param bool prefetch: if True, request the next page before yielding the current one
+          (default True)
+        :param kwargs: additional keyword args to pass to query
+        :return Iterator: WorkflowRecord for each matching workflow
+        """
+        if not isinstance(page_size, int) or page_size < 1:
+            raise ValueError('page_size must be a positive int, not %r' % page_size)
+
+        def fetch(page):
+            response = self.query(start=start, end=end, names=names, ids=ids, status=status,
+                                  labels=labels, page=page, page_size=page_size, **kwargs)
+            if response.status_code != 200:
+                self.print_failure(response, 'Query failed on page %d' % page)
+                response.raise_for_status()
+            return response.json()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            page = 1
+            pending = executor.submit(fetch, page)
+            while pending is not None:
+                content = pending.result()
+                results = content.get('results', [])
+                total = content.get('totalResultsCount')
+                more = len(results) == page_size and (total is None or page * page_size < total)
+                page += 1
+                pending = executor.submit(fetch, page) if more and prefetch else None
+                for record in results:
+                    yield WorkflowRecord.from_json(record)
+                if more and not prefetch:
+                    pending = executor.submit(fetch, page)
+
+    def filter(self, update=True, backends=False, **criteria):
+        """Filter workflows by metadata information, using the local workflow catalog.
+
+        The catalog is brought up to date incrementally before filtering (only workflows that are
+        new or unfinished are queried), then the criteria are answered from its indices.
+
+        Example: all Failed runs of workflow X labelled project=Y in the last week::
+
+            cromwell.filter(status='Failed', name='X', labels={'project': 'Y'},
+                            submitted_after=datetime.now(timezone.utc) - timedelta(days=7))
+
+        :param bool update: if True, update the catalog from the server before filtering
+          (default True)
+        :param bool backends: if True, look up the backend of newly cataloged workflows, which
+          requires a metadata request per workflow (default False)
+        :param criteria: criteria to pass to WorkflowCatalog.select: status, name, labels,
+          backend, submitted_after, submitted_before, started_after, started_before, ended_after,
+          ended_before
+        :return list: matching WorkflowRecords, ordered by submission time
+        """
+        if self.catalog is None:
+            from .catalog import WorkflowCatalog  # catalog depends on this module
+            self.catalog = WorkflowCatalog()
+        if update:
+            self.catalog.update(self, backends=backends)
+        return self.catalog.select(**criteria)
 
     def status(self, workflow_id, *args, **kwargs):
         """Retrieve status for workflow_id.
@@ -280,7 +781,7 @@ class Cromwell:
         :return response.Response: requests response object
         """
         url = self.url_prefix + '/{id}/status'.format(id=workflow_id)
-        return self.get(url, *args, **kwargs)
+        return self.get(url, endpoint='status', *args, **kwargs)
 
     def logs(self, workflow_id, *args, **kwargs):
         """Retrieve logs for workflow_id.
@@ -294,22 +795,69 @@ class Cromwell:
         :return response.Response: requests response object
         """
         url = self.url_prefix + '/{id}/logs'.format(id=workflow_id)
-        return self.get(url, *args, **kwargs)
+        return self.get(url, endpoint='logs', *args, **kwargs)
 
-    # todo adjust to use the includeKey and excludeKey parameters; will make things way faster!
-    def metadata(self, workflow_id, *args, **kwargs):
+    def metadata(self, workflow_id, *args, include_keys=None, exclude_keys=None,
+                 expand_subworkflows=False, **kwargs):
         """Retrieve metadata for workflow_id.
 
+        Metadata for large, scattered workflows can be many megabytes; use include_keys or
+        exclude_keys to retrieve only the fields that are needed. Cromwell matches keys at every
+        level of the document (e.g. 'executionStatus' selects that field within each call).
+
+        If this server has a metadata_store, it is consulted first, and complete metadata
+        documents of finished workflows are saved to it. include_keys are applied to stored
+        documents at every level, as cromwell applies them.
+
         :param str workflow_id: hash for workflow to abort
 
+        :param Iterable include_keys: (optional) only retrieve these metadata keys
+        :param Iterable exclude_keys: (optional) retrieve all metadata keys except these
+        :param bool expand_subworkflows: if True, embed the metadata of each subworkflow in the
+          call that launched it, retrieving the whole workflow tree in one request (default False)
         :param bool verbose: if True, print the query, response code, and content (default False)
         :param bool open_browser: if True, display the GET result in browser (default False)
         :param args: additional positional args to pass to requests.get
         :param kwargs: additional keyword args to pass to request.get
         :return response.Response: requests response object
         """
+        tags = _metadata_tags(include_keys, exclude_keys, expand_subworkflows)
         url = self.url_prefix + '/{id}/metadata'.format(id=workflow_id)
-        return self.get(url, *args, **kwargs)
+        if tags:
+            url += '?' + '&'.join(tags)
+
+        if self.metadata_store is None or exclude_keys:
+            return self.get(url, endpoint='metadata', *args, **kwargs)
+
+        stored = self.metadata_store.get(workflow_id, expanded=expand_subworkflows)
+        if stored is not None:
+            if include_keys:
+                projected = _include_keys(stored, set(include_keys)) or {}
+                if 'id' in stored:
+                    projected['id'] = stored['id']
+                stored = projected
+            return self._stored_response(url, stored)
+
+        response = self.get(url, endpoint='metadata', *args, **kwargs)
+        if response.status_code == 200 and not include_keys:
+            self.metadata_store.put(workflow_id, response.json(), expanded=expand_subworkflows)
+        return response
+
+    @staticmethod
+    def _stored_response(url, content):
+        """Wrap locally stored content in a response, as if it were returned by the server.
+
+        :param str url: url that would have been queried
+        :param dict content: json content of the response
+        :return requests.Response: response with status 200
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = url
+        response.encoding = 'utf-8'
+        response._content = json.dumps(content).encode()
+        return response
 
     def backends(self, *args, **kwargs):
         """Retrieve backends for this cromwell instance.
@@ -320,7 +868,7 @@ class Cromwell:
         :param kwargs: additional keyword args to pass to request.get
         :return response.Response: requests response object
         """
-        return self.get(self.url_prefix + '/backends', *args, **kwargs)
+        return self.get(self.url_prefix + '/backends', endpoint='backends', *args, **kwargs)
 
     def timing(self, workflow_id):
         """Open timing in browser window for workflow_id.
@@ -340,7 +888,7 @@ class Cromwell:
         """
         url = '{cromwell_url}/engine/{version}/version'.format(
             cromwell_url=self.cromwell_url, version=self.api_version)
-        return self.get(url, *args, **kwargs)
+        return self.get(url, endpoint='version', *args, **kwargs)
 
     def stats(self, *args, **kwargs):
         """Retrieve cromwell statistics on number of running jobs
@@ -353,4 +901,4 @@ class Cromwell:
         """
         url = '{cromwell_url}/engine/{version}/stats'.format(
             cromwell_url=self.cromwell_url, version=self.api_version)
-        return self.get(url, *args, **kwargs)
+        return self.get(url, endpoint='stats', *args, **kwargs)
@@ -0,0 +1,233 @@
+import os
+import csv
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .calledtask import CalledTask
+from .resource_utilization import ResourceUtilization
+
+# columns of every exported row. Rows describe either one shard (level 'shard') or the maximum
+# utilization over all shards of a task (level 'task', shard_index None).
+columns = (
+    'workflow_id', 'subworkflow_path', 'subworkflow_id', 'task', 'level', 'shard_index',
+    'max_memory', 'total_memory', 'max_disk', 'total_disk', 'fraction_memory_used',
+    'fraction_disk_used', 'robust') + ResourceUtilization.activity_fields
+
+_extensions = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.json': 'jsonl',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+}
+
+
+def _iter_called_tasks(workflow, path=()):
+    """Walk a workflow tree depth first.
+
+    :param WorkflowBase workflow: root of the tree
+    :param tuple path: calls leading from the root to workflow, as 'call[index]' strings
+    :return Iterator: (path, workflow, CalledTask) for each task in the tree
+    """
+    for name, task in workflow.tasks.items():
+        if isinstance(task, CalledTask):
+            yield path, workflow, task
+        else:  # list of SubWorkflows
+            for i, subworkflow in enumerate(task):
+                yield from _iter_called_tasks(subworkflow, path + ('%s[%d]' % (name, i),))
+
+
+def _read(shard):
+    """Resource utilization of shard, downloading it without caching if not already fetched."""
+    if shard.has_resource_utilization:
+        return shard.resource_utilization
+    return shard.read_resource_utilization()
+
+
+def _row(context, level, shard_index, utilization):
+    row = dict(context, level=level, shard_index=shard_index)
+    for name in columns[6:]:
+        row[name] = None if utilization is None else getattr(utilization, name)
+    return row
+
+
+def iter_resource_utilization(workflow, max_workers=16, shards=True, tasks=True):
+    """Stream resource utilization rows for every shard and task in a workflow tree.
+
+    The tree's metadata is resolved with `build_tree`, then monitoring logs are downloaded by up
+    to `max_workers` threads. At most a small multiple of `max_workers` logs are downloaded ahead
+    of the row being yielded, and parsed logs are not cached on their shards, so memory use does
+    not grow with the size of the tree. Rows are yielded in tree order: the shards of each task,
+    followed by that task's row.
+
+    :param WorkflowBase workflow: root of the workflow tree
+    :param int max_workers: maximum number of concurrent downloads (default 16)
+    :param bool shards: if True, yield a row for each shard (default True)
+    :param bool tasks: if True, yield a row for each task (default True)
+    :return Iterator: dictionaries with the keys of `columns`
+    """
+    workflow.build_tree(max_workers=max_workers)
+    window = 4 * max_workers
+    pending = deque()  # (context, shard index, future), or (context, None, None) to end a task
+
+    def complete(context, shard_index, future):
+        if future is None:
+            if tasks:
+                yield _row(context['row'], 'task', None, context['utilization'])
+            return
+        utilization = future.result()
+        if utilization is not None:
+            context['utilization'] = ResourceUtilization.merge(
+                utilization, context['utilization'])
+        if shards:
+            yield _row(context['row'], 'shard', shard_index, utilization)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for path, subworkflow, task in _iter_called_tasks(workflow):
+            context = {
+                'row': {
+                    'workflow_id': workflow.id,
+                    'subworkflow_path': '/'.join(path),
+                    'subworkflow_id': subworkflow.id if path else None,
+                    'task': task.name,
+                },
+                'utilization': None,  # running maximum over the task's shards
+            }
+            for shard in task.shards:
+                pending.append((context, shard.index, executor.submit(_read, shard)))
+                while len(pending) > window:
+                    yield from complete(*pending.popleft())
+            pending.append((context, None, None))
+        while pending:
+            yield from complete(*pending.popleft())
+
+
+def write_csv(rows, file_object):
+    """Write rows to an open text file as CSV, with a header line.
+
+    :param Iterable rows: dictionaries with the keys of `columns`
+    :param file file_object: open, writable text file
+    :return int: number of rows written
+    """
+    writer = csv.DictWriter(file_object, fieldnames=columns)
+    writer.writeheader()
+    n = 0
+    for row in rows:
+        writer.writerow(row)
+        n += 1
+    return n
+
+
+def write_jsonl(rows, file_object):
+    """Write rows to an open text file as JSON Lines, one object per line.
+
+    :param Iterable rows: dictionaries with the keys of `columns`
+    :param file file_object: open, writable text file
+    :return int: number of rows written
+    """
+    n = 0
+    for row in rows:
+        file_object.write(json.dumps(row) + '\n')
+        n += 1
+    return n
+
+
+def _arrow_schema():
+    import pyarrow as pa
+    fields = [(name, pa.string()) for name in columns[:5]]
+    fields.append(('shard_index', pa.int64()))
+    fields.extend((name, pa.float64()) for name in columns[6:12])
+    fields.append(('robust', pa.bool_()))
+    fields.extend((name, pa.float64()) for name in columns[13:])
+    return pa.schema(fields)
+
+
+def _write_batches(rows, writer, schema, batch_size):
+    import pyarrow as pa
+    n = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+            n += len(batch)
+            batch = []
+    if batch:
+        writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+        n += len(batch)
+    return n
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError('parquet and arrow exports require pyarrow, which can be installed with '
+                          '"pip install cromwell_manager[parquet]"')
+
+
+def write_parquet(rows, destination, batch_size=10000):
+    """Write rows to a Parquet file, one row group per batch_size rows.
+
+    :param Iterable rows: dictionaries with the keys of `columns`
+    :param str | file destination: path, or open binary file
+    :param int batch_size: number of rows buffered before they are written (default 10000)
+    :return int: number of rows written
+    """
+    _import_pyarrow()
+    import pyarrow.parquet as pq
+    schema = _arrow_schema()
+    with pq.ParquetWriter(destination, schema) as writer:
+        return _write_batches(rows, writer, schema, batch_size)
+
+
+def write_arrow(rows, destination, batch_size=10000):
+    """Write rows to an Arrow IPC (Feather v2) file, one record batch per batch_size rows.
+
+    :param Iterable rows: dictionaries with the keys of `columns`
+    :param str | file destination: path, or open binary file
+    :param int batch_size: number of rows buffered before they are written (default 10000)
+    :return int: number of rows written
+    """
+    _import_pyarrow()
+    import pyarrow as pa
+    schema = _arrow_schema()
+    with pa.ipc.new_file(destination, schema) as writer:
+        return _write_batches(rows, writer, schema, batch_size)
+
+
+_writers = {'csv': write_csv, 'jsonl': write_jsonl, 'parquet': write_parquet,
+            'arrow': write_arrow}
+
+
+def export_resource_utilization(workflow, destination, format=None, max_workers=16, shards=True,
+                                tasks=True):
+    """Export the resource utilization of a workflow tree, writing rows as they are retrieved.
+
+    :param WorkflowBase workflow: root of the workflow tree
+    :param str | file destination: path, or open file (text for csv and jsonl, binary for
+      parquet and arrow)
+    :param str format: (optional) one of csv, jsonl, parquet or arrow. Inferred from the
+      extension of destination if not provided.
+    :param int max_workers: maximum number of concurrent downloads (default 16)
+    :param bool shards: if True, write a row for each shard (default True)
+    :param bool tasks: if True, write a row for each task (default True)
+    :return int: number of rows written
+    """
+    if format is None:
+        if not isinstance(destination, str):
+            raise ValueError('format must be provided when destination is not a path')
+        format = _extensions.get(os.path.splitext(destination)[1].lower())
+        if format is None:
+            raise ValueError('cannot infer the format of %s, please provide format' % destination)
+    if format not in _writers:
+        raise ValueError('format must be one of %s, not %r' % (', '.join(sorted(_writers)), format))
+
+    rows = iter_resource_utilization(workflow, max_workers=max_workers, shards=shards, tasks=tasks)
+    if format in ('parquet', 'arrow') or not isinstance(destination, str):
+        return _writers[format](rows, destination)
+    with open(destination, 'w', newline='') as f:
+        return _writers[format](rows, f)
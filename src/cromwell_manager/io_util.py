@@ -1,7 +1,13 @@
 import os
+import json
 import sys
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from io import BytesIO, BufferedIOBase
-from tempfile import NamedTemporaryFile
 import zipfile
 import datetime
 from google.cloud import storage
@@ -9,14 +15,224 @@ import webbrowser
 import requests
 
 
+class ObjectCache:
+    """Content-addressed, size-bounded local cache of downloaded objects.
+
+    Objects are stored as files named by the SHA-256 of their key, e.g. the md5 checksum of a
+    google storage blob, so the same content is stored once however many paths refer to it. Files
+    are written to a temporary name and moved into place with `os.replace`, so processes sharing
+    a cache directory never read a partial object. Reading an object marks it as recently used;
+    when the cache grows beyond `max_bytes`, the least recently used objects are deleted.
+
+    GSObject and HTTPObject read through the default cache (see `default_cache`) unless they are
+    created with cache=False.
+    """
+
+    def __init__(self, directory=None, max_bytes=2 ** 30):
+        """
+        :param str directory: (optional) directory in which to store objects. Defaults to
+          ~/.cache/cromwell_manager/objects
+        :param int max_bytes: maximum total size of stored objects (default 1 GiB)
+        """
+        if directory is None:
+            directory = os.path.join(
+                os.path.expanduser('~'), '.cache', 'cromwell_manager', 'objects')
+        if not isinstance(max_bytes, int) or max_bytes < 1:
+            raise ValueError('max_bytes must be a positive int, not %r' % max_bytes)
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None  # estimated total size, re-measured when it exceeds max_bytes
+
+    def __repr__(self):
+        return '<ObjectCache: %s>' % self.directory
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def __len__(self):
+        return sum(1 for _ in self._entries())
+
+    @staticmethod
+    def key(*parts):
+        """Build a cache key from strings identifying an object's content.
+
+        :param parts: e.g. ('md5', checksum) or ('gs', bucket, path, generation)
+        :return str: cache key
+        """
+        return hashlib.sha256('\0'.join(str(p) for p in parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _entries(self):
+        """Yield (path, size, last use time) for every stored object."""
+        for prefix in os.scandir(self.directory):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.startswith('.'):  # partially written
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # evicted by another process
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    @property
+    def size(self):
+        """Total size of stored objects, in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def open(self, key):
+        """Open a stored object for reading, marking it as recently used.
+
+        :param str key: cache key
+        :return BufferedIOBase | None: open binary file, or None if key is not stored
+        """
+        path = self._path(key)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # evicted after opening; the open file remains readable
+            pass
+        return f
+
+    def get(self, key):
+        """Read a stored object, marking it as recently used.
+
+        :param str key: cache key
+        :return bytes | None: object contents, or None if key is not stored
+        """
+        f = self.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def put(self, key, data):
+        """Store an object.
+
+        :param str key: cache key
+        :param bytes data: object contents
+        """
+        with self.writer(key) as f:
+            f.write(data)
+
+    @contextmanager
+    def writer(self, key):
+        """Context manager returning a binary file to which an object can be written in pieces.
+
+        The object is stored only if the block completes without an exception.
+
+        :param str key: cache key
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                yield f
+                size = f.tell()
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self._added(size)
+
+    def _added(self, size):
+        with self._lock:
+            if self._size is None:
+                self._size = self.size
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._size = self._evict()
+
+    def _evict(self):
+        """Delete least recently used objects until the cache fits in max_bytes.
+
+        :return int: total size of the remaining objects
+        """
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:  # evicted by another process
+                pass
+            total -= size
+        return total
+
+    def discard(self, key):
+        """Remove a stored object, if present.
+
+        :param str key: cache key
+        """
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """Remove all stored objects."""
+        for path, _, _ in list(self._entries()):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = 0
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """Return the ObjectCache shared by GSObjects and HTTPObjects created with cache=True.
+
+    :return ObjectCache: cache in ~/.cache/cromwell_manager/objects
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ObjectCache()
+        return _default_cache
+
+
+def _resolve_cache(cache):
+    """Return the ObjectCache selected by a cache argument, or None if caching is disabled."""
+    if cache is True:
+        return default_cache()
+    elif cache is False or cache is None:
+        return None
+    elif isinstance(cache, ObjectCache):
+        return cache
+    raise TypeError('cache must be a bool or an ObjectCache, not %s' % type(cache))
+
+
 class GSObject:
 
-    def __init__(self, gs_filestring, client=None):
+    def __init__(self, gs_filestring, client=None, cache=True):
         """Object for downloading google storage blobs.
 
+        Blob metadata is retrieved when it is first needed. Downloads read through an
+        ObjectCache, keyed by the blob's md5 checksum (or its generation, for composite objects
+        without one), so each download first costs only a metadata request, and the content is
+        transferred only if it has not been downloaded before.
+
         :param str gs_filestring: google storage url for file to be downloaded
         :param google.cloud.storage.Client | None client: (optional) authenticated google storage
           client
+        :param bool | ObjectCache cache: (optional) cache to read through. True (default) uses
+          `default_cache()`, False disables caching.
         """
 
         # get client
@@ -27,15 +243,25 @@ class GSObject:
         else:
             raise TypeError('client must be a google.cloud.storage.Client object or None, not %s'
                             % type(client))
+        self.cache = _resolve_cache(cache)
 
         # get bucket, blob from filestring
         if isinstance(gs_filestring, str) and gs_filestring.startswith('gs://'):
             bucket, blob = self.split_path(gs_filestring)
             self.bucket = self.client.bucket(bucket)
-            self.blob = self.bucket.get_blob(blob)
+            self.blob_name = blob
+            self._blob = None
+            self._blob_loaded = False
         else:
             raise TypeError('gs_filestring must be a string that startswith "gs://"')
 
+    @property
+    def blob(self):
+        """The google storage blob, with its metadata, or None if it does not exist."""
+        if not self._blob_loaded:
+            self.reload()
+        return self._blob
+
     @staticmethod
     def split_path(path):
         """Utility to split a google storage path into bucket + key.
@@ -50,12 +276,44 @@ class GSObject:
 
         return bucket, '/'.join(blob)
 
+    def reload(self):
+        """Retrieve the current metadata of the blob, e.g. its size after it has been rewritten
+
+        :return bool: True if the blob exists
+        """
+        self._blob = self.bucket.get_blob(self.blob_name)
+        self._blob_loaded = True
+        return self._blob is not None
+
+    def _cache_key(self):
+        """Key identifying the current content of the blob, or None if caching is disabled."""
+        if self.cache is None or self.blob is None:
+            return None
+        if self.blob.md5_hash:
+            return self.cache.key('md5', self.blob.md5_hash)
+        return self.cache.key('gs', self.bucket.name, self.blob_name, self.blob.generation)
+
+    def download_as_bytes(self):
+        """Download data as bytes
+
+        :return bytes: downloaded blob data
+        """
+        key = self._cache_key()
+        if key is not None:
+            data = self.cache.get(key)
+            if data is not None:
+                return data
+        data = self.blob.download_as_string()
+        if key is not None:
+            self.cache.put(key, data)
+        return data
+
     def download_as_string(self):
         """Download data as a string
 
         :return str: downloaded blob data
         """
-        return self.blob.download_as_string().decode()
+        return self.download_as_bytes().decode()
 
     def download_to_file(self, file_object):
         """Download data to file
@@ -64,86 +322,234 @@ class GSObject:
         """
         if not isinstance(file_object, BufferedIOBase):
             raise TypeError('file_object must be an open, writable file object')
-        self.blob.download_to_file(file_object)
+        file_object.write(self.download_as_bytes())
 
     def download_to_bytes_readable(self):
         """Return a bytes file-like object readable by requests and REST APIs
 
         :return BufferedIOBase: readable file object
         """
-        string_buffer = BytesIO()
-        self.blob.download_to_file(string_buffer)
-        string_buffer.seek(0)
-        return string_buffer
+        return BytesIO(self.download_as_bytes())
+
+    def iter_chunks(self, chunk_size=2 ** 20, start=0):
+        """Download data in chunks, with one ranged request per chunk
+
+        Only one chunk is held in memory at a time, so large blobs (e.g. monitoring logs of
+        long-running tasks) can be processed incrementally. Passing the number of bytes already
+        read as start downloads only what has been appended since; call `reload` first to see the
+        blob's current size.
+
+        Complete reads (start=0) go through the cache: cached blobs are read from disk, and
+        others are written to the cache as they are downloaded.
+
+        :param int chunk_size: maximum number of bytes per chunk (default 1 MiB)
+        :param int start: byte offset at which to start reading (default 0)
+        :return Iterator: bytes chunks of the blob, in order
+        """
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            raise ValueError('chunk_size must be a positive int, not %r' % chunk_size)
+        key = self._cache_key() if start == 0 else None
+        if key is not None:
+            cached = self.cache.open(key)
+            if cached is not None:
+                with cached:
+                    yield from iter(lambda: cached.read(chunk_size), b'')
+                return
+            with self.cache.writer(key) as f:
+                for chunk in self._iter_ranges(chunk_size, start):
+                    f.write(chunk)
+                    yield chunk
+        else:
+            yield from self._iter_ranges(chunk_size, start)
+
+    def _iter_ranges(self, chunk_size, start):
+        size = self.blob.size
+        for offset in range(start, size, chunk_size):
+            # end is inclusive
+            yield self.blob.download_as_string(
+                start=offset, end=min(offset + chunk_size, size) - 1)
 
 
 class HTTPObject:
 
-    def __init__(self, url):
+    def __init__(self, url, cache=True):
         """Object for downloading files at http or https endpoints.
 
         e.g. github raw endpoints
 
+        Downloads read through an ObjectCache when the server provides an ETag: later downloads
+        send a conditional request, and the cached content is used when the server responds
+        304 Not Modified.
+
         :param str url: url of data to be downloaded to file
+        :param bool | ObjectCache cache: (optional) cache to read through. True (default) uses
+          `default_cache()`, False disables caching.
         """
         if isinstance(url, str) and (url.startswith('http://') or url.startswith('https://')):
             self.url = url
         else:
             raise TypeError('url must be a str that starts with http:// or https://')
+        self.cache = _resolve_cache(cache)
+
+    def download_as_bytes(self):
+        """Download data as bytes
+
+        :return bytes: downloaded url data
+        """
+        if self.cache is None:
+            return requests.get(self.url).content
+
+        # the ETag last seen for this url is stored under a key derived from the url alone
+        etag_key = self.cache.key('http-etag', self.url)
+        etag = self.cache.get(etag_key)
+        headers = {'If-None-Match': etag.decode()} if etag is not None else {}
+        response = requests.get(self.url, headers=headers)
+        if response.status_code == 304:
+            data = self.cache.get(self.cache.key('http', self.url, etag.decode()))
+            if data is not None:
+                return data
+            response = requests.get(self.url)  # evicted since the ETag was stored
+
+        etag = response.headers.get('ETag')
+        if response.status_code == 200 and etag:
+            self.cache.put(self.cache.key('http', self.url, etag), response.content)
+            self.cache.put(etag_key, etag.encode())
+        return response.content
 
     def download_as_string(self):
         """Download data as a string
 
         :return str: downloaded url data
         """
-        return requests.get(self.url).content.decode()
+        return self.download_as_bytes().decode()
 
     def download_to_file(self, file_object):
         """Download data to file
 
         :param io.BufferedIOBase file_object: open bytes-writable file object
         """
-        bytestring = requests.get(self.url).content
-        file_object.write(bytestring)
+        file_object.write(self.download_as_bytes())
 
     def download_to_bytes_readable(self):
         """Return a bytes file-like object readable by requests and REST APIs
 
         :return BufferedIOBase: readable file object
         """
-        bytestring = requests.get(self.url).content
-        buffer = BytesIO(bytestring)
-        buffer.seek(0)
-        return buffer
+        return BytesIO(self.download_as_bytes())
+
+    def iter_chunks(self, chunk_size=2 ** 20):
+        """Download data in chunks, streaming the response body
+
+        :param int chunk_size: maximum number of bytes per chunk (default 1 MiB)
+        :return Iterator: bytes chunks of the response body, in order
+        """
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            raise ValueError('chunk_size must be a positive int, not %r' % chunk_size)
+        with requests.get(self.url, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                yield chunk
 
     def exists(self):
         return True if requests.head(self.url).status_code == 200 else False
 
 
+# archives built by bundle_workflow_dependencies, keyed by the hash of their contents
+_archives = OrderedDict()
+_archives_lock = threading.Lock()
+_max_archives = 32
+
+
+def bundle_workflow_dependencies(dependencies, client=None, max_workers=8):
+    """Fetch workflow dependencies concurrently and zip them in memory.
+
+    Every dependency is fetched on each call (google storage and http(s) dependencies through the
+    object cache, see `ObjectCache`), and the archive is memoized by the hash of the dependency
+    names and contents, so submissions that share imports reuse the same archive without zipping
+    it again.
+
+    :param dict dependencies: (name, path) pairs to be included in the archive
+      - name should be the expected name for the imported dependency
+      - path should give the object's location, supports google storage, https, and local paths
+    :param google.cloud.storage.Client | None client: (optional) authenticated google storage
+      client, used for google storage paths
+    :param int max_workers: maximum number of concurrent downloads (default 8)
+    :return bytes: zip archive of the dependencies
+    """
+    if not isinstance(dependencies, dict):
+        raise TypeError('dependencies must be a dict of (name, path) pairs, not %s'
+                        % type(dependencies))
+    for name, dependency in dependencies.items():
+        if not isinstance(dependency, str):
+            raise TypeError('path of dependency %s must be a str, not %s'
+                            % (name, type(dependency)))
+
+    names = sorted(dependencies)
+    if len(names) > 1 and max_workers > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(names))) as executor:
+            contents = list(executor.map(
+                lambda name: load_bytes(dependencies[name], client), names))
+    else:
+        contents = [load_bytes(dependencies[name], client) for name in names]
+
+    digest = hashlib.sha256()
+    for name, data in zip(names, contents):
+        digest.update(hashlib.sha256(name.encode()).digest())
+        digest.update(hashlib.sha256(data).digest())
+    key = digest.hexdigest()
+
+    with _archives_lock:
+        if key in _archives:
+            _archives.move_to_end(key)
+            return _archives[key]
+
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in zip(names, contents):
+            # fixed timestamps make identical inputs produce identical archives
+            archive.writestr(zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0)), data)
+    data = buffer.getvalue()
+
+    with _archives_lock:
+        _archives[key] = data
+        while len(_archives) > _max_archives:
+            _archives.popitem(last=False)
+    return data
+
+
 def package_workflow_dependencies(**dependencies):
     """Download wdls, zip, and return a bytes-readable output
 
+    See `bundle_workflow_dependencies`, which this wraps.
+
     :param dependencies: dict of dependency (name, path) pairs to be included in the archive
       - name should be the expected name for the imported dependency
       - path should give the object's location, supports google storage, https, and local paths
-    :return File: file object with binary data written.
+    :return BytesIO: in-memory file object containing the zip archive
     """
-    archive_buffer = NamedTemporaryFile(delete=False)
-    archive = zipfile.ZipFile(archive_buffer, 'a')
+    return BytesIO(bundle_workflow_dependencies(dependencies))
 
-    for name, dependency in dependencies.items():
-        if dependency.startswith('gs://'):
-            dependency_data = GSObject(dependency).download_as_string()
-            archive.writestr(name, dependency_data)
-        if dependency.startswith('https://') or dependency.startswith('http://'):
-            dependency_data = HTTPObject(dependency).download_as_string()
-            archive.writestr(name, dependency_data)
-        else:  # assume filepath
-            archive.write(dependency, arcname=name)
-
-    archive.close()  # writes essential records
-    archive_buffer.close()  # clean up, will be deleted on program termination
-    return open(archive_buffer.name, 'rb')
+
+def load_bytes(source, client=None):
+    """Load a submission file into memory.
+
+    :param str | dict source: dictionary to be serialized as json, or the google storage, http(s),
+      or local path of a file
+    :param google.cloud.storage.Client | None client: (optional) authenticated google storage
+      client, used for google storage paths
+    :return bytes: file contents
+    """
+    if isinstance(source, dict):
+        return json.dumps(source).encode()
+    elif not isinstance(source, str):
+        raise TypeError('source must be a dict or a str path, not %s' % type(source))
+    elif source.startswith('gs://'):
+        return GSObject(source, client).download_to_bytes_readable().read()
+    elif source.startswith('https://') or source.startswith('http://'):
+        return HTTPObject(source).download_to_bytes_readable().read()
+    else:  # assume filepath
+        with open(source, 'rb') as f:
+            return f.read()
 
 
 def open_gs_console(link, project):
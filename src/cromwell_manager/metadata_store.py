@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from .cromwell import TERMINAL_STATUSES
+
+
+class MetadataStore:
+    """Size-bounded, on-disk store of metadata for workflows that have finished running.
+
+    Metadata for a workflow in a terminal state (Succeeded, Failed, Aborted) never changes, so it
+    only needs to be downloaded from cromwell once. Documents are stored zlib-compressed in a
+    SQLite database, which is safe to share between threads and processes. When the store grows
+    beyond `max_bytes`, the least recently used documents are evicted.
+
+    Pass a store to `Cromwell` to have `Cromwell.metadata` (and therefore `Workflow`) consult it
+    before querying the server::
+
+        cromwell = Cromwell(url, metadata_store=MetadataStore())
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS metadata ('
+        '  workflow_id TEXT NOT NULL,'
+        '  expanded INTEGER NOT NULL,'
+        '  data BLOB NOT NULL,'
+        '  size INTEGER NOT NULL,'
+        '  last_access REAL NOT NULL,'
+        '  PRIMARY KEY (workflow_id, expanded))'
+    )
+
+    def __init__(self, path=None, max_bytes=2 ** 30):
+        """
+        :param str path: (optional) location of the SQLite database. Defaults to
+          ~/.cache/cromwell_manager/metadata.sqlite
+        :param int max_bytes: maximum compressed size of all stored documents (default 1 GiB)
+        """
+        if path is None:
+            path = os.path.join(
+                os.path.expanduser('~'), '.cache', 'cromwell_manager', 'metadata.sqlite')
+        if not isinstance(max_bytes, int) or max_bytes < 1:
+            raise ValueError('max_bytes must be a positive int, not %r' % max_bytes)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(self._schema)
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS last_access_index ON metadata (last_access)')
+
+    def __repr__(self):
+        return '<MetadataStore: %s>' % self.path
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+
+    def __contains__(self, workflow_id):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT 1 FROM metadata WHERE workflow_id = ?', (workflow_id,)).fetchone()
+        return row is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def size(self):
+        """Total compressed size of all stored documents, in bytes."""
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM metadata').fetchone()[0]
+
+    def get(self, workflow_id, expanded=False):
+        """Retrieve stored metadata for workflow_id, marking it as recently used.
+
+        :param str workflow_id: hash code for the workflow
+        :param bool expanded: if True, retrieve the document stored with subworkflow metadata
+          expanded (default False)
+        :return dict | None: workflow metadata, or None if it is not stored
+        """
+        key = (workflow_id, int(expanded))
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                'SELECT data FROM metadata WHERE workflow_id = ? AND expanded = ?',
+                key).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                'UPDATE metadata SET last_access = ? WHERE workflow_id = ? AND expanded = ?',
+                (time.time(),) + key)
+        return json.loads(zlib.decompress(row[0]).decode())
+
+    def put(self, workflow_id, metadata, expanded=False):
+        """Store metadata for workflow_id if the workflow has reached a terminal state.
+
+        :param str workflow_id: hash code for the workflow
+        :param dict metadata: complete metadata document for the workflow
+        :param bool expanded: if True, metadata was retrieved with subworkflow metadata expanded
+          (default False)
+        :return bool: True if the metadata was stored
+        """
+        if metadata.get('status') not in TERMINAL_STATUSES:
+            return False
+        data = zlib.compress(json.dumps(metadata).encode())
+        if len(data) > self.max_bytes:
+            return False
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?)',
+                (workflow_id, int(expanded), data, len(data), time.time()))
+            self._evict()
+        return True
+
+    def _evict(self):
+        """Delete least recently used documents until the store fits in max_bytes.
+
+        Must be called while holding the lock, inside a transaction.
+        """
+        total = self._connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM metadata').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._connection.execute(
+            'SELECT workflow_id, expanded, size FROM metadata ORDER BY last_access')
+        evict = []
+        for workflow_id, expanded, size in rows:
+            if total <= self.max_bytes:
+                break
+            evict.append((workflow_id, expanded))
+            total -= size
+        self._connection.executemany(
+            'DELETE FROM metadata WHERE workflow_id = ? AND expanded = ?', evict)
+
+    def discard(self, workflow_id):
+        """Remove all stored metadata for workflow_id.
+
+        :param str workflow_id: hash code for the workflow
+        """
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM metadata WHERE workflow_id = ?', (workflow_id,))
+
+    def clear(self):
+        """Remove all stored metadata."""
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM metadata')
+
+    def close(self):
+        """Close the database connection."""
+        self._connection.close()
@@ -0,0 +1,225 @@
+import json
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+
+# upper bounds of the latency (seconds) and response size (bytes) histogram buckets
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+size_buckets = tuple(4 ** i * 256 for i in range(10))  # 256 bytes to 64 MiB
+
+
+class RequestEvent(namedtuple('RequestEvent', [
+        'endpoint', 'method', 'url', 'status_code', 'latency', 'response_bytes', 'attempt',
+        'error'])):
+    """One attempt at a request to cromwell, as passed to MetricsRegistry hooks.
+
+    :ivar str endpoint: endpoint name, e.g. 'status' or 'metadata' ('other' if not named)
+    :ivar str method: {GET, POST} type of REST operation
+    :ivar str url: query url
+    :ivar int | None status_code: http status of the response, None if no response was received
+    :ivar float latency: seconds from sending the request to receiving the whole response
+    :ivar int | None response_bytes: size of the response body, None if unknown
+    :ivar int attempt: 1 for the first attempt, 2 for the first retry, ...
+    :ivar str | None error: name of the exception raised, None if a response was received
+    """
+    __slots__ = ()
+
+    @property
+    def failed(self):
+        """True if no response was received, or its status was 400 or above."""
+        return self.status_code is None or self.status_code >= 400
+
+
+class _Histogram:
+    """Cumulative histogram in the Prometheus style: a count per upper bound, plus +Inf."""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, number of observations <= bound) pairs, ending with ('+Inf', count)."""
+        total = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class _EndpointMetrics:
+
+    __slots__ = ('requests', 'errors', 'retries', 'latency', 'response_bytes')
+
+    def __init__(self):
+        self.requests = {}  # (method, status) -> count; status is 'error' without a response
+        self.errors = 0
+        self.retries = 0
+        self.latency = _Histogram(latency_buckets)
+        self.response_bytes = _Histogram(size_buckets)
+
+
+def _labels(**labels):
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('"', '\\"'))
+                             for k, v in labels.items())
+
+
+class MetricsRegistry:
+    """In-process record of the requests made by Cromwell and AsyncCromwell objects.
+
+    For each endpoint, the registry counts requests (by method and response status), errors and
+    retries, and keeps histograms of latency and response size. Every attempt is also passed to
+    the registered hooks as a RequestEvent, e.g. to log slow requests or forward them to another
+    metrics system::
+
+        metrics = MetricsRegistry()
+        metrics.add_hook(lambda event: event.latency > 10 and print(event))
+        cromwell = Cromwell(url, metrics=metrics)
+        ...
+        print(metrics.to_prometheus())
+
+    Servers created without a registry (the default) skip instrumentation entirely. A registry
+    can be shared by several server objects.
+    """
+
+    def __init__(self, prefix='cromwell_client'):
+        """
+        :param str prefix: prefix of the exported metric names (default 'cromwell_client')
+        """
+        self.prefix = prefix
+        self.hooks = []
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def __repr__(self):
+        return '<MetricsRegistry: %d endpoint(s)>' % len(self._endpoints)
+
+    def add_hook(self, hook):
+        """Call hook with a RequestEvent after every attempt at a request.
+
+        Hooks are called on the thread (or event loop) that made the request, so they should
+        return quickly. Exceptions raised by hooks propagate to the caller.
+
+        :param callable hook: function of one RequestEvent
+        """
+        if not callable(hook):
+            raise TypeError('hook must be callable, not %s' % type(hook))
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """Stop calling hook.
+
+        :param callable hook: a hook previously passed to add_hook
+        """
+        self.hooks.remove(hook)
+
+    def observe(self, endpoint, method, url, status_code, latency, response_bytes=None,
+                attempt=1, error=None):
+        """Record one attempt at a request. See RequestEvent for the parameters."""
+        event = RequestEvent(endpoint or 'other', method, url, status_code, latency,
+                             response_bytes, attempt, error)
+        with self._lock:
+            metrics = self._endpoints.get(event.endpoint)
+            if metrics is None:
+                metrics = self._endpoints[event.endpoint] = _EndpointMetrics()
+            key = (method, 'error' if status_code is None else status_code)
+            metrics.requests[key] = metrics.requests.get(key, 0) + 1
+            if event.failed:
+                metrics.errors += 1
+            if attempt > 1:
+                metrics.retries += 1
+            metrics.latency.observe(latency)
+            if response_bytes is not None:
+                metrics.response_bytes.observe(response_bytes)
+        for hook in self.hooks:
+            hook(event)
+
+    def reset(self):
+        """Discard everything recorded so far."""
+        with self._lock:
+            self._endpoints = {}
+
+    def snapshot(self):
+        """Everything recorded so far, as a dictionary.
+
+        :return dict: endpoint name mapped to its requests (as {method: {status: count}}), errors,
+          retries, and latency and response_bytes histograms (sum, count, and cumulative
+          bucket counts)
+        """
+        def histogram(h):
+            return {'sum': h.sum, 'count': h.count,
+                    'buckets': [[bound, count] for bound, count in h.cumulative()]}
+
+        with self._lock:
+            snapshot = {}
+            for endpoint, metrics in sorted(self._endpoints.items()):
+                requests = {}
+                for (method, status), count in sorted(metrics.requests.items(), key=str):
+                    requests.setdefault(method, {})[str(status)] = count
+                snapshot[endpoint] = {
+                    'requests': requests,
+                    'errors': metrics.errors,
+                    'retries': metrics.retries,
+                    'latency_seconds': histogram(metrics.latency),
+                    'response_bytes': histogram(metrics.response_bytes),
+                }
+            return snapshot
+
+    def to_json(self, indent=None):
+        """Everything recorded so far, as JSON (see `snapshot`).
+
+        :param int indent: (optional) indentation of the JSON document
+        :return str: JSON document
+        """
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self):
+        """Everything recorded so far, in the Prometheus text exposition format.
+
+        :return str: metrics, ready to be served from a /metrics endpoint or written for the
+          node exporter's textfile collector
+        """
+        p = self.prefix
+        lines = []
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+
+            lines.append('# HELP %s_requests_total Requests made to cromwell.' % p)
+            lines.append('# TYPE %s_requests_total counter' % p)
+            for endpoint, m in endpoints:
+                for (method, status), count in sorted(m.requests.items(), key=str):
+                    lines.append('%s_requests_total%s %d' % (
+                        p, _labels(endpoint=endpoint, method=method, status=status), count))
+
+            for name, attribute, help in (
+                    ('request_errors_total', 'errors',
+                     'Requests that received no response, or a status of 400 or above.'),
+                    ('request_retries_total', 'retries', 'Requests that were retries.')):
+                lines.append('# HELP %s_%s %s' % (p, name, help))
+                lines.append('# TYPE %s_%s counter' % (p, name))
+                for endpoint, m in endpoints:
+                    lines.append('%s_%s%s %d' % (
+                        p, name, _labels(endpoint=endpoint), getattr(m, attribute)))
+
+            for name, attribute, help in (
+                    ('request_duration_seconds', 'latency', 'Latency of requests to cromwell.'),
+                    ('response_size_bytes', 'response_bytes', 'Size of cromwell responses.')):
+                lines.append('# HELP %s_%s %s' % (p, name, help))
+                lines.append('# TYPE %s_%s histogram' % (p, name))
+                for endpoint, m in endpoints:
+                    h = getattr(m, attribute)
+                    for bound, count in h.cumulative():
+                        lines.append('%s_%s_bucket%s %d' % (
+                            p, name, _labels(endpoint=endpoint, le=bound), count))
+                    lines.append('%s_%s_sum%s %r' % (p, name, _labels(endpoint=endpoint),
+                                                     float(h.sum)))
+                    lines.append('%s_%s_count%s %d' % (p, name, _labels(endpoint=endpoint),
+                                                       h.count))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,262 @@
+import time
+import asyncio
+import threading
+from .resilience import CircuitBreaker
+
+# endpoint name (see Cromwell.get and Cromwell.post): endpoint class it is rate limited under
+endpoint_classes = {
+    'status': 'status',
+    'metadata': 'metadata',
+    'outputs': 'metadata',
+    'logs': 'metadata',
+    'query': 'query',
+    'submit': 'submit',
+    'batch': 'submit',
+    'abort': 'submit',
+}
+
+endpoint_class_names = ('status', 'metadata', 'query', 'submit', 'other')
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` acquisitions per second, in bursts of up to `burst`.
+
+    Acquisitions reserve a token under a lock, then wait outside of it until the reserved token
+    is due, so threads (`acquire`) and asyncio tasks (`acquire_async`) can share one bucket and
+    are served in the order they arrive.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        """
+        :param float rate: tokens added per second
+        :param float burst: (optional) maximum number of tokens held (default max(rate, 1))
+        :param callable clock: (optional) function returning the current time in seconds
+        """
+        if rate <= 0:
+            raise ValueError('rate must be positive, not %r' % rate)
+        if burst is None:
+            burst = max(rate, 1)
+        elif burst < 1:
+            raise ValueError('burst must be at least 1, not %r' % burst)
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._updated = clock()
+
+    def __repr__(self):
+        return '<TokenBucket: %g/s, burst %g>' % (self.rate, self.burst)
+
+    def reserve(self):
+        """Take a token, going into debt if none is available.
+
+        :return float: seconds to wait before the reserved token is due
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0. if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        """Block the calling thread until a token is available, and take it."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait, without blocking the event loop, until a token is available, and take it."""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AdaptiveConcurrency:
+    """Limit on the number of requests in flight, adapted to the server's health.
+
+    The limit grows additively, by about one for every `limit` successful requests, and is
+    multiplied by `backoff` when a request fails (a connection error, timeout, 429 or 5xx
+    response) or takes longer than `target_latency`. Decreases happen at most once per
+    `cooldown` seconds, so a burst of failures from one overload shrinks the limit once.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=64, target_latency=None, backoff=0.5,
+                 cooldown=1., clock=time.monotonic):
+        """
+        :param int initial: initial concurrency limit (default 8)
+        :param int minimum: smallest concurrency limit (default 1)
+        :param int maximum: largest concurrency limit (default 64)
+        :param float target_latency: (optional) seconds above which a response is treated as a
+          sign of overload. If None, only failures shrink the limit.
+        :param float backoff: factor applied to the limit on overload (default 0.5)
+        :param float cooldown: minimum seconds between decreases (default 1)
+        :param callable clock: (optional) function returning the current time in seconds
+        """
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError('concurrency limits must satisfy 1 <= minimum <= initial <= '
+                             'maximum, not %r, %r, %r' % (minimum, initial, maximum))
+        if not 0 < backoff < 1:
+            raise ValueError('backoff must be between 0 and 1, not %r' % backoff)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self._clock = clock
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._last_decrease = None
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return '<AdaptiveConcurrency: %d/%d in flight>' % (self._in_flight, self.limit)
+
+    @property
+    def limit(self):
+        """Current number of requests allowed in flight."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        """Number of requests in flight."""
+        return self._in_flight
+
+    def try_acquire(self):
+        """Take a slot if one is free.
+
+        :return bool: True if a slot was taken
+        """
+        with self._condition:
+            if self._in_flight < int(self._limit):
+                self._in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        """Block the calling thread until a slot is free, and take it."""
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    async def acquire_async(self):
+        """Wait, without blocking the event loop, until a slot is free, and take it."""
+        delay = 0.005
+        while not self.try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, 0.1)
+
+    def cancel(self):
+        """Free a slot whose request was abandoned before it was sent, without adapting the
+        limit."""
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def release(self, latency=None, failed=False):
+        """Free a slot, adapting the limit to the outcome of its request.
+
+        :param float latency: (optional) seconds the request took
+        :param bool failed: True if the request failed in a way that suggests overload
+        """
+        with self._condition:
+            self._in_flight -= 1
+            slow = (self.target_latency is not None and latency is not None
+                    and latency > self.target_latency)
+            if failed or slow:
+                now = self._clock()
+                if self._last_decrease is None or now - self._last_decrease >= self.cooldown:
+                    self._limit = max(self.minimum, self._limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+            self._condition.notify_all()
+
+
+class RateLimiter:
+    """Client-side limits on the load a Cromwell object puts on its server.
+
+    Requests are grouped into endpoint classes (status, metadata, query, submit and other; see
+    `endpoint_classes`). Each class may have its own token bucket, and `budget` caps the total
+    request rate across all classes. An optional AdaptiveConcurrency bounds the number of
+    requests in flight. One limiter can be shared by a `Cromwell` and an `AsyncCromwell`, and by
+    every thread and asyncio task using them::
+
+        limiter = RateLimiter(budget=20, rates={'metadata': 2, 'status': 10},
+                              concurrency=AdaptiveConcurrency(target_latency=5))
+        cromwell = Cromwell(url, rate_limiter=limiter)
+
+    Retries count against the limits like any other request.
+    """
+
+    def __init__(self, budget=None, rates=None, burst=None, concurrency=None,
+                 clock=time.monotonic):
+        """
+        :param float budget: (optional) maximum total requests per second
+        :param dict rates: (optional) endpoint class mapped to its maximum requests per second
+        :param float burst: (optional) burst size of every bucket (default: one second's worth)
+        :param AdaptiveConcurrency concurrency: (optional) limit on requests in flight
+        :param callable clock: (optional) function returning the current time in seconds
+        """
+        rates = rates or {}
+        for name in rates:
+            if name not in endpoint_class_names:
+                raise ValueError('endpoint class must be one of %s, not %r'
+                                 % (', '.join(endpoint_class_names), name))
+        if not (concurrency is None or isinstance(concurrency, AdaptiveConcurrency)):
+            raise TypeError('If provided, concurrency must be an AdaptiveConcurrency, not %s'
+                            % type(concurrency))
+        self.budget = TokenBucket(budget, burst, clock) if budget is not None else None
+        self.buckets = {name: TokenBucket(rate, burst, clock) for name, rate in rates.items()}
+        self.concurrency = concurrency
+
+    def __repr__(self):
+        return '<RateLimiter: budget %s, %s>' % (
+            'none' if self.budget is None else '%g/s' % self.budget.rate,
+            ', '.join('%s %g/s' % (name, b.rate) for name, b in sorted(self.buckets.items()))
+            or 'no per-class limits')
+
+    def _buckets(self, endpoint):
+        bucket = self.buckets.get(endpoint_classes.get(endpoint, 'other'))
+        return [b for b in (bucket, self.budget) if b is not None]
+
+    def before_request(self, endpoint=None):
+        """Block until a request to endpoint may be sent.
+
+        :param str endpoint: (optional) endpoint name
+        """
+        for bucket in self._buckets(endpoint):
+            bucket.acquire()
+        if self.concurrency is not None:
+            self.concurrency.acquire()
+
+    async def before_request_async(self, endpoint=None):
+        """Wait, without blocking the event loop, until a request to endpoint may be sent.
+
+        :param str endpoint: (optional) endpoint name
+        """
+        for bucket in self._buckets(endpoint):
+            await bucket.acquire_async()
+        if self.concurrency is not None:
+            await self.concurrency.acquire_async()
+
+    def cancel(self):
+        """Give back the permission of a request that was abandoned before it was sent.
+
+        Tokens are not returned, but the concurrency slot taken by `before_request` is freed.
+        """
+        if self.concurrency is not None:
+            self.concurrency.cancel()
+
+    def after_request(self, latency=None, status_code=None):
+        """Record the outcome of a request made after `before_request`.
+
+        :param float latency: (optional) seconds the request took
+        :param int status_code: (optional) http status of the response, None if the request
+          failed to connect or timed out
+        """
+        if self.concurrency is not None:
+            self.concurrency.release(
+                latency, status_code is None or CircuitBreaker.is_failure(status_code))
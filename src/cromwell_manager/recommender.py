@@ -0,0 +1,285 @@
+import json
+import math
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .calledtask import prefetch_resource_utilization
+from .resource_utilization import ResourceUtilization
+
+
+class ResourceFit(namedtuple('ResourceFit', ['slope', 'intercept', 'max_input_size', 'n_runs'])):
+    """Upper bound on the peak use of a resource, as a linear function of input size.
+
+    `intercept` is shifted so that the line lies above the observed runs (all of them, or the
+    requested quantile of them). When input sizes are not known, or do not explain usage, slope is
+    0 and max_input_size is None.
+    """
+
+    __slots__ = ()
+
+    def predict(self, input_size=None):
+        """Peak use expected for input_size.
+
+        :param float input_size: (optional) size of the input, in the units the runs were added
+          with. Defaults to the largest input size observed.
+        :return float: predicted peak use, in the units of the fitted resource
+        """
+        if input_size is None:
+            input_size = self.max_input_size or 0
+        return self.slope * input_size + self.intercept
+
+
+def _fit(input_sizes, usage, quantile):
+    """Fit usage against input_sizes, bounding the given quantile of runs from above.
+
+    :param np.ndarray input_sizes: input size of each run, NaN where unknown
+    :param np.ndarray usage: peak use of each run
+    :param float quantile: percentage of runs that must lie on or below the fitted line
+    :return ResourceFit: fitted bound
+    """
+    known = ~np.isnan(input_sizes)
+    if np.unique(input_sizes[known]).size >= 2:
+        x, y = input_sizes[known], usage[known]
+        slope, intercept = np.polyfit(x, y, 1)
+        if slope > 0:  # usage that shrinks with input size would not extrapolate safely
+            intercept += np.percentile(y - (slope * x + intercept), quantile)
+            return ResourceFit(float(slope), float(intercept), float(x.max()), len(usage))
+    return ResourceFit(0.0, float(np.percentile(usage, quantile)), None, len(usage))
+
+
+def _cpu_percent(utilization, percentile):
+    """Busy percentage of a run: a percentile of its cpu samples if they were kept, else their
+    mean. A single sample, such as a burst at startup, does not decide either."""
+    series = utilization.time_series
+    if series is not None and 'cpu_percent' in series:
+        return series.percentile('cpu_percent', percentile)
+    return utilization.mean_cpu_percent
+
+
+def _runtime_attributes(shard):
+    try:
+        return shard['runtimeAttributes']
+    except KeyError:
+        return {}
+
+
+class ResourceRecommender:
+    """Recommend memory, disk and cpu runtime attributes from historical resource utilization.
+
+    Runs (one per shard) are grouped by task name. For each task, peak memory and peak disk use
+    are fit against input size with `np.polyfit`, and the fitted bound is evaluated at the input
+    size of interest. CPU demand (allocated cpus x busy percentage) is bounded in the same way,
+    where the busy percentage of a run is the `cpu_percentile` percentile of its cpu samples, or
+    their mean for runs summarized without a time series. A safety margin is then added to each recommendation::
+
+        recommender = ResourceRecommender(margin=0.2)
+        recommender.add_workflows(
+            [Workflow(i, cromwell) for i in workflow_ids], input_size=lambda w, shard: ...)
+        inputs = recommender.to_inputs(input_size=2e9)
+
+    Workflow metadata is read through `Cromwell.metadata`, so passing a Cromwell server with a
+    `MetadataStore` lets thousands of finished runs be added without re-downloading metadata.
+    """
+
+    def __init__(self, margin=0.2, quantile=100, cpu_percentile=95):
+        """
+        :param float margin: fraction added to each recommendation as a safety margin
+          (default 0.2)
+        :param float quantile: percentage of historical runs that recommendations must cover
+          (default 100, every run)
+        :param float cpu_percentile: percentile of each run's cpu samples taken as its busy
+          percentage (default 95)
+        """
+        if margin < 0:
+            raise ValueError('margin must be non-negative, not %r' % margin)
+        if not 0 <= quantile <= 100:
+            raise ValueError('quantile must be between 0 and 100, not %r' % quantile)
+        if not 0 <= cpu_percentile <= 100:
+            raise ValueError('cpu_percentile must be between 0 and 100, not %r' % cpu_percentile)
+        self.margin = margin
+        self.quantile = quantile
+        self.cpu_percentile = cpu_percentile
+        self._runs = defaultdict(list)  # task name: [(input size, utilization, cpus, disk type)]
+
+    def __repr__(self):
+        return '<ResourceRecommender: %d task(s), %d run(s)>' % (
+            len(self._runs), sum(len(r) for r in self._runs.values()))
+
+    def __len__(self):
+        return len(self._runs)
+
+    @property
+    def tasks(self):
+        """Names of the tasks with at least one run."""
+        return sorted(self._runs)
+
+    def add(self, task_name, utilization, input_size=None, cpus=None, disk_type=None):
+        """Record one run of a task.
+
+        :param str task_name: name of the task, e.g. the fully qualified call name
+        :param ResourceUtilization utilization: resource utilization of the run. Runs without
+          utilization (None) are ignored.
+        :param float input_size: (optional) size of the run's input, in any consistent unit
+        :param int cpus: (optional) number of cpus the run was allocated
+        :param str disk_type: (optional) type of the run's local disk, e.g. HDD or SSD
+        """
+        if utilization is None:
+            return
+        if not isinstance(utilization, ResourceUtilization):
+            raise TypeError('utilization must be a ResourceUtilization object, not %s'
+                            % type(utilization))
+        self._runs[task_name].append((input_size, utilization, cpus, disk_type))
+
+    def add_workflow(self, workflow, input_size=None, max_workers=16):
+        """Record every shard of every task of workflow, including those of its subworkflows.
+
+        :param WorkflowBase workflow: a finished workflow
+        :param float | callable input_size: (optional) input size of every shard, or a function
+          called as input_size(workflow, shard) that returns the input size of a shard
+        :param int max_workers: maximum number of concurrent downloads (default 16)
+        """
+        self.add_workflows([workflow], input_size=input_size, max_workers=max_workers)
+
+    def add_workflows(self, workflows, input_size=None, max_workers=16):
+        """Record every shard of many workflows.
+
+        Task trees are resolved concurrently, and all monitoring logs are then downloaded through
+        one bounded thread pool.
+
+        :param Iterable workflows: finished WorkflowBase objects
+        :param float | callable input_size: (optional) input size of every shard, or a function
+          called as input_size(workflow, shard) that returns the input size of a shard
+        :param int max_workers: maximum number of concurrent requests (default 16)
+        """
+        workflows = list(workflows)
+        if not workflows:
+            return
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(workflows))) as executor:
+            called_tasks = list(executor.map(lambda w: list(w.iter_called_tasks()), workflows))
+        prefetch_resource_utilization(
+            (shard for tasks in called_tasks for task in tasks for shard in task.shards),
+            max_workers=max_workers)
+
+        for workflow, tasks in zip(workflows, called_tasks):
+            for task in tasks:
+                for shard in task.shards:
+                    runtime = _runtime_attributes(shard)
+                    disks = runtime.get('disks', '').split()
+                    self.add(
+                        task.name, shard.resource_utilization,
+                        input_size=input_size(workflow, shard) if callable(input_size)
+                        else input_size,
+                        cpus=int(runtime['cpu']) if 'cpu' in runtime else None,
+                        disk_type=disks[-1] if len(disks) == 3 else None)
+
+    def fit(self, task_name):
+        """Fit the peak use of each resource of task_name against input size.
+
+        :param str task_name: name of the task
+        :return dict: ResourceFit for memory_mb and disk_kb, and for cpu if any run recorded both
+          its cpu count and cpu usage
+        """
+        runs = self._runs.get(task_name)
+        if not runs:
+            raise KeyError('no runs recorded for task %s' % task_name)
+        n = len(runs)
+        sizes = np.fromiter((np.nan if s is None else s for s, _, _, _ in runs), np.float64, n)
+        memory = np.fromiter((u.max_memory for _, u, _, _ in runs), np.float64, n)
+        disk = np.fromiter((u.max_disk for _, u, _, _ in runs), np.float64, n)
+        fits = {'memory_mb': _fit(sizes, memory, self.quantile),
+                'disk_kb': _fit(sizes, disk, self.quantile)}
+
+        busy = (_cpu_percent(u, self.cpu_percentile) for _, u, _, _ in runs)
+        cpu = np.fromiter(
+            (np.nan if c is None or b is None else c * b / 100
+             for (_, _, c, _), b in zip(runs, busy)), np.float64, n)
+        recorded = ~np.isnan(cpu)
+        if recorded.any():
+            fits['cpu'] = _fit(sizes[recorded], cpu[recorded], self.quantile)
+        return fits
+
+    def _recommend(self, task_name, input_size=None):
+        """Recommended memory (GB), disk (GB), disk type and cpu count for task_name."""
+        fits = self.fit(task_name)
+        scale = 1 + self.margin
+        memory_gb = math.ceil(fits['memory_mb'].predict(input_size) * scale / 1024 * 10) / 10
+        disk_gb = math.ceil(fits['disk_kb'].predict(input_size) * scale / 1024 ** 2)
+        disk_types = Counter(d for _, _, _, d in self._runs[task_name] if d is not None)
+        cpu = math.ceil(fits['cpu'].predict(input_size) * scale) if 'cpu' in fits else None
+        return (max(memory_gb, 0.1), max(disk_gb, 1),
+                disk_types.most_common(1)[0][0] if disk_types else 'HDD',
+                max(cpu, 1) if cpu is not None else None)
+
+    def recommend(self, input_size=None):
+        """Recommend runtime attributes for every task.
+
+        :param float input_size: (optional) input size to recommend for. Defaults to the largest
+          input size observed for each task.
+        :return dict: task name mapped to a dictionary of memory, disks and (if cpu usage was
+          recorded) cpu runtime values
+        """
+        recommendations = {}
+        for task_name in self.tasks:
+            memory_gb, disk_gb, disk_type, cpu = self._recommend(task_name, input_size)
+            runtime = {'memory': '%g GB' % memory_gb,
+                       'disks': 'local-disk %d %s' % (disk_gb, disk_type)}
+            if cpu is not None:
+                runtime['cpu'] = cpu
+            recommendations[task_name] = runtime
+        return recommendations
+
+    def to_json(self, input_size=None, indent=2):
+        """Recommendations, the fits behind them, and the number of runs per task, as JSON.
+
+        :param float input_size: (optional) input size to recommend for
+        :param int indent: indentation of the JSON document (default 2)
+        :return str: JSON document
+        """
+        tasks = {}
+        for task_name, runtime in self.recommend(input_size).items():
+            fits = self.fit(task_name)
+            tasks[task_name] = {
+                'runtime': runtime,
+                'n_runs': len(self._runs[task_name]),
+                'fits': {resource: fit._asdict() for resource, fit in fits.items()},
+            }
+        return json.dumps({'margin': self.margin, 'quantile': self.quantile,
+                           'cpu_percentile': self.cpu_percentile, 'input_size': input_size,
+                           'tasks': tasks}, indent=indent)
+
+    def to_inputs(self, input_size=None, template='{task}.{attribute}'):
+        """Recommendations as a workflow inputs override.
+
+        WDLs that expose runtime values as task inputs can be submitted with these inputs merged
+        into their inputs json.
+
+        :param float input_size: (optional) input size to recommend for
+        :param str template: format of each input name, given the task name and the runtime
+          attribute (default '{task}.{attribute}', e.g. MyWorkflow.align.memory)
+        :return dict: input name mapped to recommended value
+        """
+        return {template.format(task=task_name, attribute=attribute): value
+                for task_name, runtime in self.recommend(input_size).items()
+                for attribute, value in runtime.items()}
+
+    def to_options(self, input_size=None):
+        """Recommendations as a workflow options override.
+
+        Workflow options can only set default runtime attributes for every task, so the largest
+        recommendation of each attribute across tasks is used.
+
+        :param float input_size: (optional) input size to recommend for
+        :return dict: workflow options containing default_runtime_attributes
+        """
+        recommendations = [self._recommend(t, input_size) for t in self.tasks]
+        if not recommendations:
+            return {'default_runtime_attributes': {}}
+        memory_gb = max(m for m, _, _, _ in recommendations)
+        disk_gb = max(d for _, d, _, _ in recommendations)
+        disk_types = Counter(t for _, _, t, _ in recommendations)
+        runtime = {'memory': '%g GB' % memory_gb,
+                   'disks': 'local-disk %d %s' % (disk_gb, disk_types.most_common(1)[0][0])}
+        cpus = [c for _, _, _, c in recommendations if c is not None]
+        if cpus:
+            runtime['cpu'] = max(cpus)
+        return {'default_runtime_attributes': runtime}
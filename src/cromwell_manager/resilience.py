@@ -0,0 +1,245 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of making a request while a CircuitBreaker is open."""
+
+    def __init__(self, retry_in):
+        super().__init__('cromwell appears unhealthy; not sending requests for another %.1fs'
+                         % retry_in)
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value):
+    """Parse the value of a Retry-After header.
+
+    :param str value: delay in seconds, or an HTTP date
+    :return float | None: seconds to wait, or None if value is missing or malformed
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.)
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0.)
+
+
+class RetryPolicy:
+    """When, and how long to wait before, retrying a request to cromwell.
+
+    Requests that fail to connect, time out, or receive one of `retry_statuses` are retried up to
+    `max_attempts` times in total. The wait before retry n (counting from 0) is drawn uniformly
+    from [0, min(max_backoff, backoff * 2 ** n)] ("full jitter"), so that many clients retrying
+    together spread their requests out instead of arriving in waves. If the server sends a
+    Retry-After header, the wait is at least that long; if it asks for more than
+    `max_retry_after` seconds, the request is not retried and the response is returned.
+
+    Only idempotent requests are retried after a failure that may have reached the server. POST
+    requests that are not idempotent (e.g. submissions) are retried only after a 429, which means
+    the server rejected the request without acting on it.
+
+    Each request is given a timeout looked up by its endpoint name (e.g. 'status', 'metadata'),
+    so that slow endpoints can be given more time than cheap ones.
+    """
+
+    # (connect, read) timeouts, in seconds
+    default_timeouts = {
+        'metadata': (10, 300),
+        'query': (10, 120),
+        'submit': (10, 120),
+        'batch': (10, 300),
+    }
+
+    def __init__(self, max_attempts=4, backoff=0.5, max_backoff=30, max_retry_after=120,
+                 retry_statuses=(429, 500, 502, 503, 504), timeout=(10, 60), timeouts=None):
+        """
+        :param int max_attempts: maximum number of attempts per request, 1 to disable retries
+          (default 4)
+        :param float backoff: base of the exponential backoff, in seconds (default 0.5)
+        :param float max_backoff: maximum backoff between attempts, in seconds (default 30)
+        :param float max_retry_after: longest Retry-After, in seconds, that is waited for before
+          retrying; responses asking for longer waits are returned (default 120)
+        :param Iterable retry_statuses: http status codes that are retried
+          (default 429, 500, 502, 503, 504)
+        :param float | tuple timeout: timeout of endpoints without their own, in seconds, or a
+          (connect, read) tuple (default (10, 60)). None waits indefinitely.
+        :param dict timeouts: (optional) endpoint name mapped to timeout, overriding
+          `default_timeouts`
+        """
+        if not isinstance(max_attempts, int) or max_attempts < 1:
+            raise ValueError('max_attempts must be a positive int, not %r' % max_attempts)
+        for name, value in (('backoff', backoff), ('max_backoff', max_backoff),
+                            ('max_retry_after', max_retry_after)):
+            if value < 0:
+                raise ValueError('%s must be non-negative, not %r' % (name, value))
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = frozenset(retry_statuses)
+        self.timeouts = dict(self.default_timeouts, **(timeouts or {}))
+        self.default_timeout = timeout
+
+    def __repr__(self):
+        return '<RetryPolicy: %d attempt(s), backoff %gs>' % (self.max_attempts, self.backoff)
+
+    def timeout(self, endpoint=None):
+        """Timeout for requests to endpoint.
+
+        :param str endpoint: (optional) endpoint name
+        :return float | tuple | None: timeout in seconds, or (connect, read) tuple
+        """
+        return self.timeouts.get(endpoint, self.default_timeout)
+
+    def should_retry(self, attempt, status_code=None, idempotent=True, retry_after=None):
+        """Whether to retry a request.
+
+        :param int attempt: number of attempts made so far
+        :param int status_code: (optional) http status of the response, None if the request
+          failed to connect or timed out
+        :param bool idempotent: whether the request can safely be repeated (default True)
+        :param float retry_after: (optional) delay requested by the server
+        :return bool: True if the request should be retried
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if retry_after is not None and retry_after > self.max_retry_after:
+            return False
+        if status_code is None:
+            return idempotent
+        if status_code == 429:
+            return True
+        return idempotent and status_code in self.retry_statuses
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before the next attempt.
+
+        :param int attempt: number of attempts made so far
+        :param float retry_after: (optional) delay requested by the server, no longer than
+          max_retry_after (see `should_retry`)
+        :return float: seconds to wait
+        """
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class CircuitBreaker:
+    """Stop sending requests to a server that keeps failing.
+
+    After `failure_threshold` consecutive failures (connection errors, timeouts, or responses
+    with a 5xx or 429 status) the circuit opens, and requests raise CircuitOpenError immediately
+    instead of adding to the load of an unhealthy server. Once `recovery_timeout` seconds have
+    passed, a single trial request is let through: if it succeeds the circuit closes, otherwise
+    it opens again. The breaker is shared by every thread using the same server object.
+    """
+
+    closed, open, half_open = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30, clock=time.monotonic):
+        """
+        :param int failure_threshold: consecutive failures that open the circuit (default 5)
+        :param float recovery_timeout: seconds the circuit stays open before a trial request
+          (default 30)
+        :param callable clock: (optional) function returning the current time in seconds
+        """
+        if not isinstance(failure_threshold, int) or failure_threshold < 1:
+            raise ValueError('failure_threshold must be a positive int, not %r'
+                             % failure_threshold)
+        if recovery_timeout < 0:
+            raise ValueError('recovery_timeout must be non-negative, not %r' % recovery_timeout)
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False  # True while the trial request of a half-open circuit is in flight
+
+    def __repr__(self):
+        return '<CircuitBreaker: %s>' % self.state
+
+    @property
+    def state(self):
+        """One of 'closed', 'open' or 'half-open'."""
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.closed
+        if self._clock() - self._opened_at < self.recovery_timeout:
+            return self.open
+        return self.half_open
+
+    @staticmethod
+    def is_failure(status_code):
+        """Whether a response status indicates that the server is unhealthy.
+
+        :param int status_code: http status of the response
+        :return bool: True for 429 and 5xx statuses
+        """
+        return status_code == 429 or status_code >= 500
+
+    def before_request(self):
+        """Raise CircuitOpenError unless a request may be sent now.
+
+        A request admitted by this method must be followed by `record` (or one of its variants),
+        or, if it is abandoned before its outcome is known, by `cancel`.
+
+        :return bool: True if the request is the trial request of a half-open circuit
+        """
+        with self._lock:
+            state = self._state()
+            if state == self.closed:
+                return False
+            if state == self.half_open and not self._trial:
+                self._trial = True
+                return True
+            retry_in = max(self._opened_at + self.recovery_timeout - self._clock(), 0.)
+        raise CircuitOpenError(retry_in)
+
+    def cancel(self, trial):
+        """Abandon a request admitted by `before_request` without recording its outcome.
+
+        :param bool trial: value returned by `before_request`; if True, another trial request
+          may be sent
+        """
+        if trial:
+            with self._lock:
+                self._trial = False
+
+    def record_success(self):
+        """Record a request that the server handled; closes the circuit."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        """Record a failed request; opens the circuit once failure_threshold is reached."""
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial = False
+
+    def record(self, status_code=None):
+        """Record the outcome of a request.
+
+        :param int status_code: (optional) http status of the response, None if the request
+          failed to connect or timed out
+        """
+        if status_code is None or self.is_failure(status_code):
+            self.record_failure()
+        else:
+            self.record_success()
@@ -1,9 +1,210 @@
 
 
+import re
+from io import BytesIO
+from itertools import chain
+import numpy as np
+
+
+def _find_total(pattern, header):
+    """Find the total captured by pattern in the general information block of a log.
+
+    :param re.Pattern pattern: compiled bytes pattern with one group capturing an integer
+    :param bytes header: general information block of a monitoring log
+    :return int | None: captured total, None if it was not found
+    """
+    match = pattern.search(header)
+    return int(match.group(1)) if match else None
+
+
+class UtilizationTimeSeries:
+    """Every sample recorded in a monitoring log, as compact NumPy arrays.
+
+    The monitoring script (accessories/monitor.sh) writes one block of "* <metric>: <value>" lines
+    every `interval` seconds. Each metric is stored as a pair of arrays: the index of the sample
+    (block) each value was recorded in, and the values themselves. Metrics are:
+
+    - memory_mb: memory usage in MB
+    - memory_percent: memory usage as a percentage of total memory
+    - disk_kb: disk usage in KB
+    - disk_percent: disk usage as a percentage of total disk
+
+    and, for logs written by the current monitoring scripts:
+
+    - cpu_percent: percentage of CPU time spent busy since the previous sample
+    - load_average: 1 minute load average
+    - disk_read_kbps, disk_write_kbps: disk throughput since the previous sample, in KB/s
+    - net_rx_kbps, net_tx_kbps: network throughput (excluding loopback), in KB/s
+
+    Rates measured since the previous sample are not recorded in the first sample.
+    """
+
+    # one alternative per metric, in the order monitor.sh writes them; the first metric of each
+    # block marks the start of a new sample
+    _metric_names = ('memory_percent', 'memory_mb', 'disk_percent', 'disk_kb', 'cpu_percent',
+                     'load_average', 'disk_read_kbps', 'disk_write_kbps', 'net_rx_kbps',
+                     'net_tx_kbps')
+    _optional_metrics = frozenset(_metric_names[4:])  # not recorded by older scripts
+    _pattern = re.compile(
+        rb'^\* (?:memory usage \(%\): *([-+.0-9eE]+)'
+        rb'|memory usage \(mb\): *([-+.0-9eE]+)'
+        rb'|disk usage \(%\): *([-+.0-9eE]+)'
+        rb'|disk usage \(kb\): *([-+.0-9eE]+)'
+        rb'|cpu usage \(%\): *([-+.0-9eE]+)'
+        rb'|load average: *([-+.0-9eE]+)'
+        rb'|disk read \(kb/s\): *([-+.0-9eE]+)'
+        rb'|disk write \(kb/s\): *([-+.0-9eE]+)'
+        rb'|network received \(kb/s\): *([-+.0-9eE]+)'
+        rb'|network sent \(kb/s\): *([-+.0-9eE]+))',
+        re.MULTILINE | re.IGNORECASE)
+
+    # factor converting each metric to GB, for gb_hours
+    _to_gb = {'memory_mb': 1 / 1024, 'disk_kb': 1 / 1024 ** 2}
+
+    def __init__(self, metrics, interval=5):
+        """
+        :param dict metrics: dictionary mapping metric name to a (sample_indices, values) pair of
+          arrays. Optional metrics without values are left out.
+        :param float interval: time between samples, in seconds (default 5, as in monitor.sh)
+        """
+        self.interval = interval
+        self._metrics = {
+            # float64, so that disk usage in KB is exact beyond 2 ** 24 (16 GB)
+            name: (np.asarray(indices, dtype=np.int32), np.asarray(values, dtype=np.float64))
+            for name, (indices, values) in metrics.items()
+            if len(values) or name not in self._optional_metrics}
+
+    def __repr__(self):
+        return '<UtilizationTimeSeries: %d samples, metrics: %s>' % (
+            self.n_samples, ', '.join(sorted(self._metrics)))
+
+    def __contains__(self, metric):
+        return metric in self._metrics
+
+    @classmethod
+    def from_bytes(cls, data, interval=5):
+        """Parse the runtime samples of a monitoring log.
+
+        The whole buffer is searched with a single regular expression, and the matches are
+        converted to arrays in one step, rather than examining the log line by line.
+
+        :param bytes data: monitoring log contents
+        :param float interval: time between samples, in seconds (default 5)
+        :return UtilizationTimeSeries: parsed samples
+        """
+        metrics, _ = cls._parse(data)
+        return cls(metrics, interval=interval)
+
+    @classmethod
+    def _parse(cls, data, first_sample=0):
+        """Parse the runtime samples in a block of complete monitoring log lines.
+
+        :param bytes data: complete lines of a monitoring log
+        :param int first_sample: index of the first sample that starts in data. Values recorded
+          before the first sample marker in data belong to the sample before it (or to sample 0,
+          at the start of a log).
+        :return dict: metric name mapped to (sample_indices, values) arrays, values as float64
+        :return int: number of samples that start in data
+        """
+        found = cls._pattern.findall(data)
+        n_metrics = len(cls._metric_names)
+        matches = np.fromiter(
+            chain.from_iterable(found), dtype='S32', count=len(found) * n_metrics,
+        ).reshape(-1, n_metrics)
+        present = matches != b''
+        started = np.cumsum(present[:, 0])
+        samples = np.maximum(started - 1 + first_sample, 0)
+        metrics = {}
+        for i, name in enumerate(cls._metric_names):
+            metrics[name] = (samples[present[:, i]], matches[present[:, i], i].astype(np.float64))
+        return metrics, int(started[-1]) if len(started) else 0
+
+    @property
+    def metrics(self):
+        """Names of the metrics in this time series."""
+        return sorted(self._metrics)
+
+    @property
+    def n_samples(self):
+        """Number of samples recorded."""
+        return max((int(i[-1]) + 1 for i, _ in self._metrics.values() if len(i)), default=0)
+
+    @property
+    def duration(self):
+        """Time covered by the samples, in seconds."""
+        return self.n_samples * self.interval
+
+    def sample_indices(self, metric):
+        """Index of the sample in which each value of metric was recorded."""
+        return self._metrics[metric][0]
+
+    def values(self, metric):
+        """Recorded values of metric."""
+        return self._metrics[metric][1]
+
+    def times(self, metric):
+        """Time (in seconds since monitoring started) at which each value of metric was recorded."""
+        return self._metrics[metric][0] * self.interval
+
+    def max(self, metric):
+        values = self.values(metric)
+        return float(values.max()) if len(values) else 0.0
+
+    def mean(self, metric):
+        values = self.values(metric)
+        return float(values.mean()) if len(values) else 0.0
+
+    def percentile(self, metric, q):
+        """Return the q-th percentile (or percentiles) of metric.
+
+        :param str metric: name of the metric
+        :param float | Iterable q: percentile(s) to compute, between 0 and 100
+        :return float | np.ndarray: percentile value(s)
+        """
+        values = self.values(metric)
+        if not len(values):
+            return np.zeros_like(q, dtype=np.float64) if np.ndim(q) else 0.0
+        result = np.percentile(values, q)
+        return float(result) if np.ndim(result) == 0 else result
+
+    def time_above(self, metric, threshold):
+        """Total time, in seconds, for which metric exceeded threshold.
+
+        :param str metric: name of the metric
+        :param float threshold: value in the metric's units
+        :return float: seconds spent above threshold
+        """
+        return float(np.count_nonzero(self.values(metric) > threshold) * self.interval)
+
+    def gb_hours(self, metric='memory_mb'):
+        """Integrate usage over time, in GB-hours.
+
+        :param str metric: memory_mb or disk_kb (default memory_mb)
+        :return float: GB-hours of usage
+        """
+        if metric not in self._to_gb:
+            raise ValueError('gb_hours is only defined for %s, not %s'
+                             % (', '.join(sorted(self._to_gb)), metric))
+        return float(self.values(metric).sum(dtype=np.float64) * self._to_gb[metric] *
+                     self.interval / 3600)
+
+
 class ResourceUtilization:
     """Class to store resource utilization information for a task, run on Cromwell."""
 
-    def __init__(self, task_name, max_memory, total_memory, max_disk, total_disk, robust):
+    _total_memory = re.compile(rb'^total memory \(mb\): *(\d+)', re.MULTILINE | re.IGNORECASE)
+    _total_disk = re.compile(rb'^total disk space \(kb\): *(\d+)', re.MULTILINE | re.IGNORECASE)
+
+    # statistics of optional metrics, named <statistic>_<UtilizationTimeSeries metric>. They are
+    # None for logs written by monitoring scripts that did not record the metric.
+    activity_fields = ('max_cpu_percent', 'mean_cpu_percent', 'max_load_average',
+                       'max_disk_read_kbps', 'max_disk_write_kbps', 'max_net_rx_kbps',
+                       'max_net_tx_kbps')
+
+    def __init__(self, task_name, max_memory, total_memory, max_disk, total_disk, robust,
+                 time_series=None, max_cpu_percent=None, mean_cpu_percent=None,
+                 max_load_average=None, max_disk_read_kbps=None, max_disk_write_kbps=None,
+                 max_net_rx_kbps=None, max_net_tx_kbps=None):
         """
         :param int task_name:
         :param int max_memory:
@@ -11,41 +212,115 @@ class ResourceUtilization:
         :param int max_disk:
         :param int total_disk:
         :param bool robust:
+        :param UtilizationTimeSeries time_series: (optional) every sample the summary was
+          computed from
+        :param float max_cpu_percent: (optional) highest percentage of CPU time spent busy
+        :param float mean_cpu_percent: (optional) average percentage of CPU time spent busy
+        :param float max_load_average: (optional) highest 1 minute load average
+        :param float max_disk_read_kbps: (optional) highest disk read throughput, in KB/s
+        :param float max_disk_write_kbps: (optional) highest disk write throughput, in KB/s
+        :param float max_net_rx_kbps: (optional) highest network receive throughput, in KB/s
+        :param float max_net_tx_kbps: (optional) highest network send throughput, in KB/s
         """
         self.task_name = task_name
+        self.update(max_memory, total_memory, max_disk, total_disk, robust, time_series,
+                    max_cpu_percent, mean_cpu_percent, max_load_average, max_disk_read_kbps,
+                    max_disk_write_kbps, max_net_rx_kbps, max_net_tx_kbps)
+
+    def update(self, max_memory, total_memory, max_disk, total_disk, robust, time_series=None,
+               max_cpu_percent=None, mean_cpu_percent=None, max_load_average=None,
+               max_disk_read_kbps=None, max_disk_write_kbps=None, max_net_rx_kbps=None,
+               max_net_tx_kbps=None):
+        """Replace the statistics of this object in place, e.g. as a running task's log grows.
+
+        Parameters are as for the constructor.
+        """
         self.max_memory = max_memory
         self.total_memory = total_memory
         self.max_disk = max_disk
         self.total_disk = total_disk
         self.robust = robust
-        self.fraction_disk_used = max_disk / total_disk
-        self.fraction_memory_used = max_memory / total_memory
+        self.time_series = time_series
+        self.max_cpu_percent = max_cpu_percent
+        self.mean_cpu_percent = mean_cpu_percent
+        self.max_load_average = max_load_average
+        self.max_disk_read_kbps = max_disk_read_kbps
+        self.max_disk_write_kbps = max_disk_write_kbps
+        self.max_net_rx_kbps = max_net_rx_kbps
+        self.max_net_tx_kbps = max_net_tx_kbps
+        # NaN if the log did not record the total, as in UtilizationDistribution
+        self.fraction_disk_used = max_disk / total_disk if total_disk else float('nan')
+        self.fraction_memory_used = max_memory / total_memory if total_memory else float('nan')
+
+    @property
+    def activity(self):
+        """Dictionary of the recorded CPU, I/O and network statistics, see `activity_fields`."""
+        return {name: getattr(self, name) for name in self.activity_fields
+                if getattr(self, name) is not None}
 
     @classmethod
-    def from_file(cls, task_name, open_log_file_object):
+    def from_file(cls, task_name, open_log_file_object, time_series=False, interval=5,
+                  chunk_size=2 ** 20):
         """Create a ResourceUtilization object from a monitoring log file.
 
+        The file is read in chunks of chunk_size bytes, so the whole log is never held in memory.
+
+        :param str task_name: Name of this task
+        :param file open_log_file_object: an open monitoring log from cromwell, in binary mode
+        :param bool time_series: if True, keep every sample as a UtilizationTimeSeries
+          (default False)
+        :param float interval: time between samples, in seconds (default 5)
+        :param int chunk_size: number of bytes to read at a time (default 1 MiB)
+        :return ResourceUtilization: memory and disk utilization for this task
+        """
+        first = open_log_file_object.read(chunk_size)
+        if isinstance(first, str):
+            raise TypeError('open_log_file_object must be opened in binary mode')
+        chunks = chain((first,), iter(lambda: open_log_file_object.read(chunk_size), b''))
+        return cls.from_stream(task_name, chunks, time_series=time_series, interval=interval)
+
+    @classmethod
+    def from_bytes(cls, task_name, data, time_series=False, interval=5):
+        """Create a ResourceUtilization object from the contents of a monitoring log.
+
         :param str task_name: Name of this task
-        :param file open_log_file_object: an open monitoring log from cromwell
+        :param bytes data: monitoring log contents
+        :param bool time_series: if True, keep every sample as a UtilizationTimeSeries
+          (default False)
+        :param float interval: time between samples, in seconds (default 5)
         :return ResourceUtilization: memory and disk utilization for this task
         """
+        return cls.from_stream(task_name, (data,), time_series=time_series, interval=interval)
 
-        # parse the file
-        total_memory, total_disk, max_memory, max_disk = 0, 0, 0, 0
-        i = 0
-        for i, line in enumerate(open_log_file_object):
-            line = line.lower()  # make a bit more robust to capitalization in script
-            if line.startswith(b'total memory (mb):'):
-                total_memory = int(line.split()[-1])
-            elif line.startswith(b'total disk space (kb):'):
-                total_disk = int(line.split()[-1])
-            elif line.startswith(b'* memory usage (mb):'):
-                max_memory = max(max_memory, int(line.split()[-1]))
-            elif line.startswith(b'* disk usage (kb):'):
-                max_disk = max(max_disk, int(line.split()[-1]))
-        robust = True if i >= 5 else False
+    @classmethod
+    def from_stream(cls, task_name, chunks, time_series=False, interval=5):
+        """Create a ResourceUtilization object from a monitoring log that arrives in chunks.
+
+        Chunks may split lines at any point, e.g. `GSObject.iter_chunks()` or
+        `HTTPObject.iter_chunks()`. Unless time_series is requested, memory use is bounded by
+        the size of a chunk rather than the size of the log.
+
+        :param str task_name: Name of this task
+        :param Iterable chunks: bytes chunks of the monitoring log, in order
+        :param bool time_series: if True, keep every sample as a UtilizationTimeSeries
+          (default False)
+        :param float interval: time between samples, in seconds (default 5)
+        :return ResourceUtilization: memory and disk utilization for this task
+        """
+        parser = MonitoringLogParser(task_name, time_series=time_series, interval=interval)
+        for chunk in chunks:
+            parser.feed(chunk)
+        return parser.close()
 
-        return cls(task_name, max_memory, total_memory, max_disk, total_disk, robust)
+    _activity_labels = {
+        'max_cpu_percent': 'Max CPU Usage     (%)',
+        'mean_cpu_percent': 'Mean CPU Usage    (%)',
+        'max_load_average': 'Max Load Average     ',
+        'max_disk_read_kbps': 'Max Disk Read  (KB/s)',
+        'max_disk_write_kbps': 'Max Disk Write (KB/s)',
+        'max_net_rx_kbps': 'Max Net Recv   (KB/s)',
+        'max_net_tx_kbps': 'Max Net Sent   (KB/s)',
+    }
 
     def __str__(self):
         return (
@@ -56,6 +331,7 @@ class ResourceUtilization:
             "Available disk   (KB): {total_disk}\n"
             "Disk Utilized     (%): {disk_utilization:.3f}\n"
             "Memory Utilized   (%): {memory_utilization:.3f}\n"
+            "{activity}"
             "Robust Estimate?     : {robust}\n".format(
                 task_name=self.task_name,
                 max_memory=self.max_memory,
@@ -64,7 +340,9 @@ class ResourceUtilization:
                 total_disk=self.total_disk,
                 robust=self.robust,
                 disk_utilization=self.fraction_disk_used,
-                memory_utilization=self.fraction_memory_used
+                memory_utilization=self.fraction_memory_used,
+                activity=''.join('%s: %.2f\n' % (self._activity_labels[name], value)
+                                 for name, value in self.activity.items()),
             )
         )
 
@@ -74,7 +352,7 @@ class ResourceUtilization:
     @staticmethod
     def merge(x, y=None):
         """Merge two ResourceUtilization objects for the same task, returning the maximum
-        utilization.
+        utilization. Statistics recorded by only one of them are kept.
 
         :param ResourceUtilization x:
         :param ResourceUtilization y:
@@ -92,5 +370,359 @@ class ResourceUtilization:
             max_disk = max(x.max_disk, y.max_disk)
             total_disk = max(x.total_disk, y.total_disk)
             robust = any([x.robust, y.robust])
+            activity = {}
+            for name in ResourceUtilization.activity_fields:
+                values = [v for v in (getattr(x, name), getattr(y, name)) if v is not None]
+                activity[name] = max(values) if values else None
             return ResourceUtilization(
-                x.task_name, max_memory, total_memory, max_disk, total_disk, robust)
+                x.task_name, max_memory, total_memory, max_disk, total_disk, robust, **activity)
+
+
+class MonitoringLogParser:
+    """Incremental parser for monitoring logs, fed one chunk at a time.
+
+    Both the verbose format of accessories/monitor.sh and the compact CSV format of
+    accessories/monitor_compact.sh are understood; the format is detected from the first line.
+
+    Only the last, incomplete line of each chunk is carried over to the next, and each block of
+    complete lines is parsed in one vectorized step and reduced to running totals, so chunks can
+    be discarded as soon as they have been fed::
+
+        parser = MonitoringLogParser('align')
+        for chunk in GSObject(log).iter_chunks():
+            parser.feed(chunk)
+        utilization = parser.close()
+
+    To follow the log of a running task, keep the parser, feed it only the bytes written since
+    `offset`, and call `summarize` to update the statistics seen so far (see
+    `Shard.update_resource_utilization`).
+    """
+
+    # first line of logs written by accessories/monitor_compact.sh
+    csv_signature = b'#cromwell-monitor-csv'
+    _csv_field = re.compile(rb'^#(\w+)=(.*)$', re.MULTILINE)
+    _csv_record = re.compile(rb'^[^#\n]', re.MULTILINE)
+    _csv_empty = re.compile(rb'(?<=,)(?=,|\r?$)', re.MULTILINE)  # empty field, after the first
+    _csv_columns = ('time', 'memory_mb', 'disk_kb')  # columns of logs without a columns field
+
+    def __init__(self, task_name, time_series=False, interval=5):
+        """
+        :param str task_name: Name of the task the log was recorded for
+        :param bool time_series: if True, keep every sample, and attach a UtilizationTimeSeries
+          to the result (default False)
+        :param float interval: time between samples, in seconds (default 5)
+        """
+        self.task_name = task_name
+        self.interval = interval
+        self.total_memory = None
+        self.total_disk = None
+        self.n_lines = 0
+        self.n_samples = 0
+        self.offset = 0
+        self.csv = None  # True for compact CSV logs, False for monitor.sh logs, None until known
+        self._columns = list(self._csv_columns)
+        self._remainder = b''
+        self._in_header = True
+        self._max = dict.fromkeys(UtilizationTimeSeries._metric_names, 0.0)
+        self._sum = dict.fromkeys(UtilizationTimeSeries._metric_names, 0.0)
+        self._count = dict.fromkeys(UtilizationTimeSeries._metric_names, 0)
+        self._blocks = ({name: [] for name in UtilizationTimeSeries._metric_names}
+                        if time_series else None)
+
+    def __repr__(self):
+        return '<MonitoringLogParser: %s, %d lines>' % (self.task_name, self.n_lines)
+
+    @property
+    def max_memory(self):
+        """Largest memory usage, in MB, seen so far."""
+        return int(self._max['memory_mb'])
+
+    @property
+    def max_disk(self):
+        """Largest disk usage, in KB, seen so far."""
+        return int(self._max['disk_kb'])
+
+    @property
+    def activity(self):
+        """CPU, I/O and network statistics seen so far, see ResourceUtilization.activity_fields."""
+        activity = {}
+        for field in ResourceUtilization.activity_fields:
+            statistic, metric = field.split('_', 1)
+            if self._count[metric]:
+                activity[field] = (self._max[metric] if statistic == 'max' else
+                                   self._sum[metric] / self._count[metric])
+        return activity
+
+    def feed(self, chunk):
+        """Parse the complete lines of chunk, keeping any trailing partial line for the next.
+
+        :param bytes chunk: next chunk of the monitoring log
+        """
+        self.offset += len(chunk)
+        data = self._remainder + chunk
+        end = data.rfind(b'\n') + 1
+        self._remainder = data[end:]
+        if end:
+            self._parse(data[:end])
+
+    def _parse(self, data):
+        if self.csv is None:  # sniff the format from the first line
+            self.csv = data.startswith(self.csv_signature)
+        if self.csv:
+            metrics, n_started = self._parse_csv(data)
+        else:
+            metrics, n_started = self._parse_text(data)
+        self.n_lines += data.count(b'\n')
+        self.n_samples += n_started
+
+        for name, (_, values) in metrics.items():
+            if len(values):
+                self._max[name] = max(self._max[name], float(values.max()))
+                self._sum[name] += float(values.sum())
+                self._count[name] += len(values)
+        if self._blocks is not None:
+            for name, block in metrics.items():
+                self._blocks[name].append(block)
+
+    def _parse_text(self, data):
+        """Parse complete lines of a monitoring log written by accessories/monitor.sh."""
+        # totals are written once, in the general information block before the first sample
+        if self._in_header:
+            header_end = 0 if self.n_lines and data.startswith(b'*') else data.find(b'\n*')
+            header = data[:header_end] if header_end >= 0 else data
+            if self.total_memory is None:
+                self.total_memory = _find_total(ResourceUtilization._total_memory, header)
+            if self.total_disk is None:
+                self.total_disk = _find_total(ResourceUtilization._total_disk, header)
+            self._in_header = header_end < 0
+        return UtilizationTimeSeries._parse(data, first_sample=self.n_samples)
+
+    def _parse_csv(self, data):
+        """Parse complete lines of a monitoring log written by accessories/monitor_compact.sh.
+
+        The header is a block of "#key=value" lines. Each following line is one sample, so a
+        block of them is read into a 2D array in one call. Empty fields, such as the activity
+        columns of the first sample, are not recorded.
+        """
+        if self._in_header:
+            first_record = self._csv_record.search(data)
+            header_end = first_record.start() if first_record else len(data)
+            fields = dict(self._csv_field.findall(data[:header_end]))
+            if b'total_memory_mb' in fields:
+                self.total_memory = int(fields[b'total_memory_mb'])
+            if b'total_disk_kb' in fields:
+                self.total_disk = int(fields[b'total_disk_kb'])
+            if b'interval' in fields:
+                self.interval = float(fields[b'interval'])
+            if b'columns' in fields:
+                self._columns = fields[b'columns'].strip().decode().split(',')
+            self._in_header = first_record is None
+            data = data[header_end:]
+
+        metrics = {name: (np.empty(0, dtype=np.int64), np.empty(0))
+                   for name in UtilizationTimeSeries._metric_names}
+        if not data:
+            return metrics, 0
+        records = np.loadtxt(BytesIO(self._csv_empty.sub(b'nan', data)), delimiter=',', ndmin=2)
+        samples = np.arange(self.n_samples, self.n_samples + len(records))
+        for column, name in enumerate(self._columns):
+            if name in metrics:
+                recorded = ~np.isnan(records[:, column])
+                metrics[name] = (samples[recorded], records[recorded, column])
+        for name, total, percent in (('memory_mb', self.total_memory, 'memory_percent'),
+                                     ('disk_kb', self.total_disk, 'disk_percent')):
+            if total and not len(metrics[percent][1]):
+                metrics[percent] = (samples, metrics[name][1] / total * 100)
+        return metrics, len(records)
+
+    def close(self):
+        """Parse any final, unterminated line, and summarize the log.
+
+        :return ResourceUtilization: memory and disk utilization for the task
+        """
+        if self._remainder:
+            remainder, self._remainder = self._remainder, b''
+            self._parse(remainder + b'\n')
+        return self.summarize()
+
+    def summarize(self, utilization=None):
+        """Summarize the complete lines parsed so far.
+
+        :param ResourceUtilization utilization: (optional) object to update in place, rather than
+          creating a new one
+        :return ResourceUtilization: memory and disk utilization for the task
+        """
+        time_series = None
+        if self._blocks is not None:
+            time_series = UtilizationTimeSeries({
+                name: (np.concatenate([i for i, _ in blocks]) if blocks else (),
+                       np.concatenate([v for _, v in blocks]) if blocks else ())
+                for name, blocks in self._blocks.items()}, interval=self.interval)
+
+        statistics = dict(
+            max_memory=self.max_memory,
+            total_memory=self.total_memory or 0,
+            max_disk=self.max_disk,
+            total_disk=self.total_disk or 0,
+            robust=self.n_samples > 0,  # in either format, once the log has recorded a sample
+            time_series=time_series,
+            **self.activity)
+        if utilization is None:
+            return ResourceUtilization(self.task_name, **statistics)
+        utilization.update(**statistics)
+        return utilization
+
+
+class UtilizationDistribution:
+    """Peak resource utilization of every shard of a scattered task, stored as columns.
+
+    Rather than reducing shards pairwise to a single maximum, the utilization of all shards is
+    stacked into arrays so that maxima, means, percentiles, outlying shards and the spread of
+    utilization across the scatter are each computed in one vectorized pass.
+
+    Columns are max_memory, total_memory, max_disk and total_disk, in the units of
+    ResourceUtilization, plus the derived fraction_memory_used and fraction_disk_used, and the
+    CPU, I/O and network statistics of ResourceUtilization.activity_fields. Shards whose logs did
+    not record an activity statistic hold NaN in its column, and are ignored by the statistics
+    below.
+    """
+
+    fields = ('max_memory', 'total_memory', 'max_disk', 'total_disk') + \
+        ResourceUtilization.activity_fields
+
+    def __init__(self, task_name, shard_indices, columns, robust):
+        """
+        :param str task_name: name of the task
+        :param np.ndarray shard_indices: index of the shard each row describes
+        :param dict columns: dictionary mapping each of `fields` to an array with one value per
+          shard
+        :param np.ndarray robust: boolean array, True for shards with a robust estimate
+        """
+        self.task_name = task_name
+        self.shard_indices = np.asarray(shard_indices, dtype=np.int64)
+        self._columns = {name: np.asarray(columns[name], dtype=np.float64)
+                         for name in self.fields}
+        self.robust = np.asarray(robust, dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._columns['fraction_memory_used'] = (
+                self._columns['max_memory'] / self._columns['total_memory'])
+            self._columns['fraction_disk_used'] = (
+                self._columns['max_disk'] / self._columns['total_disk'])
+
+    def __repr__(self):
+        return '<UtilizationDistribution: %s, %d shard(s)>' % (self.task_name, len(self))
+
+    def __len__(self):
+        return len(self.shard_indices)
+
+    def __getitem__(self, column):
+        return self._columns[column]
+
+    @classmethod
+    def from_utilizations(cls, utilizations, task_name=None, shard_indices=None):
+        """Stack the utilization of many shards into columns.
+
+        :param list utilizations: ResourceUtilization for each shard. Shards without utilization
+          (None) are left out.
+        :param str task_name: (optional) name of the task, defaults to that of the first shard
+        :param Iterable shard_indices: (optional) index of each shard, defaults to its position
+        :return UtilizationDistribution: stacked utilization
+        """
+        if shard_indices is None:
+            shard_indices = range(len(utilizations))
+        present = [(i, u) for i, u in zip(shard_indices, utilizations) if u is not None]
+        if task_name is None:
+            task_name = present[0][1].task_name if present else None
+        n = len(present)
+        columns = {name: np.fromiter((np.nan if getattr(u, name) is None else getattr(u, name)
+                                      for _, u in present), dtype=np.float64, count=n)
+                   for name in cls.fields}
+        robust = np.fromiter((u.robust for _, u in present), dtype=bool, count=n)
+        indices = np.fromiter((i for i, _ in present), dtype=np.int64, count=n)
+        return cls(task_name, indices, columns, robust)
+
+    def _recorded(self, column):
+        """Values of column, without shards that did not record it."""
+        values = self[column]
+        return values[~np.isnan(values)]
+
+    def max(self, column):
+        values = self._recorded(column)
+        return float(values.max()) if len(values) else 0.0
+
+    def mean(self, column):
+        values = self._recorded(column)
+        return float(values.mean()) if len(values) else 0.0
+
+    def percentile(self, column, q):
+        """Return the q-th percentile (or percentiles) of column across shards.
+
+        :param str column: name of the column
+        :param float | Iterable q: percentile(s) to compute, between 0 and 100
+        :return float | np.ndarray: percentile value(s)
+        """
+        values = self._recorded(column)
+        if not len(values):
+            return np.zeros_like(q, dtype=np.float64) if np.ndim(q) else 0.0
+        result = np.percentile(values, q)
+        return float(result) if np.ndim(result) == 0 else result
+
+    def histogram(self, column, bins=10):
+        """Distribution of column across shards.
+
+        :param str column: name of the column
+        :param int | Iterable bins: number of bins, or bin edges (default 10)
+        :return tuple: (counts, bin_edges) arrays, as returned by np.histogram
+        """
+        return np.histogram(self._recorded(column), bins=bins)
+
+    def outliers(self, column, k=1.5):
+        """Find shards whose utilization lies outside the Tukey fences of column.
+
+        :param str column: name of the column
+        :param float k: multiple of the interquartile range beyond which a shard is an outlier
+          (default 1.5)
+        :return np.ndarray: indices of the outlying shards
+        """
+        values = self[column]
+        if np.isnan(values).all():
+            return self.shard_indices[:0]
+        q1, q3 = np.nanpercentile(values, [25, 75])
+        iqr = q3 - q1
+        mask = (values < q1 - k * iqr) | (values > q3 + k * iqr)
+        return self.shard_indices[mask]
+
+    def summary(self, column, percentiles=(50, 90, 99)):
+        """Summarize the distribution of column across shards.
+
+        :param str column: name of the column
+        :param Iterable percentiles: percentiles to report (default 50, 90, 99)
+        :return dict: max, mean, std, ratio of max to mean, requested percentiles and outlying
+          shard indices
+        """
+        values = self._recorded(column)
+        summary = {
+            'max': self.max(column),
+            'mean': self.mean(column),
+            'std': float(values.std()) if len(values) else 0.0,
+            'peak_to_mean': self.max(column) / self.mean(column) if self.mean(column) else 0.0,
+        }
+        for q, value in zip(percentiles, np.atleast_1d(self.percentile(column, list(percentiles)))):
+            summary['p%g' % q] = float(value)
+        summary['outliers'] = self.outliers(column).tolist()
+        return summary
+
+    def to_resource_utilization(self):
+        """Reduce to a single ResourceUtilization holding the maximum over all shards.
+
+        :return ResourceUtilization | None: maximum utilization, or None if no shard has any
+        """
+        if not len(self):
+            return None
+        activity = {name: self.max(name) for name in ResourceUtilization.activity_fields
+                    if len(self._recorded(name))}
+        return ResourceUtilization(
+            self.task_name,
+            int(self.max('max_memory')), int(self.max('total_memory')),
+            int(self.max('max_disk')), int(self.max('total_disk')),
+            bool(self.robust.any()), **activity)
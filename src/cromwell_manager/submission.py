@@ -0,0 +1,92 @@
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .io_util import load_bytes, bundle_workflow_dependencies
+
+# SubmissionBundle field: name of the corresponding part of cromwell's submission form
+_form_fields = OrderedDict([
+    ('wdl', 'wdlSource'),
+    ('options', 'workflowOptions'),
+    ('labels', 'customLabels'),
+    ('dependencies', 'wdlDependencies'),
+])
+
+
+def load_dependencies(workflow_dependencies, storage_client=None):
+    """Load a workflow's dependencies as a zip archive.
+
+    :param str | dict workflow_dependencies: dict of (name, path) pairs, which are zipped with
+      `bundle_workflow_dependencies`, or a path to a pre-zipped dependency archive
+    :param google.cloud.storage.Client storage_client: (optional) authenticated google storage
+      client, used for google storage paths
+    :return bytes | None: zip archive, or None if workflow_dependencies is None
+    """
+    if workflow_dependencies is None:
+        return None
+    elif isinstance(workflow_dependencies, dict):
+        return bundle_workflow_dependencies(workflow_dependencies, storage_client)
+    elif isinstance(workflow_dependencies, str) and workflow_dependencies.endswith('.zip'):
+        return load_bytes(workflow_dependencies, storage_client)
+    raise TypeError(
+        'if provided, workflow_dependencies must be a dict containing (name, value) pairs, or a '
+        'path to a pre-zipped dependency archive, not %s' % workflow_dependencies)
+
+
+class SubmissionBundle(namedtuple('SubmissionBundle', ['wdl', 'options', 'dependencies',
+                                                       'labels'])):
+    """The parts of a workflow submission that are shared by every set of inputs.
+
+    A bundle holds the wdl, options, dependency archive and labels of a submission as bytes, so
+    they are downloaded, read and serialized once, however many workflows are submitted with
+    them. Bundles are immutable and can be shared between threads::
+
+        bundle = SubmissionBundle.load('gs://bucket/pipeline.wdl', options_json=options,
+                                       workflow_dependencies={'tasks.wdl': 'tasks.wdl'})
+        workflows = [Workflow.from_submission(bundle, inputs, cromwell, client)
+                     for inputs in sample_inputs]
+        results = cromwell.batch((bundle, inputs) for inputs in sample_inputs)
+
+    Bundles with equal contents compare equal, so `Cromwell.batch` groups their submissions into
+    the same batch requests.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def load(cls, wdl, options_json=None, workflow_dependencies=None, custom_labels=None,
+             storage_client=None):
+        """Load the parts of a submission, concurrently.
+
+        :param str | dict wdl: google storage, http(s), or local path of the wdl
+        :param str | dict options_json: (optional) workflow options, as a dictionary or a path
+        :param str | dict workflow_dependencies: (optional) dict of (name, path) pairs, or a path
+          to a pre-zipped dependency archive
+        :param str | dict custom_labels: (optional) workflow labels, as a dictionary or a path
+        :param google.cloud.storage.Client storage_client: (optional) authenticated google
+          storage client, used for google storage paths
+        :return SubmissionBundle: loaded bundle
+        """
+        if wdl is None:
+            raise ValueError('parameter wdl is required.')
+        sources = (wdl, options_json, custom_labels)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            dependencies = executor.submit(
+                load_dependencies, workflow_dependencies, storage_client)
+            wdl, options, labels = executor.map(
+                lambda source: None if source is None else load_bytes(source, storage_client),
+                sources)
+            return cls(wdl, options, dependencies.result(), labels)
+
+    def files(self, inputs_json=None, storage_client=None):
+        """Parts of cromwell's submission form, as accepted by `Cromwell.submit`.
+
+        :param str | dict inputs_json: (optional) workflow inputs, as a dictionary or a path
+        :param google.cloud.storage.Client storage_client: (optional) authenticated google
+          storage client, used if inputs_json is a google storage path
+        :return OrderedDict: form field name mapped to bytes, for each part that is not None
+        """
+        files = OrderedDict(
+            (name, getattr(self, field)) for field, name in _form_fields.items()
+            if getattr(self, field) is not None)
+        if inputs_json is not None:
+            files['workflowInputs'] = load_bytes(inputs_json, storage_client)
+        return files
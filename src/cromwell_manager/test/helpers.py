@@ -0,0 +1,8 @@
+class Clock:
+    """Fake monotonic clock for the time-based tests; advance it by setting `time`."""
+
+    def __init__(self):
+        self.time = 0.
+
+    def __call__(self):
+        return self.time
@@ -0,0 +1,107 @@
+import json
+import asyncio
+import unittest
+from aiohttp import web
+from cromwell_manager.async_cromwell import AsyncCromwell
+from cromwell_manager.resilience import RetryPolicy
+
+
+class FakeCromwell:
+    """Local aiohttp server answering a few cromwell endpoints, recording what it receives."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.submissions = []  # form fields received by each submit request
+        self.throttled = 0  # number of submit requests still to answer with 429
+        self.metadata_queries = []  # query string of each metadata request
+        app = web.Application()
+        app.router.add_get('/api/workflows/v1/{id}/status', self.status)
+        app.router.add_get('/api/workflows/v1/{id}/metadata', self.metadata)
+        app.router.add_post('/api/workflows/v1', self.submit)
+        self.runner = web.AppRunner(app)
+
+    async def start(self):
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        return 'http://%s:%d' % (host, port)
+
+    async def status(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.02)
+        finally:
+            self.in_flight -= 1
+        workflow_id = request.match_info['id']
+        if workflow_id == 'garbled':
+            return web.Response(text='<html>bad gateway</html>')
+        if workflow_id == 'missing':
+            return web.json_response(
+                {'status': 'fail', 'message': 'Unrecognized workflow ID'}, status=404)
+        return web.json_response({'id': workflow_id, 'status': 'Running'})
+
+    async def metadata(self, request):
+        self.metadata_queries.append(request.query_string)
+        return web.json_response({'id': request.match_info['id']})
+
+    async def submit(self, request):
+        form = await request.post()
+        self.submissions.append({name: form[name].file.read() for name in form})
+        if self.throttled:
+            self.throttled -= 1
+            return web.Response(status=429, headers={'Retry-After': '0'})
+        return web.json_response({'id': 'new', 'status': 'Submitted'}, status=201)
+
+
+class TestAsyncCromwell(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = FakeCromwell()
+        url = await self.server.start()
+        self.cromwell = AsyncCromwell(url, max_concurrency=3,
+                                      retry_policy=RetryPolicy(backoff=0))
+
+    async def asyncTearDown(self):
+        await self.cromwell.close()
+        await self.server.runner.cleanup()
+
+    async def test_concurrency_is_bounded(self):
+        ids = [str(i) for i in range(12)]
+        statuses = await self.cromwell.statuses(ids)
+        self.assertEqual([s['id'] for s in statuses], ids)
+        self.assertEqual(self.server.max_in_flight, 3)
+
+    async def test_gather_json_errors(self):
+        # error responses are returned in place, as cromwell's json error documents
+        statuses = await self.cromwell.statuses(['a', 'missing', 'b'])
+        self.assertEqual(statuses[1]['status'], 'fail')
+        self.assertEqual(statuses[2]['id'], 'b')
+
+        # a response that is not json fails the whole call
+        with self.assertRaises(json.JSONDecodeError):
+            await self.cromwell.statuses(['a', 'garbled'])
+
+    async def test_metadata_keys(self):
+        documents = await self.cromwell.metadata_many(
+            ['a', 'b'], include_keys=['status', 'calls'], expand_subworkflows=True)
+        self.assertEqual([d['id'] for d in documents], ['a', 'b'])
+        self.assertEqual(self.server.metadata_queries, 2 * [
+            'includeKey=status&includeKey=calls&expandSubWorkflows=true'])
+        with self.assertRaises(ValueError):
+            await self.cromwell.metadata('a', include_keys=['status'], exclude_keys=['calls'])
+
+    async def test_form_is_rebuilt_for_each_attempt(self):
+        self.server.throttled = 2
+        files = {'wdlSource': b'workflow w {}', 'workflowInputs': b'{}'}
+        response = await self.cromwell.submit(files, wait=False)
+        self.assertEqual(response.status, 201)
+        self.assertEqual(len(self.server.submissions), 3)
+        for submission in self.server.submissions:
+            self.assertEqual(submission, files)
+
+
+if __name__ == '__main__':
+    unittest.main()
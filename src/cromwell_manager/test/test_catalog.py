@@ -0,0 +1,68 @@
+import unittest
+from cromwell_manager.catalog import WorkflowCatalog, _TimeIndex
+
+
+def record(workflow_id, status='Succeeded', name='Count', day=1, labels=None):
+    return {
+        'id': workflow_id, 'status': status, 'name': name,
+        'submission': '2017-10-%02dT00:00:00.000Z' % day,
+        'start': '2017-10-%02dT00:01:00.000Z' % day,
+        'end': '2017-10-%02dT02:00:00.000Z' % day if status != 'Running' else None,
+        'labels': labels or {},
+    }
+
+
+class TestWorkflowCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = WorkflowCatalog()
+        self.catalog.add(record('a', 'Failed', day=1, labels={'project': 'x'}))
+        self.catalog.add(record('b', 'Failed', day=8, labels={'project': 'x'}), backend='JES')
+        self.catalog.add(record('c', 'Succeeded', day=9, labels={'project': 'y'}))
+        self.catalog.add(record('d', 'Failed', name='Align', day=9, labels={'project': 'x'}))
+        self.catalog.add(record('e', 'Running', day=10))
+
+    def test_select_combines_criteria(self):
+        selected = self.catalog.select(
+            status='Failed', name='Count', labels={'project': 'x'},
+            submitted_after='2017-10-03T00:00:00Z')
+        self.assertEqual([r.id for r in selected], ['b'])
+
+    def test_select_multiple_values_and_ordering(self):
+        selected = self.catalog.select(status=['Succeeded', 'Running'])
+        self.assertEqual([r.id for r in selected], ['c', 'e'])
+        self.assertEqual(len(self.catalog.select()), 5)
+
+    def test_time_ranges_are_inclusive(self):
+        selected = self.catalog.select(ended_before='2017-10-09T02:00:00Z')
+        self.assertEqual([r.id for r in selected], ['a', 'b', 'c', 'd'])
+
+    def test_backend(self):
+        self.assertEqual([r.id for r in self.catalog.select(backend='JES')], ['b'])
+
+    def test_replacing_a_record_updates_indices(self):
+        self.catalog.add(record('e', 'Succeeded', day=10))
+        self.assertEqual(self.catalog.select(status='Running'), [])
+        self.assertEqual([r.id for r in self.catalog.select(ended_after=1507600000)], ['e'])
+
+
+class TestTimeIndex(unittest.TestCase):
+
+    def test_updates_are_applied_before_searching(self):
+        index = _TimeIndex()
+        for i in reversed(range(100)):
+            index.add('wf-%d' % i, i)
+        index.remove('wf-50', 50)
+        index.remove('wf-20', 20)
+        index.add('wf-20', 20)  # re-added before the index was searched
+        index.remove('wf-10', 10)
+        index.add('wf-10', 95)  # moved
+        self.assertEqual(index.between(9, 20), {'wf-%d' % i for i in range(9, 21) if i != 10})
+        self.assertEqual(index.between(49, 51), {'wf-49', 'wf-51'})
+        self.assertEqual(index.between(95, None), {'wf-95', 'wf-96', 'wf-97', 'wf-98', 'wf-99',
+                                                   'wf-10'})
+        self.assertEqual(len(index._keys), 99)
+
+
+if __name__ == "__main__":
+    unittest.main()
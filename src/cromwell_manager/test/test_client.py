@@ -0,0 +1,345 @@
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+import unittest
+from io import BytesIO, StringIO
+from contextlib import redirect_stdout
+from unittest import mock
+import aiohttp
+import requests
+from cromwell_manager.cromwell import Cromwell, BatchResult
+from cromwell_manager.submission import SubmissionBundle
+from cromwell_manager.metadata_store import MetadataStore
+from cromwell_manager.async_cromwell import AsyncCromwell
+from cromwell_manager.resilience import RetryPolicy, CircuitBreaker, CircuitOpenError
+from cromwell_manager.ratelimit import RateLimiter, AdaptiveConcurrency
+from cromwell_manager.test.helpers import Clock
+
+
+def make_response(status_code=200, content=b'{}', headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.raw = BytesIO(content)
+    response.headers.update(headers or {})
+    return response
+
+
+def make_cromwell(**kwargs):
+    """Create a Cromwell object without contacting a server; set its session.request to
+    control the responses of subsequent requests."""
+    with mock.patch.object(Cromwell, 'server_is_running', return_value=True):
+        return Cromwell('http://cromwell.test', **kwargs)
+
+
+def half_open_breaker():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.time = 10
+    return breaker
+
+
+class TestEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.cromwell = make_cromwell()
+        self.urls = []
+
+        def respond(method, url, **kwargs):
+            self.urls.append(url)
+            return make_response(200, b'{"id": "wf-1"}')
+
+        patch = mock.patch.object(self.cromwell.session, 'request', respond)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_metadata_keys(self):
+        self.cromwell.metadata('wf-1', include_keys=['status', 'calls'], expand_subworkflows=True)
+        self.assertEqual(self.urls[-1], self.cromwell.url_prefix + '/wf-1/metadata?'
+                         'includeKey=status&includeKey=calls&expandSubWorkflows=true')
+        self.assertRaises(ValueError, self.cromwell.metadata, 'wf-1', include_keys=['status'],
+                          exclude_keys=['calls'])
+
+    def test_metadata_positional_args_are_passed_to_get(self):
+        with redirect_stdout(StringIO()) as output:
+            self.cromwell.metadata('wf-1', True)  # verbose
+        self.assertEqual(self.urls[-1], self.cromwell.url_prefix + '/wf-1/metadata')
+        self.assertIn('GET Request', output.getvalue())
+
+    def test_stored_metadata_keys(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cromwell.metadata_store = MetadataStore(os.path.join(directory, 'metadata.db'))
+        self.addCleanup(self.cromwell.metadata_store.close)
+        self.cromwell.metadata_store.put('wf-1', {
+            'id': 'wf-1', 'status': 'Succeeded', 'backend': 'Local', 'calls': {
+                'w.a': [{'shardIndex': 0, 'backend': 'JES'}],
+                'w.b': [{'shardIndex': 0}]}})
+
+        # keys are matched at every level, as cromwell matches them
+        response = self.cromwell.metadata('wf-1', include_keys=['backend'])
+        self.assertEqual(response.json(), {
+            'id': 'wf-1', 'backend': 'Local', 'calls': {'w.a': [{'backend': 'JES'}]}})
+        self.assertEqual(self.urls, [])
+
+    def test_query_pages(self):
+        self.cromwell.query(status=['Running'], page=2, page_size=50)
+        self.assertEqual(self.urls[-1], self.cromwell.url_prefix +
+                         '/query?status=Running&page=2&pageSize=50')
+
+    def test_query_fields(self):
+        self.cromwell.query(names=['w'], submission='2018-01-01T00:00:00Z',
+                            additional_fields=['labels'])
+        self.assertEqual(self.urls[-1], self.cromwell.url_prefix + '/query?name=w&'
+                         'submission=2018-01-01T00:00:00Z&additionalQueryResultFields=labels')
+
+        with redirect_stdout(StringIO()) as output:
+            self.cromwell.query(None, None, ['w'], None, None, None, True)  # verbose
+        self.assertEqual(self.urls[-1], self.cromwell.url_prefix + '/query?name=w')
+        self.assertIn('GET Request', output.getvalue())
+
+
+class TestSession(unittest.TestCase):
+
+    def test_pooled_adapter(self):
+        cromwell = make_cromwell(pool_connections=2, pool_maxsize=16, pool_block=True)
+        for prefix in ('http://', 'https://'):
+            adapter = cromwell.session.get_adapter(prefix + 'cromwell.test')
+            self.assertEqual((adapter._pool_connections, adapter._pool_maxsize,
+                              adapter._pool_block), (2, 16, True))
+
+    def test_close(self):
+        cromwell = make_cromwell()
+        with mock.patch.object(cromwell.session, 'close') as close:
+            cromwell.close()
+        close.assert_called_once_with()
+
+        with mock.patch.object(requests.Session, 'close') as close:
+            with make_cromwell() as cromwell:
+                self.assertIsInstance(cromwell, Cromwell)
+                close.assert_not_called()
+        close.assert_called_once_with()
+
+    def test_invalid_pool_arguments(self):
+        for kwargs in ({'pool_connections': 0}, {'pool_maxsize': -1},
+                       {'pool_maxsize': 2.5}, {'pool_connections': '4'}):
+            self.assertRaises(ValueError, make_cromwell, **kwargs)
+
+
+class TestRequestLimits(unittest.TestCase):
+
+    def test_open_circuit_frees_concurrency_slot(self):
+        concurrency = AdaptiveConcurrency(initial=1)
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+        cromwell = make_cromwell(circuit_breaker=breaker,
+                                 rate_limiter=RateLimiter(concurrency=concurrency))
+        breaker.record_failure()
+        self.assertRaises(CircuitOpenError, cromwell.get, cromwell.cromwell_url)
+        self.assertEqual(concurrency.in_flight, 0)
+
+    def test_interrupted_limiter_wait_keeps_trial_available(self):
+        breaker = half_open_breaker()
+        limiter = RateLimiter(budget=1, burst=1)
+        limiter.budget.reserve()  # the next request waits about a second for its token
+        cromwell = AsyncCromwell('http://cromwell.test', circuit_breaker=breaker,
+                                 rate_limiter=limiter,
+                                 retry_policy=RetryPolicy(max_attempts=1))
+
+        async def interrupt():
+            await asyncio.wait_for(
+                cromwell.post(cromwell.url_prefix, form={'wdlSource': b''}), 0.05)
+
+        self.assertRaises(asyncio.TimeoutError, asyncio.run, interrupt())
+        self.assertTrue(breaker.before_request())  # the trial was not claimed by the request
+
+    def test_abandoned_request_releases_trial_and_slot(self):
+        breaker = half_open_breaker()
+        concurrency = AdaptiveConcurrency(initial=1)
+        cromwell = AsyncCromwell('http://cromwell.test', circuit_breaker=breaker,
+                                 rate_limiter=RateLimiter(concurrency=concurrency))
+
+        async def request():
+            await cromwell.post(cromwell.url_prefix, form={'wdlSource': b''})
+
+        # building the form fails after the trial and the concurrency slot were taken
+        with mock.patch.object(aiohttp.FormData, 'add_field', side_effect=ValueError):
+            self.assertRaises(ValueError, asyncio.run, request())
+        self.assertEqual(concurrency.in_flight, 0)
+        self.assertTrue(breaker.before_request())
+
+    def test_interrupted_request_is_not_a_failure(self):
+        breaker = half_open_breaker()
+        concurrency = AdaptiveConcurrency(initial=2)
+        cromwell = make_cromwell(circuit_breaker=breaker,
+                                 rate_limiter=RateLimiter(concurrency=concurrency))
+        with mock.patch.object(cromwell.session, 'request', side_effect=KeyboardInterrupt):
+            self.assertRaises(KeyboardInterrupt, cromwell.get, cromwell.cromwell_url)
+        self.assertEqual((concurrency.in_flight, concurrency.limit), (0, 2))
+        self.assertTrue(breaker.before_request())
+
+    def test_cancelled_request_is_not_a_failure(self):
+        breaker = half_open_breaker()
+        concurrency = AdaptiveConcurrency(initial=2)
+        cromwell = AsyncCromwell('http://cromwell.test', circuit_breaker=breaker,
+                                 rate_limiter=RateLimiter(concurrency=concurrency))
+
+        class Hang:
+            async def __aenter__(self):
+                await asyncio.sleep(60)
+
+            async def __aexit__(self, *exc_info):
+                pass
+
+        async def cancel():
+            await asyncio.wait_for(cromwell.get(cromwell.cromwell_url), 0.05)
+
+        cromwell._session = mock.Mock(closed=False, request=mock.Mock(return_value=Hang()))
+        self.assertRaises(asyncio.TimeoutError, asyncio.run, cancel())
+        self.assertEqual((concurrency.in_flight, concurrency.limit), (0, 2))
+        self.assertTrue(breaker.before_request())
+
+
+class TestRequestRetries(unittest.TestCase):
+
+    def setUp(self):
+        self.cromwell = make_cromwell(retry_policy=RetryPolicy(max_attempts=4, backoff=0))
+        self.url = self.cromwell.url_prefix + '/wf-1/status'
+
+    def request(self, side_effect, method='get', *args, **kwargs):
+        with mock.patch.object(self.cromwell.session, 'request', side_effect=side_effect) as m:
+            try:
+                return getattr(self.cromwell, method)(self.url, *args, **kwargs)
+            finally:
+                self.calls = m.call_args_list
+
+    def test_retries_unavailable_server(self):
+        response = self.request([make_response(503, headers={'Retry-After': '0'}),
+                                 make_response(200)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_connection_errors(self):
+        error = requests.ConnectionError('connection reset')
+        self.assertEqual(self.request([error, make_response(200)]).status_code, 200)
+        self.assertEqual(len(self.calls), 2)
+
+        # a submission may have reached the server, so it is not sent again
+        self.assertRaises(requests.ConnectionError, self.request, [error, make_response(201)],
+                          'post', files={'wdlSource': BytesIO(b'workflow w {}')})
+        self.assertEqual(len(self.calls), 1)
+
+    def test_files_rewound_before_retry(self):
+        sent = []
+
+        def respond(method, url, files=None, **kwargs):
+            sent.append(files['wdlSource'].read())
+            return make_response(429 if len(sent) == 1 else 201)
+
+        response = self.request(respond, 'post', files={'wdlSource': BytesIO(b'workflow w {}')})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sent, [b'workflow w {}'] * 2)
+
+    def test_long_retry_after_returns_response(self):
+        response = self.request([make_response(429, headers={'Retry-After': '3600'})])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_circuit_open_error_propagates(self):
+        self.cromwell.circuit_breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+        self.assertRaises(CircuitOpenError, self.request, lambda *a, **k: make_response(503))
+        self.assertEqual(len(self.calls), 2)  # the third attempt was not sent
+
+
+class FakeSubmissions:
+    """Stands in for Session.request, answering cromwell's submit and batch endpoints."""
+
+    def __init__(self, batch_status=None):
+        self.batch_status = batch_status  # status of every batch request, e.g. 404
+        self.requests = []  # (endpoint, wdl, inputs) of each request
+        self.n_submitted = 0
+
+    def __call__(self, method, url, files=None, **kwargs):
+        wdl, inputs = files['wdlSource'].decode(), json.loads(files['workflowInputs'])
+        endpoint = 'batch' if url.endswith('/batch') else 'submit'
+        self.requests.append((endpoint, wdl, inputs))
+        if endpoint == 'batch' and self.batch_status is not None:
+            return make_response(self.batch_status)
+        if 'reject' in wdl:
+            return make_response(400)
+        ids = []
+        for _ in inputs if endpoint == 'batch' else [inputs]:
+            self.n_submitted += 1
+            ids.append({'id': 'wf-%d' % self.n_submitted, 'status': 'Submitted'})
+        return make_response(201, json.dumps(ids if endpoint == 'batch' else ids[0]).encode())
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.wdl = {}
+        for name in ('first', 'second', 'reject'):
+            self.wdl[name] = os.path.join(self.directory, name + '.wdl')
+            with open(self.wdl[name], 'w') as f:
+                f.write('workflow %s {}' % name)
+        self.cromwell = make_cromwell()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def batch(self, server, submissions, **kwargs):
+        with mock.patch.object(self.cromwell.session, 'request', server):
+            return self.cromwell.batch(submissions, max_workers=1, **kwargs)
+
+    def test_falls_back_to_single_submits(self):
+        submissions = [(self.wdl['first'], {'n': i}) for i in range(3)]
+        for status in (404, 405):
+            server = FakeSubmissions(batch_status=status)
+            results = self.batch(server, submissions)
+            self.assertEqual([r.workflow_id for r in results], ['wf-1', 'wf-2', 'wf-3'])
+            self.assertTrue(all(r.succeeded for r in results))
+            # one probe of the batch endpoint, then each workflow on its own
+            self.assertEqual([e for e, _, _ in server.requests], ['batch'] + ['submit'] * 3)
+            self.assertEqual([i for _, _, i in server.requests[1:]], [{'n': i} for i in range(3)])
+
+    def test_groups_by_bundle(self):
+        bundle = SubmissionBundle(b'workflow bundled {}', None, None, None)
+        submissions = [(self.wdl['first'], {'n': 0}), (self.wdl['second'], {'n': 1}),
+                       (bundle, {'n': 2}), (self.wdl['first'], {'n': 3}),
+                       (SubmissionBundle(b'workflow bundled {}', None, None, None), {'n': 4}),
+                       (self.wdl['first'], {'n': 5})]
+        server = FakeSubmissions()
+        results = self.batch(server, submissions, batch_size=2)
+        self.assertEqual(server.requests, [
+            ('batch', 'workflow first {}', [{'n': 0}, {'n': 3}]),
+            ('batch', 'workflow first {}', [{'n': 5}]),
+            ('batch', 'workflow second {}', [{'n': 1}]),
+            ('batch', 'workflow bundled {}', [{'n': 2}, {'n': 4}])])
+        self.assertEqual([r.index for r in results], list(range(6)))
+        self.assertEqual([r.workflow_id for r in results],
+                         ['wf-1', 'wf-4', 'wf-5', 'wf-2', 'wf-6', 'wf-3'])
+
+    def test_per_item_errors(self):
+        missing = os.path.join(self.directory, 'missing.json')
+        submissions = [(self.wdl['first'], {'n': 0}),
+                       (self.wdl['first'],),  # no inputs
+                       (self.wdl['first'], missing),
+                       (self.wdl['reject'], {'n': 3}),
+                       (os.path.join(self.directory, 'missing.wdl'), {'n': 4})]
+        for use_batch_endpoint in (True, False):
+            results = self.batch(FakeSubmissions(), submissions,
+                                 use_batch_endpoint=use_batch_endpoint)
+            self.assertIsInstance(results[0], BatchResult)
+            self.assertEqual([r.succeeded for r in results], [True, False, False, False, False])
+            self.assertIn('ValueError', results[1].error)
+            self.assertIn('FileNotFoundError', results[2].error)
+            self.assertEqual(results[3].status_code, 400)
+            self.assertIn('FileNotFoundError', results[4].error)
+            self.assertIsNone(results[4].status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import io
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from google.cloud import storage
+from cromwell_manager.workflow import Workflow
+from cromwell_manager.export import columns, iter_resource_utilization, export_resource_utilization
+from cromwell_manager.resource_utilization import ResourceUtilization
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def shard(index, task_name):
+    return {'shardIndex': index, 'labels': {'wdl-task-name': task_name}}
+
+
+metadata = {
+    'id': 'root',
+    'status': 'Succeeded',
+    'calls': {
+        'wf.align': [shard(0, 'align'), shard(1, 'align')],
+        'wf.sub': [{'shardIndex': 0, 'subWorkflowMetadata': {
+            'id': 'sub0',
+            'status': 'Succeeded',
+            'calls': {'sub.count': [shard(-1, 'count')]},
+        }}],
+    },
+}
+
+
+def workflow():
+    """Workflow tree whose align shards have (fake) retrieved utilization; count has no log."""
+    w = Workflow('root', None, storage.Client.create_anonymous_client(),
+                 metadata=json.loads(json.dumps(metadata)))
+    for i, s in enumerate(w.tasks['wf.align'].shards):
+        s._resource_utilization = ResourceUtilization(
+            'align', 100 * (i + 1), 1000, 10 * (i + 1), 100, True, max_cpu_percent=50.0)
+        s._fetched = True
+    return w
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_rows(self):
+        rows = list(iter_resource_utilization(workflow(), max_workers=1))
+        self.assertEqual([(r['task'], r['level'], r['shard_index']) for r in rows], [
+            ('wf.align', 'shard', 0), ('wf.align', 'shard', 1), ('wf.align', 'task', None),
+            ('sub.count', 'shard', -1), ('sub.count', 'task', None)])
+        self.assertEqual(rows[2]['max_memory'], 200)
+        self.assertEqual(rows[2]['max_cpu_percent'], 50.0)
+        self.assertEqual((rows[3]['subworkflow_path'], rows[3]['subworkflow_id']),
+                         ('wf.sub[0]', 'sub0'))
+        self.assertIsNone(rows[4]['max_memory'])
+        self.assertEqual(set(rows[0]), set(columns))
+
+    def test_csv_and_jsonl(self):
+        path = os.path.join(self.directory, 'utilization.csv')
+        self.assertEqual(export_resource_utilization(workflow(), path, tasks=False), 3)
+        with open(path) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([r['max_memory'] for r in rows], ['100', '200', ''])
+
+        buffer = io.StringIO()
+        export_resource_utilization(workflow(), buffer, format='jsonl', shards=False)
+        rows = [json.loads(line) for line in buffer.getvalue().splitlines()]
+        self.assertEqual([r['task'] for r in rows], ['wf.align', 'sub.count'])
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+        path = os.path.join(self.directory, 'utilization.parquet')
+        self.assertEqual(export_resource_utilization(workflow(), path), 5)
+        table = pq.read_table(path)
+        self.assertEqual(table.column_names, list(columns))
+        self.assertEqual(table.column('shard_index').to_pylist(), [0, 1, None, -1, None])
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, export_resource_utilization, workflow(), 'out.txt')
+        self.assertRaises(ValueError, export_resource_utilization, workflow(), io.StringIO())
+
+    def test_save_resource_utilization_closes_file(self):
+        path = os.path.join(self.directory, 'utilization.txt')
+        workflow().save_resource_utilization(path, retrieve=False)
+        with open(path) as f:
+            self.assertEqual(f.read().count('Monitoring Summary'), 1)
+
+    def test_retrieve_refreshes_subworkflows(self):
+        w = workflow()
+        self.assertEqual(list(w.subworkflows[0].tasks), ['sub.count'])
+
+        current = json.loads(json.dumps(metadata))
+        current['calls']['wf.sub'][0]['subWorkflowMetadata']['calls'] = {
+            'sub.count': [shard(-1, 'count')], 'sub.merge': [shard(-1, 'merge')]}
+        server = mock.Mock()
+        server.metadata.return_value.json.return_value = current
+        w._cromwell_server = server
+
+        w.export_resource_utilization(io.StringIO(), format='jsonl', shards=False)
+        server.metadata.assert_called_once_with(
+            'root', include_keys=None, exclude_keys=None, expand_subworkflows=True)
+        self.assertEqual(sorted(w.subworkflows[0].tasks), ['sub.count', 'sub.merge'])
+
+
+if __name__ == '__main__':
+    unittest.main()
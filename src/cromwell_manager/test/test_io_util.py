@@ -0,0 +1,50 @@
+import os
+import io
+import shutil
+import zipfile
+import tempfile
+import unittest
+from cromwell_manager import io_util
+from cromwell_manager.io_util import bundle_workflow_dependencies, package_workflow_dependencies
+
+
+class TestBundleWorkflowDependencies(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.paths = {}
+        for name in ('tasks.wdl', 'structs.wdl', 'utils.wdl'):
+            self.paths[name] = os.path.join(self.directory, name)
+            with open(self.paths[name], 'w') as f:
+                f.write('task %s {}\n' % name)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_archive_contents(self):
+        with zipfile.ZipFile(io.BytesIO(bundle_workflow_dependencies(self.paths))) as archive:
+            self.assertEqual(archive.namelist(), sorted(self.paths))
+            self.assertEqual(archive.read('tasks.wdl'), b'task tasks.wdl {}\n')
+
+        with package_workflow_dependencies(**self.paths) as f:
+            self.assertTrue(zipfile.is_zipfile(f))
+
+    def test_memoized_by_contents(self):
+        first = bundle_workflow_dependencies(self.paths, max_workers=1)
+        self.assertIs(bundle_workflow_dependencies(dict(self.paths)), first)
+
+        with open(self.paths['utils.wdl'], 'a') as f:
+            f.write('# changed\n')
+        changed = bundle_workflow_dependencies(self.paths)
+        self.assertNotEqual(changed, first)
+        self.assertLessEqual(len(io_util._archives), io_util._max_archives)
+
+    def test_invalid_dependencies(self):
+        self.assertRaises(TypeError, bundle_workflow_dependencies, ['tasks.wdl'])
+        self.assertRaises(TypeError, bundle_workflow_dependencies, {'tasks.wdl': None})
+        self.assertRaises(FileNotFoundError, bundle_workflow_dependencies,
+                          {'missing.wdl': os.path.join(self.directory, 'missing.wdl')})
+
+
+if __name__ == '__main__':
+    unittest.main()
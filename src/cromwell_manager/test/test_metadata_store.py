@@ -0,0 +1,52 @@
+import os
+import unittest
+import tempfile
+from cromwell_manager.metadata_store import MetadataStore
+
+
+def metadata(workflow_id, status='Succeeded', padding=0):
+    return {'id': workflow_id, 'status': status, 'calls': {}, 'padding': os.urandom(padding).hex()}
+
+
+class TestMetadataStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'metadata.sqlite')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_round_trip(self):
+        with MetadataStore(self.path) as store:
+            self.assertTrue(store.put('a', metadata('a')))
+            self.assertEqual(store.get('a'), metadata('a'))
+            self.assertIn('a', store)
+            self.assertIsNone(store.get('a', expanded=True))
+
+    def test_only_terminal_workflows_are_stored(self):
+        with MetadataStore(self.path) as store:
+            self.assertFalse(store.put('a', metadata('a', status='Running')))
+            self.assertIsNone(store.get('a'))
+            self.assertEqual(len(store), 0)
+
+    def test_persists_across_instances(self):
+        with MetadataStore(self.path) as store:
+            store.put('a', metadata('a', status='Failed'))
+        with MetadataStore(self.path) as store:
+            self.assertEqual(store.get('a')['status'], 'Failed')
+
+    def test_least_recently_used_is_evicted(self):
+        with MetadataStore(self.path, max_bytes=4000) as store:
+            for workflow_id in 'abc':
+                store.put(workflow_id, metadata(workflow_id, padding=1000))
+            store.get('a')  # mark as recently used
+            store.put('d', metadata('d', padding=1000))
+            self.assertLessEqual(store.size, 4000)
+            self.assertIn('a', store)
+            self.assertIn('d', store)
+            self.assertNotIn('b', store)
+
+
+if __name__ == "__main__":
+    unittest.main()
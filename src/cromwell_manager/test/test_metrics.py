@@ -0,0 +1,61 @@
+import json
+import unittest
+from cromwell_manager.metrics import MetricsRegistry, RequestEvent
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        self.events = []
+        self.metrics.add_hook(self.events.append)
+        self.metrics.observe('status', 'GET', 'http://cromwell/status', 503, 0.02, 10)
+        self.metrics.observe('status', 'GET', 'http://cromwell/status', 200, 0.2, 300, attempt=2)
+        self.metrics.observe('metadata', 'GET', 'http://cromwell/metadata', None, 60,
+                             error='ReadTimeout')
+
+    def test_hooks(self):
+        self.assertEqual(len(self.events), 3)
+        self.assertIsInstance(self.events[0], RequestEvent)
+        self.assertTrue(self.events[0].failed)
+        self.assertFalse(self.events[1].failed)
+        self.assertEqual(self.events[2].error, 'ReadTimeout')
+
+        self.metrics.remove_hook(self.events.append)
+        self.metrics.observe(None, 'GET', 'http://cromwell/', 200, 0.01)
+        self.assertEqual(len(self.events), 3)
+        self.assertRaises(TypeError, self.metrics.add_hook, 'print')
+
+    def test_snapshot(self):
+        snapshot = json.loads(self.metrics.to_json())
+        status = snapshot['status']
+        self.assertEqual(status['requests'], {'GET': {'200': 1, '503': 1}})
+        self.assertEqual((status['errors'], status['retries']), (1, 1))
+        self.assertEqual(status['latency_seconds']['count'], 2)
+        self.assertAlmostEqual(status['latency_seconds']['sum'], 0.22)
+        self.assertEqual(dict((str(b), c) for b, c in status['latency_seconds']['buckets'])
+                         ['0.025'], 1)
+        self.assertEqual(status['response_bytes']['sum'], 310)
+        self.assertEqual(snapshot['metadata']['requests'], {'GET': {'error': 1}})
+        self.assertEqual(snapshot['metadata']['response_bytes']['count'], 0)
+
+        self.metrics.reset()
+        self.assertEqual(self.metrics.snapshot(), {})
+
+    def test_prometheus(self):
+        text = self.metrics.to_prometheus()
+        lines = text.splitlines()
+        self.assertIn(
+            'cromwell_client_requests_total{endpoint="status",method="GET",status="503"} 1', lines)
+        self.assertIn('cromwell_client_request_errors_total{endpoint="metadata"} 1', lines)
+        self.assertIn('cromwell_client_request_retries_total{endpoint="status"} 1', lines)
+        self.assertIn('cromwell_client_request_duration_seconds_bucket'
+                      '{endpoint="status",le="0.25"} 2', lines)
+        self.assertIn('cromwell_client_request_duration_seconds_bucket'
+                      '{endpoint="metadata",le="+Inf"} 1', lines)
+        self.assertIn('cromwell_client_response_size_bytes_count{endpoint="status"} 2', lines)
+        self.assertTrue(text.endswith('\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from google.cloud import storage
+from cromwell_manager import io_util
+from cromwell_manager.io_util import ObjectCache, GSObject
+from cromwell_manager.calledtask import Shard
+
+
+class FakeBlob:
+    """Stands in for a google storage blob, counting the requests made for its content."""
+
+    def __init__(self, data, md5_hash='checksum', generation=1):
+        self.data = data
+        self.size = len(data)
+        self.md5_hash = md5_hash
+        self.generation = generation
+        self.requests = 0
+
+    def download_as_string(self, start=None, end=None):
+        self.requests += 1
+        if start is None:
+            return self.data
+        return self.data[start:end + 1]
+
+
+def gs_object(blob, cache):
+    gs = GSObject('gs://bucket/path/to/log.txt', storage.Client.create_anonymous_client(),
+                  cache=cache)
+    gs._blob, gs._blob_loaded = blob, True
+    return gs
+
+
+class TestObjectCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ObjectCache(self.directory, max_bytes=100)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_get(self):
+        key = ObjectCache.key('md5', 'abc')
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, b'contents')
+        self.assertIn(key, self.cache)
+        self.assertEqual(self.cache.get(key), b'contents')
+        self.assertEqual((len(self.cache), self.cache.size), (1, 8))
+        self.cache.discard(key)
+        self.assertNotIn(key, self.cache)
+
+    def test_failed_write_is_not_stored(self):
+        key = ObjectCache.key('md5', 'abc')
+        with self.assertRaises(RuntimeError):
+            with self.cache.writer(key) as f:
+                f.write(b'partial')
+                raise RuntimeError
+        self.assertNotIn(key, self.cache)
+        self.assertEqual(len(os.listdir(os.path.join(self.directory, key[:2]))), 0)
+
+    def test_evicts_least_recently_used(self):
+        keys = [ObjectCache.key('md5', i) for i in range(3)]
+        for i, key in enumerate(keys):
+            self.cache.put(key, bytes(40))
+            os.utime(self.cache._path(key), (i, i))  # distinct, increasing use times
+        self.assertEqual([k in self.cache for k in keys], [False, True, True])
+
+        self.cache.get(keys[1])  # now the most recently used
+        os.utime(self.cache._path(keys[2]), (10, 10))
+        self.cache.put(ObjectCache.key('md5', 3), bytes(40))
+        self.assertEqual([k in self.cache for k in keys], [False, True, False])
+        self.assertLessEqual(self.cache.size, 100)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, ObjectCache, self.directory, max_bytes=0)
+        self.assertRaises(TypeError, GSObject, 'gs://bucket/key',
+                          storage.Client.create_anonymous_client(), cache='yes')
+
+
+class TestGSObjectCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ObjectCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_download_reads_through_cache(self):
+        blob = FakeBlob(b'abc')
+        self.assertEqual(gs_object(blob, self.cache).download_as_string(), 'abc')
+        self.assertEqual(gs_object(blob, self.cache).download_to_bytes_readable().read(), b'abc')
+        self.assertEqual(blob.requests, 1)
+
+        # new content is identified by its checksum
+        changed = FakeBlob(b'abcd', md5_hash='changed')
+        self.assertEqual(gs_object(changed, self.cache).download_as_string(), 'abcd')
+        self.assertEqual(gs_object(blob, False).download_as_string(), 'abc')
+        self.assertEqual(blob.requests, 2)
+
+    def test_iter_chunks_tees_into_cache(self):
+        blob = FakeBlob(b'0123456789', md5_hash=None)
+        chunks = list(gs_object(blob, self.cache).iter_chunks(chunk_size=4))
+        self.assertEqual(chunks, [b'0123', b'4567', b'89'])
+        self.assertEqual(blob.requests, 3)
+
+        self.assertEqual(b''.join(gs_object(blob, self.cache).iter_chunks(4)), b'0123456789')
+        self.assertEqual(list(gs_object(blob, self.cache).iter_chunks(4, start=8)), [b'89'])
+        self.assertEqual(blob.requests, 4)  # only the ranged read bypasses the cache
+
+    def test_abandoned_iteration_is_not_stored(self):
+        blob = FakeBlob(b'0123456789')
+        chunks = gs_object(blob, self.cache).iter_chunks(chunk_size=4)
+        next(chunks)
+        chunks.close()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_metadata_is_lazy(self):
+        gs = GSObject('gs://bucket/key', storage.Client.create_anonymous_client())
+        self.assertFalse(gs._blob_loaded)
+
+
+class TestShardLogsBypassCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ObjectCache(self.directory)
+        self.blob = FakeBlob(
+            b'Total Memory (MB): 2048\nTotal Disk Space (KB): 4194304\n'
+            b'* Memory usage (MB): 100\n* Disk usage (KB): 1000\n')
+        self.shard = Shard({'monitoringLog': 'gs://bucket/monitoring.log',
+                            'labels': {'wdl-task-name': 'task'}},
+                           storage.Client.create_anonymous_client())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shard_read_leaves_cache_unchanged(self):
+        with mock.patch.object(io_util, '_default_cache', self.cache), \
+                mock.patch.object(storage.Bucket, 'get_blob', return_value=self.blob):
+            self.assertEqual(self.shard.read_resource_utilization().max_memory, 100)
+            self.assertEqual(self.shard.update_resource_utilization().max_disk, 1000)
+        self.assertEqual(len(self.cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+from cromwell_manager.ratelimit import TokenBucket, AdaptiveConcurrency, RateLimiter
+from cromwell_manager.test.helpers import Clock
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_reserve(self):
+        clock = Clock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0, 0, 0.5, 1.0])
+        clock.time = 10  # refills up to the burst size, after repaying the debt
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0, 0, 0.5])
+
+    def test_acquire_async(self):
+        bucket = TokenBucket(rate=1000, burst=1)
+
+        async def acquire(n):
+            await asyncio.gather(*(bucket.acquire_async() for _ in range(n)))
+
+        asyncio.run(acquire(5))
+        self.assertLess(bucket.reserve(), 0.01)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, TokenBucket, 0)
+        self.assertRaises(ValueError, TokenBucket, 1, burst=0.5)
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.concurrency = AdaptiveConcurrency(
+            initial=3, maximum=4, target_latency=1, cooldown=5, clock=self.clock)
+
+    def test_limit(self):
+        for _ in range(3):
+            self.assertTrue(self.concurrency.try_acquire())
+        self.assertFalse(self.concurrency.try_acquire())
+        self.assertEqual(self.concurrency.in_flight, 3)
+
+    def test_additive_increase(self):
+        for _ in range(20):
+            self.concurrency.acquire()
+            self.concurrency.release(latency=0.1)
+        self.assertEqual(self.concurrency.limit, 4)
+
+    def test_multiplicative_decrease(self):
+        for _ in range(3):
+            self.concurrency.acquire()
+        self.assertEqual(self.concurrency.limit, 3)
+
+        self.concurrency.release(latency=2)  # too slow
+        self.concurrency.release(failed=True)  # within the cooldown: no further decrease
+        self.assertEqual(self.concurrency.limit, 1)
+        self.clock.time = 5
+        self.concurrency.release(failed=True)
+        self.assertEqual((self.concurrency.limit, self.concurrency.in_flight), (1, 0))
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, AdaptiveConcurrency, initial=0)
+        self.assertRaises(ValueError, AdaptiveConcurrency, initial=8, maximum=4)
+        self.assertRaises(ValueError, AdaptiveConcurrency, backoff=1)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_buckets(self):
+        limiter = RateLimiter(budget=10, rates={'metadata': 1, 'submit': 2})
+        self.assertEqual([b.rate for b in limiter._buckets('logs')], [1, 10])
+        self.assertEqual([b.rate for b in limiter._buckets('batch')], [2, 10])
+        self.assertEqual([b.rate for b in limiter._buckets('version')], [10])
+        self.assertEqual(RateLimiter()._buckets('status'), [])
+
+    def test_concurrency_feedback(self):
+        concurrency = AdaptiveConcurrency(initial=4, cooldown=0)
+        limiter = RateLimiter(concurrency=concurrency)
+        limiter.before_request('status')
+        limiter.after_request(0.1, 503)
+        self.assertEqual((concurrency.limit, concurrency.in_flight), (2, 0))
+        asyncio.run(limiter.before_request_async('metadata'))
+        limiter.after_request(None, None)  # connection error
+        self.assertEqual(concurrency.limit, 1)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, RateLimiter, rates={'workflows': 1})
+        self.assertRaises(TypeError, RateLimiter, concurrency=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
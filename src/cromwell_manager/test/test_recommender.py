@@ -0,0 +1,78 @@
+import json
+import unittest
+from cromwell_manager.recommender import ResourceRecommender, ResourceFit
+from cromwell_manager.resource_utilization import ResourceUtilization, UtilizationTimeSeries
+
+
+def utilization(max_memory, max_disk, mean_cpu_percent=None, cpu_samples=None):
+    time_series = None
+    if cpu_samples is not None:
+        time_series = UtilizationTimeSeries(
+            {'cpu_percent': (range(len(cpu_samples)), cpu_samples)})
+    return ResourceUtilization(
+        'task', max_memory, 8192, max_disk, 100 * 1024 ** 2, True, time_series=time_series,
+        max_cpu_percent=100.0 if mean_cpu_percent is not None else None,
+        mean_cpu_percent=mean_cpu_percent)
+
+
+class TestResourceRecommender(unittest.TestCase):
+
+    def setUp(self):
+        self.recommender = ResourceRecommender(margin=0.25)
+        for size in (1, 2, 4, 8):  # memory grows 256 MB, disk 1 GB per unit of input
+            self.recommender.add(
+                'wf.align', utilization(512 + 256 * size, 1024 ** 2 * size, 50),
+                input_size=size, cpus=4, disk_type='SSD')
+        for memory in (1000, 3000):  # no input sizes
+            self.recommender.add('wf.count', utilization(memory, 1024 ** 2))
+
+    def test_fit(self):
+        fits = self.recommender.fit('wf.align')
+        self.assertAlmostEqual(fits['memory_mb'].slope, 256)
+        self.assertAlmostEqual(fits['memory_mb'].predict(10), 512 + 2560)
+        self.assertAlmostEqual(fits['cpu'].predict(), 2)
+        self.assertEqual(self.recommender.fit('wf.count')['memory_mb'],
+                         ResourceFit(0.0, 3000.0, None, 2))
+        self.assertNotIn('cpu', self.recommender.fit('wf.count'))
+
+    def test_fit_bounds_every_run(self):
+        recommender = ResourceRecommender()
+        for size, memory in ((1, 100), (2, 400), (3, 300)):
+            recommender.add('t', utilization(memory, 1), input_size=size)
+        fit = recommender.fit('t')['memory_mb']
+        for size, memory in ((1, 100), (2, 400), (3, 300)):
+            self.assertGreaterEqual(fit.predict(size) + 1e-9, memory)
+
+    def test_cpu_ignores_single_peaks(self):
+        recommender = ResourceRecommender(cpu_percentile=90)
+        recommender.add('t', utilization(1, 1, cpu_samples=[100] + [50] * 19), cpus=4)
+        self.assertAlmostEqual(recommender.fit('t')['cpu'].predict(), 2)
+
+    def test_recommend(self):
+        recommendations = self.recommender.recommend(input_size=10)
+        self.assertEqual(recommendations['wf.align'], {
+            'memory': '3.8 GB', 'disks': 'local-disk 13 SSD', 'cpu': 3})
+        self.assertEqual(recommendations['wf.count'], {
+            'memory': '3.7 GB', 'disks': 'local-disk 2 HDD'})
+
+    def test_overrides(self):
+        inputs = self.recommender.to_inputs(input_size=10)
+        self.assertEqual(inputs['wf.align.memory'], '3.8 GB')
+        self.assertEqual(inputs['wf.count.disks'], 'local-disk 2 HDD')
+        options = self.recommender.to_options(input_size=10)
+        self.assertEqual(options['default_runtime_attributes'], {
+            'memory': '3.8 GB', 'disks': 'local-disk 13 SSD', 'cpu': 3})
+        document = json.loads(self.recommender.to_json(input_size=10))
+        self.assertEqual(document['tasks']['wf.align']['n_runs'], 4)
+        self.assertEqual(document['tasks']['wf.count']['fits']['memory_mb']['intercept'], 3000)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, ResourceRecommender, margin=-1)
+        self.assertRaises(ValueError, ResourceRecommender, cpu_percentile=101)
+        self.assertRaises(TypeError, self.recommender.add, 'wf.align', {'max_memory': 1})
+        self.assertRaises(KeyError, self.recommender.fit, 'missing')
+        self.assertEqual(self.recommender.tasks, ['wf.align', 'wf.count'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from email.utils import formatdate
+from cromwell_manager.resilience import (
+    RetryPolicy, CircuitBreaker, CircuitOpenError, parse_retry_after)
+from cromwell_manager.test.helpers import Clock
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_should_retry(self):
+        policy = RetryPolicy(max_attempts=3)
+        self.assertTrue(policy.should_retry(1, 503))
+        self.assertTrue(policy.should_retry(2, None))
+        self.assertFalse(policy.should_retry(3, 503))
+        self.assertFalse(policy.should_retry(1, 404))
+
+        # requests that are not idempotent are only retried once rejected by the server
+        self.assertFalse(policy.should_retry(1, 503, idempotent=False))
+        self.assertFalse(policy.should_retry(1, None, idempotent=False))
+        self.assertTrue(policy.should_retry(1, 429, idempotent=False))
+
+        # the server asked for a longer wait than the policy allows
+        policy = RetryPolicy(max_retry_after=60)
+        self.assertTrue(policy.should_retry(1, 429, retry_after=60))
+        self.assertFalse(policy.should_retry(1, 429, retry_after=3600))
+        self.assertFalse(policy.should_retry(1, 503, retry_after=61))
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5, max_retry_after=60)
+        for attempt, bound in ((1, 1), (2, 2), (3, 4), (10, 5)):
+            for _ in range(20):
+                self.assertTrue(0 <= policy.delay(attempt) <= bound)
+        self.assertGreaterEqual(policy.delay(1, retry_after=30), 30)
+
+    def test_timeouts(self):
+        policy = RetryPolicy(timeout=5, timeouts={'status': 2})
+        self.assertEqual(policy.timeout('status'), 2)
+        self.assertEqual(policy.timeout('metadata'), (10, 300))
+        self.assertEqual(policy.timeout(), 5)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('7'), 7)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertAlmostEqual(parse_retry_after(formatdate(usegmt=True)), 0, delta=1)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, RetryPolicy, max_attempts=0)
+        self.assertRaises(ValueError, RetryPolicy, backoff=-1)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10, clock=self.clock)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record(503)
+        self.breaker.record(200)  # resets the count
+        self.breaker.record(None)
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.record(429)
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError) as context:
+            self.breaker.before_request()
+        self.assertEqual(context.exception.retry_in, 10)
+
+    def test_half_open_allows_one_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.time = 10
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.breaker.before_request()
+        self.assertRaises(CircuitOpenError, self.breaker.before_request)
+
+        self.breaker.record(500)  # trial failed: open again
+        self.assertEqual(self.breaker.state, 'open')
+        self.clock.time = 20
+        self.breaker.before_request()
+        self.breaker.record(404)  # the server answered
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.before_request()
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, CircuitBreaker, failure_threshold=0)
+        self.assertRaises(ValueError, CircuitBreaker, recovery_timeout=-1)
+
+
+if __name__ == '__main__':
+    unittest.main()
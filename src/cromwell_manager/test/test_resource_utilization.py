@@ -0,0 +1,395 @@
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+from io import BytesIO, StringIO
+from unittest import mock
+import numpy as np
+from google.cloud import storage
+from cromwell_manager.calledtask import Shard
+from cromwell_manager.resource_utilization import (
+    ResourceUtilization, UtilizationTimeSeries, UtilizationDistribution, MonitoringLogParser)
+
+header = (
+    b'--- General Information ---\n'
+    b'#CPU: 4\n'
+    b'Total Memory (MB): 2048\n'
+    b'Total Disk Space (KB): 4194304\n'
+    b'\n'
+    b'--- Runtime Information ---\n'
+)
+
+
+def sample(memory_mb, disk_kb):
+    return (
+        b'* Memory usage (%%): %.2f%%\n'
+        b'* Memory usage (MB): %d\n'
+        b'* Disk usage (%%): %.2f%%\n'
+        b'* Disk usage (KB): %d\n' % (
+            memory_mb / 2048 * 100, memory_mb, disk_kb / 4194304 * 100, disk_kb))
+
+
+def activity(cpu_percent, load_average, disk_read_kbps, disk_write_kbps, net_rx_kbps,
+             net_tx_kbps):
+    return (
+        b'* CPU usage (%%): %.1f%%\n'
+        b'* Load average: %.2f\n'
+        b'* Disk read (KB/s): %d\n'
+        b'* Disk write (KB/s): %d\n'
+        b'* Network received (KB/s): %d\n'
+        b'* Network sent (KB/s): %d\n' % (
+            cpu_percent, load_average, disk_read_kbps, disk_write_kbps, net_rx_kbps,
+            net_tx_kbps))
+
+
+def monitoring_log(memory, disk):
+    return header + b''.join(sample(m, d) for m, d in zip(memory, disk))
+
+
+def compact_log(memory, disk):
+    return (
+        b'#cromwell-monitor-csv 1\n'
+        b'#cpus=4\n'
+        b'#total_memory_mb=2048\n'
+        b'#total_disk_kb=4194304\n'
+        b'#interval=5\n'
+        b'#columns=time,memory_mb,disk_kb\n' +
+        b''.join(b'%d,%d,%d\n' % (1500000000 + 5 * i, m, d)
+                 for i, (m, d) in enumerate(zip(memory, disk))))
+
+
+class TestResourceUtilization(unittest.TestCase):
+
+    def test_from_file(self):
+        log = BytesIO(monitoring_log([100, 300, 200], [1000, 1500, 3000]))
+        utilization = ResourceUtilization.from_file('task', log)
+        self.assertEqual(utilization.max_memory, 300)
+        self.assertEqual(utilization.total_memory, 2048)
+        self.assertEqual(utilization.max_disk, 3000)
+        self.assertEqual(utilization.total_disk, 4194304)
+        self.assertTrue(utilization.robust)
+        self.assertIsNone(utilization.time_series)
+
+    def test_from_text_file(self):
+        log = StringIO(monitoring_log([100], [1000]).decode())
+        self.assertRaises(TypeError, ResourceUtilization.from_file, 'task', log)
+
+    def test_header_only_log_is_not_robust(self):
+        for n_lines in (5, 6):
+            utilization = ResourceUtilization.from_bytes(
+                'task', b''.join(header.splitlines(True)[:n_lines]))
+            self.assertFalse(utilization.robust)
+            self.assertEqual(utilization.max_memory, 0)
+        self.assertTrue(ResourceUtilization.from_bytes('task', header + sample(1, 1)).robust)
+
+    def test_merge(self):
+        x = ResourceUtilization.from_bytes('task', monitoring_log([100], [5000]))
+        y = ResourceUtilization.from_bytes('task', monitoring_log([300], [1000]))
+        merged = ResourceUtilization.merge(x, y)
+        self.assertEqual((merged.max_memory, merged.max_disk), (300, 5000))
+        self.assertIs(ResourceUtilization.merge(x), x)
+
+
+class TestUtilizationTimeSeries(unittest.TestCase):
+
+    def setUp(self):
+        memory = [1024, 2048, 1024, 512]
+        self.series = ResourceUtilization.from_bytes(
+            'task', monitoring_log(memory, [10, 20, 30, 40]), time_series=True).time_series
+
+    def test_samples(self):
+        self.assertEqual(self.series.n_samples, 4)
+        np.testing.assert_array_equal(self.series.sample_indices('disk_kb'), [0, 1, 2, 3])
+        np.testing.assert_array_equal(self.series.times('disk_kb'), [0, 5, 10, 15])
+        np.testing.assert_allclose(self.series.values('memory_percent'), [50, 100, 50, 25])
+
+    def test_statistics(self):
+        self.assertEqual(self.series.max('memory_mb'), 2048)
+        self.assertEqual(self.series.mean('memory_mb'), 1152)
+        self.assertEqual(self.series.percentile('disk_kb', 50), 25)
+        self.assertEqual(self.series.time_above('memory_mb', 1000), 15)
+        # 4.5 GB held for 5 seconds each
+        self.assertAlmostEqual(self.series.gb_hours('memory_mb'), 4.5 * 5 / 3600)
+
+    def test_large_values_are_exact(self):
+        disk = [2 ** 24 + 1, 2 ** 30 + 1]  # not representable in single precision
+        series = UtilizationTimeSeries.from_bytes(monitoring_log([100, 200], disk))
+        self.assertEqual(series.max('disk_kb'), 2 ** 30 + 1)
+        self.assertEqual(series.values('disk_kb').tolist(), disk)
+
+    def test_missing_values_keep_their_sample_index(self):
+        log = header + sample(100, 10) + b'* Memory usage (%): 1%\n' + sample(300, 30)
+        series = UtilizationTimeSeries.from_bytes(log)
+        np.testing.assert_array_equal(series.sample_indices('disk_kb'), [0, 2])
+        self.assertEqual(series.n_samples, 3)
+
+
+class TestMonitoringLogParser(unittest.TestCase):
+
+    def setUp(self):
+        self.log = monitoring_log([100, 300, 200, 50], [1000, 1500, 3000, 2500])
+        self.expected = ResourceUtilization.from_bytes('task', self.log, time_series=True)
+
+    def parse(self, chunk_size, time_series=True):
+        chunks = (self.log[i:i + chunk_size] for i in range(0, len(self.log), chunk_size))
+        return ResourceUtilization.from_stream('task', chunks, time_series=time_series)
+
+    def test_any_chunking_matches_whole_log(self):
+        for chunk_size in (1, 7, 30, 64, len(self.log)):
+            utilization = self.parse(chunk_size)
+            self.assertEqual(bytes(utilization), bytes(self.expected), chunk_size)
+            self.assertEqual(utilization.robust, self.expected.robust)
+            for metric in self.expected.time_series.metrics:
+                np.testing.assert_array_equal(
+                    utilization.time_series.sample_indices(metric),
+                    self.expected.time_series.sample_indices(metric))
+                np.testing.assert_array_equal(
+                    utilization.time_series.values(metric),
+                    self.expected.time_series.values(metric))
+
+    def test_unterminated_last_line(self):
+        parser = MonitoringLogParser('task')
+        parser.feed(self.log.rstrip(b'\n'))
+        self.assertEqual(parser.max_disk, 3000)  # the final disk line has not been parsed yet
+        parser.feed(b'9')
+        utilization = parser.close()
+        self.assertEqual(utilization.max_disk, 25009)
+
+    def test_large_values_are_exact(self):
+        utilization = ResourceUtilization.from_bytes('task', monitoring_log([100], [123456789]))
+        self.assertEqual(utilization.max_disk, 123456789)
+
+    def test_summarize_updates_in_place(self):
+        parser = MonitoringLogParser('task')
+        split = self.log.index(sample(200, 3000))
+        parser.feed(self.log[:split])
+        utilization = parser.summarize()
+        self.assertEqual((utilization.max_memory, utilization.max_disk), (300, 1500))
+        parser.feed(self.log[split:])
+        self.assertIs(parser.summarize(utilization), utilization)
+        self.assertEqual((utilization.max_memory, utilization.max_disk), (300, 3000))
+        self.assertEqual(utilization.fraction_disk_used, 3000 / 4194304)
+        self.assertEqual(parser.offset, len(self.log))
+
+    def test_from_file_reads_in_chunks(self):
+        utilization = ResourceUtilization.from_file('task', BytesIO(self.log), chunk_size=10)
+        self.assertEqual(bytes(utilization), bytes(self.expected))
+        self.assertIsNone(utilization.time_series)
+
+
+class GrowingBlob:
+    """Stands in for the google storage blob of a monitoring log that is still being written."""
+
+    def __init__(self, data=b''):
+        self.data = data
+        self.md5_hash = None
+        self.generation = 1
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def download_as_string(self, start=None, end=None):
+        return self.data[start:end + 1]
+
+
+class TestShardFollowsLog(unittest.TestCase):
+
+    def setUp(self):
+        self.blob = GrowingBlob()
+        self.shard = Shard({'monitoringLog': 'gs://bucket/monitoring.log',
+                            'labels': {'wdl-task-name': 'task'}},
+                           storage.Client.create_anonymous_client())
+
+    def update(self):
+        with mock.patch.object(storage.Bucket, 'get_blob', return_value=self.blob):
+            return self.shard.update_resource_utilization(chunk_size=64)
+
+    def test_reads_only_appended_samples(self):
+        self.blob.data = monitoring_log([100, 300], [1000, 1500])
+        utilization = self.update()
+        self.assertEqual((utilization.max_memory, utilization.total_memory), (300, 2048))
+        self.blob.data += sample(500, 1200)
+        self.assertIs(self.update(), utilization)
+        self.assertEqual((utilization.max_memory, utilization.max_disk), (500, 1500))
+
+    def test_summarizes_without_totals(self):
+        # e.g. a monitoring script that could not find the disk it reports on
+        self.blob.data = (header.replace(b'Total Disk Space (KB): 4194304\n', b'') +
+                          sample(100, 1000))
+        utilization = self.update()
+        self.assertEqual((utilization.max_memory, utilization.total_memory), (100, 2048))
+        self.assertEqual((utilization.max_disk, utilization.total_disk), (1000, 0))
+        self.assertTrue(np.isnan(utilization.fraction_disk_used))
+        self.assertEqual(bytes(utilization), bytes(
+            ResourceUtilization.from_bytes('task', self.blob.data)))
+
+
+class TestCompactLog(unittest.TestCase):
+
+    def setUp(self):
+        memory, disk = [100, 300, 200, 50], [1000, 1500, 3000, 2500]
+        self.log = compact_log(memory, disk)
+        self.expected = ResourceUtilization.from_bytes(
+            'task', monitoring_log(memory, disk), time_series=True)
+
+    def test_matches_verbose_format(self):
+        for chunk_size in (1, 13, len(self.log)):
+            chunks = (self.log[i:i + chunk_size] for i in range(0, len(self.log), chunk_size))
+            utilization = ResourceUtilization.from_stream('task', chunks, time_series=True)
+            self.assertEqual(bytes(utilization), bytes(self.expected), chunk_size)
+            self.assertTrue(utilization.robust)
+            for metric in self.expected.time_series.metrics:
+                np.testing.assert_array_equal(
+                    utilization.time_series.sample_indices(metric),
+                    self.expected.time_series.sample_indices(metric))
+                np.testing.assert_allclose(
+                    utilization.time_series.values(metric),
+                    self.expected.time_series.values(metric), atol=0.01)  # text rounds %
+
+    def test_header_only_log_is_not_robust(self):
+        header_end = self.log.index(b'#columns')
+        utilization = ResourceUtilization.from_bytes('task', self.log[:header_end])
+        self.assertFalse(utilization.robust)
+        self.assertEqual(utilization.total_memory, 2048)
+        self.assertEqual(utilization.max_memory, 0)
+
+
+class TestActivity(unittest.TestCase):
+
+    def setUp(self):
+        self.activity = [(50.0, 1.5, 100, 2000, 10, 1), (90.0, 3.5, 300, 1000, 30, 2)]
+        self.log = header + b''.join(
+            sample(100, 1000) + activity(*a) for a in self.activity)
+
+    def test_text_log(self):
+        utilization = ResourceUtilization.from_bytes('task', self.log, time_series=True)
+        self.assertEqual(utilization.activity, {
+            'max_cpu_percent': 90.0, 'mean_cpu_percent': 70.0, 'max_load_average': 3.5,
+            'max_disk_read_kbps': 300, 'max_disk_write_kbps': 2000, 'max_net_rx_kbps': 30,
+            'max_net_tx_kbps': 2})
+        np.testing.assert_array_equal(
+            utilization.time_series.sample_indices('cpu_percent'), [0, 1])
+        self.assertIn('Mean CPU Usage    (%): 70.00', str(utilization))
+
+    def test_compact_log(self):
+        log = compact_log([100, 100], [1000, 1000]).replace(
+            b'#columns=time,memory_mb,disk_kb\n',
+            b'#columns=time,memory_mb,disk_kb,cpu_percent,load_average,disk_read_kbps,'
+            b'disk_write_kbps,net_rx_kbps,net_tx_kbps\n')
+        lines = log.splitlines(True)
+        for i, a in enumerate(self.activity, start=len(lines) - 2):
+            lines[i] = lines[i].rstrip(b'\n') + b',%.1f,%.2f,%d,%d,%d,%d\n' % a
+        utilization = ResourceUtilization.from_bytes('task', b''.join(lines))
+        expected = ResourceUtilization.from_bytes('task', self.log)
+        self.assertEqual(utilization.activity, expected.activity)
+
+    def test_compact_log_without_first_activity(self):
+        # monitor_compact.sh leaves the activity columns of its first record empty
+        log = compact_log([100, 100, 100], [1000, 1000, 1000]).replace(
+            b'#columns=time,memory_mb,disk_kb\n',
+            b'#columns=time,memory_mb,disk_kb,cpu_percent,load_average,disk_read_kbps,'
+            b'disk_write_kbps,net_rx_kbps,net_tx_kbps\n')
+        lines = log.splitlines(True)
+        lines[-3] = lines[-3].rstrip(b'\n') + b',,0.50,,,,\n'
+        for i, a in enumerate(self.activity, start=len(lines) - 2):
+            lines[i] = lines[i].rstrip(b'\n') + b',%.1f,%.2f,%d,%d,%d,%d\n' % a
+        utilization = ResourceUtilization.from_bytes('task', b''.join(lines), time_series=True)
+        self.assertEqual(utilization.activity, ResourceUtilization.from_bytes(
+            'task', self.log).activity)
+        series = utilization.time_series
+        np.testing.assert_array_equal(series.sample_indices('cpu_percent'), [1, 2])
+        np.testing.assert_array_equal(series.sample_indices('load_average'), [0, 1, 2])
+        self.assertEqual(series.n_samples, 3)
+
+    def test_older_logs_have_no_activity(self):
+        utilization = ResourceUtilization.from_bytes(
+            'task', monitoring_log([100], [1000]), time_series=True)
+        self.assertEqual(utilization.activity, {})
+        self.assertIsNone(utilization.max_cpu_percent)
+        self.assertNotIn('CPU', str(utilization))
+        self.assertNotIn('cpu_percent', utilization.time_series)
+
+    def test_merge_and_distribution_keep_recorded_activity(self):
+        recorded = ResourceUtilization.from_bytes('task', self.log)
+        older = ResourceUtilization.from_bytes('task', monitoring_log([500], [1000]))
+        merged = ResourceUtilization.merge(older, recorded)
+        self.assertEqual(merged.max_memory, 500)
+        self.assertEqual(merged.activity, recorded.activity)
+
+        distribution = UtilizationDistribution.from_utilizations([older, recorded])
+        self.assertTrue(np.isnan(distribution['max_cpu_percent'][0]))
+        self.assertEqual(distribution.mean('max_cpu_percent'), 90.0)
+        self.assertEqual(distribution.summary('max_cpu_percent')['outliers'], [])
+        self.assertEqual(distribution.to_resource_utilization().activity, recorded.activity)
+
+
+class TestMonitoringScripts(unittest.TestCase):
+
+    accessories = os.path.join(os.path.dirname(__file__), '..', '..', 'accessories')
+    scripts = ('monitor.sh', 'monitor_long.sh', 'monitor_compact.sh')
+
+    def read(self, name):
+        with open(os.path.join(self.accessories, name)) as f:
+            return f.read()
+
+    def test_scripts_carry_the_shared_functions(self):
+        shared = self.read('monitor_functions.sh')
+        functions = shared[shared.index('function timestamp'):]
+        for name in self.scripts:
+            script = self.read(name)
+            begin = script.index('\n', script.index('# --- begin monitor_functions.sh')) + 1
+            end = script.index('# --- end monitor_functions.sh')
+            self.assertEqual(script[begin:end], functions, name)
+            self.assertNotRegex(script, r'(?m)^\s*(source|\.) ', name)
+
+    @unittest.skipUnless(shutil.which('bash') and os.path.exists('/proc/stat'), 'needs linux')
+    def test_compact_script_runs_alone(self):
+        # cromwell copies only the monitoring script to the VM
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        script = shutil.copy(os.path.join(self.accessories, 'monitor_compact.sh'), directory)
+        env = dict(os.environ, MONITOR_INTERVAL='0.2', MONITOR_DISK='/')
+        try:
+            subprocess.run(['bash', script], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           env=env, cwd=directory, timeout=1)
+        except subprocess.TimeoutExpired as e:
+            log, errors = e.stdout, e.stderr
+        self.assertFalse(errors)
+        utilization = ResourceUtilization.from_bytes('task', log, time_series=True)
+        series = utilization.time_series
+        self.assertGreater(series.n_samples, 2)
+        np.testing.assert_array_equal(
+            series.sample_indices('cpu_percent'), np.arange(1, series.n_samples))
+
+
+class TestUtilizationDistribution(unittest.TestCase):
+
+    def setUp(self):
+        memory = [100, 110, 90, 105, 1000]
+        self.shards = [ResourceUtilization('task', m, 2048, 10 * m, 4096, True) for m in memory]
+        self.distribution = UtilizationDistribution.from_utilizations(
+            self.shards[:2] + [None] + self.shards[2:])
+
+    def test_missing_shards_are_skipped(self):
+        self.assertEqual(len(self.distribution), 5)
+        np.testing.assert_array_equal(self.distribution.shard_indices, [0, 1, 3, 4, 5])
+
+    def test_statistics(self):
+        self.assertEqual(self.distribution.max('max_memory'), 1000)
+        self.assertEqual(self.distribution.mean('max_memory'), 281)
+        self.assertEqual(self.distribution.percentile('max_disk', 50), 1050)
+        np.testing.assert_array_equal(self.distribution.outliers('max_memory'), [5])
+        self.assertEqual(self.distribution.histogram('max_memory', bins=2)[0].tolist(), [4, 1])
+
+    def test_matches_pairwise_merge(self):
+        merged = self.shards[0]
+        for shard in self.shards[1:]:
+            merged = ResourceUtilization.merge(merged, shard)
+        reduced = self.distribution.to_resource_utilization()
+        self.assertEqual(str(reduced), str(merged))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import io
+import json
+import shutil
+import zipfile
+import tempfile
+import unittest
+from cromwell_manager.submission import SubmissionBundle, load_dependencies
+from cromwell_manager.workflow import Workflow
+
+
+class TestSubmissionBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.wdl = os.path.join(self.directory, 'pipeline.wdl')
+        with open(self.wdl, 'w') as f:
+            f.write('workflow pipeline {}\n')
+        self.tasks = os.path.join(self.directory, 'tasks.wdl')
+        with open(self.tasks, 'w') as f:
+            f.write('task align {}\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def bundle(self):
+        return SubmissionBundle.load(
+            self.wdl, options_json={'read_from_cache': False},
+            workflow_dependencies={'tasks.wdl': self.tasks}, custom_labels={'project': 'test'})
+
+    def test_load(self):
+        bundle = self.bundle()
+        self.assertEqual(bundle.wdl, b'workflow pipeline {}\n')
+        self.assertEqual(json.loads(bundle.labels.decode()), {'project': 'test'})
+        with zipfile.ZipFile(io.BytesIO(bundle.dependencies)) as archive:
+            self.assertEqual(archive.namelist(), ['tasks.wdl'])
+        self.assertEqual(bundle, self.bundle())
+        self.assertRaises(AttributeError, setattr, bundle, 'wdl', b'')
+
+    def test_files(self):
+        files = self.bundle().files({'pipeline.sample': 'a'})
+        self.assertEqual(list(files), ['wdlSource', 'workflowOptions', 'customLabels',
+                                       'wdlDependencies', 'workflowInputs'])
+        self.assertEqual(json.loads(files['workflowInputs'].decode()), {'pipeline.sample': 'a'})
+        self.assertNotIn('workflowOptions', SubmissionBundle.load(self.wdl).files())
+
+    def test_create_submission_json(self):
+        files = Workflow._create_submission_json(
+            self.bundle(), {'pipeline.sample': 'a'}, None)
+        self.assertEqual(files['wdlSource'].read(), b'workflow pipeline {}\n')
+        self.assertRaises(ValueError, Workflow._create_submission_json, self.bundle(), {}, None,
+                          options_json={})
+
+        files = Workflow._create_submission_json(
+            self.wdl, {}, None, workflow_dependencies={'tasks.wdl': self.tasks})
+        self.assertTrue(zipfile.is_zipfile(files['wdlDependencies']))
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, SubmissionBundle.load, None)
+        self.assertRaises(TypeError, load_dependencies, 'dependencies.tar')
+        self.assertIsNone(load_dependencies(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
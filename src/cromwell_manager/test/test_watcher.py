@@ -0,0 +1,139 @@
+import threading
+import unittest
+from unittest import mock
+import requests
+from cromwell_manager.watcher import WorkflowWatcher
+
+
+class QueryResponse:
+
+    def __init__(self, results):
+        self.status_code = 200
+        self._results = results
+
+    def json(self):
+        return {'results': self._results}
+
+
+class FakeServer:
+    """Answers id-filtered queries from a dictionary of workflow statuses."""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.queries = []
+        self.finish_after = None  # number of queries after which every workflow succeeds
+        self.errors = 0  # number of queries still to fail with a connection error
+
+    def query(self, ids=None):
+        if self.errors:
+            self.errors -= 1
+            raise requests.ConnectionError('connection refused')
+        self.queries.append(list(ids))
+        if self.finish_after is not None and len(self.queries) >= self.finish_after:
+            self.statuses = dict.fromkeys(self.statuses, 'Succeeded')
+        return QueryResponse(
+            [{'id': i, 'status': self.statuses[i]} for i in ids if i in self.statuses])
+
+
+class TestWorkflowWatcher(unittest.TestCase):
+
+    def test_one_query_per_chunk(self):
+        server = FakeServer({str(i): 'Running' for i in range(250)})
+        watcher = WorkflowWatcher(server, chunk_size=100)
+        watcher.watch([str(i) for i in range(250)])
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual([len(q) for q in server.queries], [100, 100, 50])
+
+    def test_futures_and_callbacks_resolve_on_completion(self):
+        server = FakeServer({'a': 'Running', 'b': 'Running'})
+        watcher = WorkflowWatcher(server)
+        completed = []
+        futures = watcher.watch(['a', 'b'], callback=lambda i, r: completed.append(i))
+        server.statuses['b'] = 'Failed'
+        self.assertEqual([i for i, _ in watcher.poll()], ['b'])
+        self.assertEqual(futures['b'].result(timeout=0)['status'], 'Failed')
+        self.assertFalse(futures['a'].done())
+        self.assertEqual(completed, ['b'])
+        self.assertEqual(watcher.pending, ['a'])
+
+    def test_backoff_grows_and_resets(self):
+        server = FakeServer({'a': 'Running', 'b': 'Running'})
+        watcher = WorkflowWatcher(server, delay=1, max_delay=5, backoff=2)
+        watcher.watch(['a', 'b'])
+        delays = []
+        for _ in range(4):
+            watcher.poll()
+            delays.append(watcher._current_delay)
+        self.assertEqual(delays, [1, 2, 4, 5])
+        server.statuses['a'] = 'Succeeded'
+        watcher.poll()
+        self.assertEqual(watcher._current_delay, 1)
+
+    def test_as_completed(self):
+        server = FakeServer({'a': 'Succeeded', 'b': 'Aborted'})
+        watcher = WorkflowWatcher(server, delay=0)
+        watcher.watch(['a', 'b'])
+        self.assertEqual(sorted(i for i, _ in watcher.as_completed(timeout=1)), ['a', 'b'])
+        self.assertTrue(watcher.wait(timeout=0))
+
+    def test_delay_sequence(self):
+        server = FakeServer({'a': 'Running'})
+        server.finish_after = 5
+        watcher = WorkflowWatcher(server, delay=1, max_delay=3, backoff=2)
+        watcher.watch('a')
+        with mock.patch.object(threading.Event, 'wait', return_value=False) as sleep:
+            self.assertTrue(watcher.wait())
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2, 3, 3])
+
+    def test_wait_after_stop(self):
+        server = FakeServer({'a': 'Running'})
+        watcher = WorkflowWatcher(server, delay=0.01)
+        watcher.watch('a')
+        watcher.start()
+        watcher.stop()
+        self.assertFalse(watcher.is_running)
+
+        server.finish_after = len(server.queries) + 3
+        self.assertTrue(watcher.wait(timeout=5))
+        self.assertEqual(watcher.pending, [])
+
+    def test_failed_queries_are_retried(self):
+        server = FakeServer({'a': 'Succeeded'})
+        server.errors = 1
+        watcher = WorkflowWatcher(server)
+        future = watcher.watch('a')
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual([i for i, _ in watcher.poll()], ['a'])
+        self.assertEqual(future.result(timeout=0)['status'], 'Succeeded')
+
+    def test_missing_workflows_are_dropped(self):
+        server = FakeServer({'a': 'Running'})
+        watcher = WorkflowWatcher(server, max_missing=2)
+        futures = watcher.watch(['a', 'b'])
+        watcher.poll()
+        self.assertEqual(watcher.pending, ['a', 'b'])
+        watcher.poll()
+        self.assertEqual(watcher.pending, ['a'])
+        self.assertIsInstance(futures['b'].exception(timeout=0), KeyError)
+        self.assertRaises(ValueError, WorkflowWatcher, server, max_missing=0)
+
+    def test_thread_polls_workflows_watched_while_running(self):
+        server = FakeServer({'a': 'Running', 'b': 'Running'})
+        watcher = WorkflowWatcher(server, delay=0.01)
+        first = watcher.watch('a')
+        watcher.start()
+        self.addCleanup(watcher.stop)
+        self.assertTrue(watcher.is_running)
+        second = watcher.watch('b')
+        server.statuses['a'] = 'Succeeded'
+        first.result(timeout=5)
+        self.assertTrue(watcher.is_running)  # b is still pending
+
+        server.statuses['b'] = 'Succeeded'
+        second.result(timeout=5)
+        watcher.stop()
+        self.assertFalse(watcher.is_running)
+
+
+if __name__ == "__main__":
+    unittest.main()
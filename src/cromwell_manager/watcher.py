@@ -0,0 +1,256 @@
+import threading
+from time import monotonic
+from collections import OrderedDict
+from concurrent.futures import Future
+import requests
+from .cromwell import TERMINAL_STATUSES
+from .resilience import CircuitOpenError
+
+
+class WorkflowWatcher:
+    """Wait on many workflows at once, with one status query per `chunk_size` workflows.
+
+    Each round of polling sends `Cromwell.query` requests filtered by workflow id, so watching 500
+    workflows costs 5 requests per round rather than 500. Rounds in which no workflow finishes
+    back off exponentially from `delay` up to `max_delay` seconds; the delay resets as soon as a
+    workflow finishes or new workflows are watched. A chunk whose query fails is retried in the
+    next round. A workflow that is absent from the results of `max_missing` rounds is dropped, and
+    its future fails with KeyError.
+
+    Completion can be observed in several ways:
+
+    - the `Future` returned by `watch`, whose result is the workflow's query record
+    - a callback passed to `watch`, called as callback(workflow_id, record)
+    - iterating over `as_completed()`
+    - blocking on `wait()`, or polling in a background thread with `start()`
+    """
+
+    def __init__(self, cromwell_server, statuses=TERMINAL_STATUSES, delay=3, max_delay=60,
+                 backoff=2, chunk_size=100, max_missing=10):
+        """
+        :param Cromwell cromwell_server: an authenticated cromwell server object
+        :param Iterable statuses: statuses that count as complete (default: Succeeded, Failed,
+          Aborted)
+        :param float delay: initial time between polling rounds, in seconds (default 3)
+        :param float max_delay: maximum time between polling rounds, in seconds (default 60)
+        :param float backoff: factor by which the delay grows after a round in which no workflow
+          completed (default 2)
+        :param int chunk_size: maximum number of workflow ids per query request (default 100)
+        :param int max_missing: number of successful queries whose results may leave out a
+          workflow before it is dropped; cromwell lists new workflows after a short delay
+          (default 10)
+        """
+        if backoff < 1:
+            raise ValueError('backoff must be at least 1, not %r' % backoff)
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            raise ValueError('chunk_size must be a positive int, not %r' % chunk_size)
+        if not isinstance(max_missing, int) or max_missing < 1:
+            raise ValueError('max_missing must be a positive int, not %r' % max_missing)
+        self.cromwell_server = cromwell_server
+        self.statuses = frozenset(statuses)
+        self.delay = delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.max_missing = max_missing
+
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()  # workflow id: (future, callbacks)
+        self._completed = {}  # workflow id: query record
+        self._missing = {}  # workflow id: number of consecutive results that left it out
+        self._current_delay = delay  # wait before the next round
+        self._quiet = False  # True if no workflow completed in the last round
+        self._stop = None  # stops the polling thread started by `start`
+        self._thread = None
+        self._running = False  # True while the polling thread will poll again; set under _lock
+
+    def __repr__(self):
+        return '<WorkflowWatcher: %d pending, %d complete>' % (
+            len(self._pending), len(self._completed))
+
+    @property
+    def is_running(self):
+        """True if a polling thread started by `start` is running.
+
+        The thread decides to exit while holding the same lock as `watch`, so a workflow watched
+        while this is True is polled by the thread until it completes.
+        """
+        return self._running
+
+    @property
+    def pending(self):
+        """Ids of watched workflows that have not yet completed."""
+        with self._lock:
+            return list(self._pending)
+
+    @property
+    def completed(self):
+        """Dictionary of query records for watched workflows that have completed, keyed by id."""
+        with self._lock:
+            return dict(self._completed)
+
+    def watch(self, workflow_ids, callback=None):
+        """Start watching one or more workflows.
+
+        :param str | Iterable workflow_ids: id, or ids, of workflows to watch
+        :param callable callback: (optional) called as callback(workflow_id, record) when each
+          workflow completes
+        :return Future | dict: future for workflow_ids, or a dictionary of futures keyed by id
+        """
+        single = isinstance(workflow_ids, str)
+        ids = [workflow_ids] if single else list(workflow_ids)
+        futures = OrderedDict()
+        already_completed = []
+        with self._lock:
+            for workflow_id in ids:
+                if workflow_id in self._completed:  # already complete; resolve immediately
+                    future = Future()
+                    future.set_result(self._completed[workflow_id])
+                    already_completed.append((workflow_id, self._completed[workflow_id]))
+                elif workflow_id in self._pending:
+                    future, callbacks = self._pending[workflow_id]
+                    if callback is not None:
+                        callbacks.append(callback)
+                else:
+                    future = Future()
+                    self._pending[workflow_id] = (future, [callback] if callback else [])
+                futures[workflow_id] = future
+            self._current_delay = self.delay
+            self._quiet = False
+        if callback is not None:
+            for workflow_id, record in already_completed:
+                callback(workflow_id, record)
+        return futures[workflow_ids] if single else futures
+
+    def poll(self):
+        """Run one polling round, resolving the futures of workflows that have completed.
+
+        :return list: (workflow_id, record) pairs for the workflows that completed in this round
+        """
+        pending = self.pending
+        finished = []
+        listed, absent = [], []
+        for i in range(0, len(pending), self.chunk_size):
+            chunk = pending[i:i + self.chunk_size]
+            try:
+                response = self.cromwell_server.query(ids=chunk)
+            except (requests.RequestException, CircuitOpenError):
+                continue  # try again next round
+            if response.status_code != 200:
+                continue
+            chunk = set(chunk)
+            for record in response.json().get('results', ()):
+                if record.get('id') in chunk:
+                    chunk.discard(record['id'])
+                    listed.append(record['id'])
+                    if record.get('status') in self.statuses:
+                        finished.append((record['id'], record))
+            absent.extend(chunk)
+
+        resolved = []
+        dropped = []
+        with self._lock:
+            for workflow_id, record in finished:
+                if workflow_id not in self._pending:
+                    continue
+                future, callbacks = self._pending.pop(workflow_id)
+                self._completed[workflow_id] = record
+                resolved.append((workflow_id, record, future, callbacks))
+            for workflow_id in listed:
+                self._missing.pop(workflow_id, None)
+            for workflow_id in absent:
+                self._missing[workflow_id] = self._missing.get(workflow_id, 0) + 1
+                if self._missing[workflow_id] >= self.max_missing and workflow_id in self._pending:
+                    del self._missing[workflow_id]
+                    dropped.append((workflow_id, self._pending.pop(workflow_id)[0]))
+            if resolved:
+                self._current_delay = self.delay
+                self._quiet = False
+            else:
+                # the first quiet round is followed by `delay`, later ones by longer waits
+                if self._quiet:
+                    self._current_delay = min(self._current_delay * self.backoff, self.max_delay)
+                self._quiet = True
+
+        # resolve outside of the lock, so that callbacks may watch new workflows
+        for workflow_id, future in dropped:
+            future.set_exception(KeyError('workflow %s was not found by cromwell' % workflow_id))
+        for workflow_id, record, future, callbacks in resolved:
+            future.set_result(record)
+            for callback in callbacks:
+                callback(workflow_id, record)
+        return [(workflow_id, record) for workflow_id, record, _, _ in resolved]
+
+    def as_completed(self, timeout=None):
+        """Poll until every watched workflow completes, yielding each as it does.
+
+        :param float timeout: (optional) maximum time to wait, in seconds
+        :return Iterator: (workflow_id, record) pairs, in order of completion
+        """
+        return self._as_completed(timeout, threading.Event())
+
+    def _as_completed(self, timeout, stop):
+        """`as_completed`, returning early once the threading.Event stop is set."""
+        deadline = monotonic() + timeout if timeout is not None else None
+        while self.pending:
+            for completed in self.poll():
+                yield completed
+            if not self.pending:
+                return
+            delay = self._current_delay
+            if deadline is not None:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return
+                delay = min(delay, remaining)
+            if stop.wait(delay):
+                return
+
+    def wait(self, timeout=None):
+        """Poll until no watched workflow is pending, or timeout expires.
+
+        :param float timeout: (optional) maximum time to wait, in seconds
+        :return bool: True if no watched workflow is pending
+        """
+        return self._wait(timeout, threading.Event())
+
+    def _wait(self, timeout, stop):
+        """`wait`, returning early once the threading.Event stop is set."""
+        for _ in self._as_completed(timeout, stop):
+            pass
+        return not self.pending
+
+    def start(self):
+        """Poll in a daemon thread until every watched workflow completes or `stop` is called.
+
+        Workflows may continue to be watched while the thread runs; the thread exits once none
+        are pending, and `start` may be called again after watching more.
+        """
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._stop = stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(stop,), daemon=True)
+            self._thread.start()
+
+    def _run(self, stop):
+        """Target of the polling thread: poll until nothing is pending or stop is set."""
+        try:
+            while not stop.is_set():
+                self._wait(None, stop)
+                with self._lock:  # exit only if no workflow was watched since the last round
+                    if not self._pending:
+                        self._running = False
+                        return
+        finally:
+            with self._lock:
+                self._running = False
+
+    def stop(self):
+        """Stop a polling thread started by `start`."""
+        if self._stop is not None:
+            self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,30 +1,52 @@
 import sys
 import os
 import re
-import json
 import tempfile
+from io import BytesIO
 from subprocess import Popen, PIPE, call
 import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import requests
 from google.cloud import storage
-from .calledtask import CalledTask
-from .cromwell import Cromwell
-from .io_util import (
-    GSObject, HTTPObject, package_workflow_dependencies, check_exists, announce)
+from .calledtask import CalledTask, prefetch_resource_utilization, update_resource_utilization
+from .cromwell import Cromwell, TERMINAL_STATUSES
+from .watcher import WorkflowWatcher
+from .export import export_resource_utilization
+from .submission import SubmissionBundle
+from .io_util import check_exists, announce
 
 
 # todo generate links to google storage for inputs / outputs / files etc
 class WorkflowBase:
 
-    def __init__(self, workflow_id, cromwell_server, storage_client=None):
+    def __init__(self, workflow_id, cromwell_server, storage_client=None, metadata=None,
+                 metadata_ttl=30):
         """Defines a Cromwell-runnable WDL workflow.
 
+        Metadata is retrieved once and kept as a snapshot that `metadata`, `root`, `inputs` and
+        `tasks` all read from. The snapshot is re-fetched once it is older than `metadata_ttl`
+        seconds, unless the workflow has reached a terminal state, after which its metadata can no
+        longer change and the snapshot is kept until `refresh()` is called.
+
         :param str workflow_id: hash code for this workflow
         :param Cromwell cromwell_server: an authenticated cromwell server object
+        :param google.cloud.storage.Client storage_client: (optional) authenticated google
+          storage client
+        :param dict metadata: (optional) metadata already retrieved for this workflow, e.g.
+          embedded in the expanded metadata of a parent workflow. Used as the initial snapshot.
+        :param float metadata_ttl: number of seconds for which the metadata snapshot of a
+          non-terminal workflow is re-used (default 30)
         """
         self.id = workflow_id
         self._cromwell_server = cromwell_server
         self._storage_client = storage_client
+        self.metadata_ttl = metadata_ttl
+
+        # metadata snapshot, and the time.monotonic() at which it was retrieved
+        self._metadata = metadata
+        self._metadata_time = time.monotonic() if metadata is not None else None
 
         # filled by querying server
         self._tasks = {}
@@ -62,17 +84,68 @@ class WorkflowBase:
     @property
     def status(self):
         """Status of workflow."""
-        return self.cromwell_server.status(self.id).json()
+        snapshot = self._snapshot()
+        if snapshot is not None and snapshot.get('status') in TERMINAL_STATUSES:
+            return {'id': self.id, 'status': snapshot['status']}
+        response = self.cromwell_server.status(self.id)
+        response.raise_for_status()
+        return response.json()
+
+    def _snapshot(self):
+        """Return the metadata snapshot if it is still valid, else None."""
+        if self._metadata is None:
+            return None
+        if self._metadata.get('status') in TERMINAL_STATUSES:
+            return self._metadata
+        if time.monotonic() - self._metadata_time < self.metadata_ttl:
+            return self._metadata
+        return None
+
+    def refresh(self, expand_subworkflows=False):
+        """Replace the metadata snapshot with the current metadata and discard cached tasks.
+
+        :param bool expand_subworkflows: if True, embed the metadata of every nested subworkflow
+          in the snapshot, so that building their tasks does not query cromwell again
+          (default False)
+        :return dict: workflow metadata
+        """
+        self._metadata = self.get_metadata(expand_subworkflows=expand_subworkflows)
+        self._metadata_time = time.monotonic()
+        self._tasks = {}
+        return self._metadata
+
+    def get_metadata(self, include_keys=None, exclude_keys=None, expand_subworkflows=False):
+        """Retrieve a (possibly partial) metadata document for this workflow.
+
+        :param Iterable include_keys: (optional) only retrieve these metadata keys
+        :param Iterable exclude_keys: (optional) retrieve all metadata keys except these
+        :param bool expand_subworkflows: if True, embed subworkflow metadata in their calls
+          (default False)
+        :return dict: workflow metadata
+        """
+        response = self.cromwell_server.metadata(
+            self.id, include_keys=include_keys, exclude_keys=exclude_keys,
+            expand_subworkflows=expand_subworkflows)
+        response.raise_for_status()
+        return response.json()
 
     @property
     def metadata(self):
         """Workflow metadata."""
-        return self.cromwell_server.metadata(self.id).json()
+        snapshot = self._snapshot()
+        return snapshot if snapshot is not None else self.refresh()
+
+    def _metadata_field(self, key):
+        """Read key from the metadata snapshot, or retrieve only that key if there is none."""
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            return snapshot[key]
+        return self.get_metadata(include_keys=[key])[key]
 
     @property
     def root(self):
         """root directory for workflow outputs"""
-        return self.metadata['workflowRoot']
+        return self._metadata_field('workflowRoot')
 
     @property
     def outputs(self):
@@ -82,7 +155,7 @@ class WorkflowBase:
     @property
     def inputs(self):
         """workflow inputs"""
-        return self.metadata['inputs']
+        return self._metadata_field('inputs')
 
     @property
     def logs(self):
@@ -93,13 +166,27 @@ class WorkflowBase:
         """Open timing for this task in browser window."""
         self.cromwell_server.timing(self.id)
 
-    def refresh_tasks(self):
-        """update tasks in self.tasks"""
-        for name, shard_list in self.metadata['calls'].items():
-            if 'subWorkflowId' in shard_list[0]:  # is a list of subworkflows
+    def refresh_tasks(self, expand_subworkflows=False):
+        """update tasks in self.tasks from the metadata snapshot
+
+        :param bool expand_subworkflows: if True, refresh the snapshot, retrieving the metadata of
+          every nested subworkflow in the same request, so that building their tasks does not
+          query cromwell again (default False)
+        """
+        if expand_subworkflows:
+            metadata = self.refresh(expand_subworkflows=True)
+        else:
+            metadata = self.metadata
+
+        for name, shard_list in metadata['calls'].items():
+            if any(k in shard_list[0] for k in ('subWorkflowId', 'subWorkflowMetadata')):
+                # is a list of subworkflows
                 self._tasks[name] = [
-                    SubWorkflow(m['subWorkflowId'], self.cromwell_server, self.storage_client) for m
-                    in shard_list]
+                    SubWorkflow(
+                        m.get('subWorkflowId') or m['subWorkflowMetadata']['id'],
+                        self.cromwell_server, self.storage_client,
+                        metadata=m.get('subWorkflowMetadata'), metadata_ttl=self.metadata_ttl)
+                    for m in shard_list]
             else:
                 self._tasks[name] = CalledTask(name, shard_list, self.storage_client)
 
@@ -113,31 +200,125 @@ class WorkflowBase:
             self.refresh_tasks()
         return self._tasks
 
-    def save_resource_utilization(self, filename, retrieve=True):
-        """Save resource utilizations for each task to file.
+    @property
+    def subworkflows(self):
+        """List of the SubWorkflows called directly by this workflow."""
+        return [s for task in self.tasks.values() if not isinstance(task, CalledTask)
+                for s in task]
 
-        :param str | BufferedIOBase filename: filename or open file object in which to save
-          resource utilization
+    def build_tree(self, max_workers=8):
+        """Resolve the tasks of this workflow and of every nested subworkflow concurrently.
 
-        :param bool retrieve: if True, get the current metadata from Cromwell, otherwise retrieve
-          stored metadata (default True)
-        :param str workflow_id: identifier hash code for a workflow
-        :param bool verbose: if True, print the requests made
-        :param int timeout: maximum time to wait
-        :param int delay: time between status queries
+        Each subworkflow's metadata is requested as soon as its parent has been resolved, from a
+        pool of at most `max_workers` threads, so the wall-clock time grows with the depth of the
+        tree rather than its number of subworkflows. Subworkflows whose metadata is already in
+        their snapshot are resolved without a request.
 
-        :return requests.Response: status response from Cromwell
+        :param int max_workers: maximum number of concurrent metadata requests (default 8)
+        :return WorkflowBase: this workflow, with its tasks fully materialized
+        """
+        def resolve(workflow):
+            return workflow.subworkflows  # retrieves metadata and builds tasks, if needed
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {executor.submit(resolve, self)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.update(executor.submit(resolve, s) for s in future.result())
+        return self
+
+    def iter_called_tasks(self):
+        """Iterate over the CalledTasks of this workflow and, recursively, of its subworkflows.
+
+        :return Iterator: CalledTask objects
         """
-        if isinstance(filename, str):
-            filename = open(filename, 'w')
         for task in self.tasks.values():
             if isinstance(task, CalledTask):
-                filename.write(str(task.resource_utilization))
-            elif isinstance(task, SubWorkflow):
-                task.save_resource_utilization(filename, retrieve=retrieve)  # recursion
-            else:
-                raise TypeError('tasks must be CalledTasks or Subworkflows, not %s'
-                                % type(task))
+                yield task
+            else:  # list of SubWorkflows
+                for subworkflow in task:
+                    yield from subworkflow.iter_called_tasks()
+
+    def prefetch_resource_utilization(self, max_workers=16):
+        """Download the monitoring logs of every shard in this workflow tree concurrently.
+
+        All logs are fetched through one bounded thread pool that shares this workflow's storage
+        client.
+
+        :param int max_workers: maximum number of concurrent downloads (default 16)
+        """
+        prefetch_resource_utilization(
+            (shard for task in self.iter_called_tasks() for shard in task.shards),
+            max_workers=max_workers)
+
+    def update_resource_utilization(self, max_workers=16):
+        """Follow the monitoring logs of every shard in this workflow tree, concurrently.
+
+        Each shard downloads only the part of its log written since the previous update, so
+        repeated calls on a running workflow transfer little data. Shards that start after
+        `tasks` was built are not followed until the tasks are refreshed, which starts every log
+        from the beginning again.
+
+        :param int max_workers: maximum number of concurrent downloads (default 16)
+        """
+        update_resource_utilization(
+            (shard for task in self.iter_called_tasks() for shard in task.shards),
+            max_workers=max_workers)
+
+    def save_resource_utilization(self, filename, retrieve=True, max_workers=16):
+        """Save resource utilizations for each task to file, as text summaries.
+
+        The monitoring logs of every task in the workflow tree, including subworkflows, are
+        downloaded concurrently before the summaries are written. For machine-readable output,
+        see `export_resource_utilization`.
+
+        :param str | io.TextIOBase filename: filename or open text file object in which to save
+          resource utilization. Files opened here are closed when done.
+        :param bool retrieve: if True, get the current metadata of the whole workflow tree from
+          Cromwell in one request, otherwise use the stored metadata snapshots (default True)
+        :param int max_workers: maximum number of concurrent downloads (default 16)
+        """
+        if retrieve:
+            self.refresh(expand_subworkflows=True)
+        self.build_tree(max_workers=max_workers)
+        self.prefetch_resource_utilization(max_workers=max_workers)
+        if isinstance(filename, str):
+            with open(filename, 'w') as f:
+                self._write_resource_utilization(f)
+        else:
+            self._write_resource_utilization(filename)
+
+    def _write_resource_utilization(self, file_object):
+        for task in self.iter_called_tasks():
+            utilization = task.resource_utilization
+            if utilization is not None:
+                file_object.write(str(utilization))
+
+    def export_resource_utilization(self, destination, format=None, retrieve=True,
+                                    max_workers=16, shards=True, tasks=True):
+        """Export resource utilization as CSV, JSON Lines, Parquet or Arrow.
+
+        Writes one row per shard and one per task, with the workflow id, subworkflow path and
+        shard index of each, streaming rows to destination while logs are downloaded
+        concurrently. See `cromwell_manager.export`.
+
+        :param str | file destination: path, or open file (text for csv and jsonl, binary for
+          parquet and arrow)
+        :param str format: (optional) one of csv, jsonl, parquet or arrow. Inferred from the
+          extension of destination if not provided.
+        :param bool retrieve: if True, get the current metadata of the whole workflow tree from
+          Cromwell in one request, otherwise use the stored metadata snapshots (default True)
+        :param int max_workers: maximum number of concurrent downloads (default 16)
+        :param bool shards: if True, write a row for each shard (default True)
+        :param bool tasks: if True, write a row for each task (default True)
+        :return int: number of rows written
+        """
+        if retrieve:
+            self.refresh(expand_subworkflows=True)
+        return export_resource_utilization(
+            self, destination, format=format, max_workers=max_workers, shards=shards,
+            tasks=tasks)
 
 
 # todo workflow fails to start, make the error messages clearer! right now you get a KeyError
@@ -156,7 +337,8 @@ class Workflow(WorkflowBase):
         """Submit a new workflow, returning a Workflow object.
 
 
-        :param str wdl: wdl that defines this workflow
+        :param str | SubmissionBundle wdl: wdl that defines this workflow, or a bundle of the
+          wdl, options, dependencies and labels shared by many submissions
         :param str inputs_json: inputs to this wdl
         :param Cromwell cromwell_server: an authenticated cromwell server
         :param storage.Client storage_client: authenticated google storage client
@@ -189,57 +371,31 @@ class Workflow(WorkflowBase):
                                 workflow_dependencies=None, custom_labels=None):
         """Create a submission json for the submit POST request.
 
-        :param str wdl:
+        :param str | SubmissionBundle wdl: wdl, or a bundle containing the wdl, options,
+          dependencies and labels (which must then not be passed separately)
         :param str inputs_json:
         :param storage.Client gs_client:
 
         :param str options_json:
         :param str | dict workflow_dependencies:
         :param dict custom_labels:
-        :return dict: json dictionary containing inputs: open filehandles
+        :return dict: json dictionary containing inputs: in-memory file objects
         """
-        submission_json = {}
-
         for name, param in (('wdl', wdl), ('inputs_json', inputs_json)):
             if param is None:
                 raise ValueError('parameter %s is required.' % name)
 
-        check_parameters = {
-            'wdlSource': wdl,
-            'workflowInputs': inputs_json,
-            'workflowOptions': options_json,
-            'customLabels': custom_labels
-        }
-
-        # workflow dependencies
-        if workflow_dependencies is None:
-            pass  # nothing to do
-        elif isinstance(workflow_dependencies, str) and workflow_dependencies.endswith('.zip'):
-            check_parameters['wdlDependencies'] = workflow_dependencies  # delay check to below
-        elif isinstance(workflow_dependencies, dict):
-            submission_json['wdlDependencies'] = package_workflow_dependencies(
-                **workflow_dependencies)
+        if isinstance(wdl, SubmissionBundle):
+            if any(p is not None for p in (options_json, workflow_dependencies, custom_labels)):
+                raise ValueError('options_json, workflow_dependencies and custom_labels must be '
+                                 'provided by the SubmissionBundle, not passed separately')
+            bundle = wdl
         else:
-            raise TypeError(
-                'if provided, workflow_dependencies must be a dict containing '
-                '(name, value) pairs, or a path to a pre-zipped dependency archive, '
-                'not %s' % workflow_dependencies)
-
-        for key, param in check_parameters.items():
-            if param is not None:
-                if isinstance(param, dict):  # custom labels or options json
-                    fileobj = tempfile.TemporaryFile(mode='w+b')
-                    fileobj.write(json.dumps(param).encode())
-                    fileobj.seek(0)
-                    submission_json[key] = fileobj
-                elif param.startswith('gs://'):
-                    submission_json[key] = GSObject(param, gs_client).download_to_bytes_readable()
-                elif any(param.startswith(prefix) for prefix in ('https://', 'http://')):
-                    submission_json[key] = HTTPObject(param).download_to_bytes_readable()
-                else:
-                    submission_json[key] = open(param, 'rb')
+            bundle = SubmissionBundle.load(
+                wdl, options_json=options_json, workflow_dependencies=workflow_dependencies,
+                custom_labels=custom_labels, storage_client=gs_client)
 
-        return submission_json
+        return {key: BytesIO(data) for key, data in bundle.files(inputs_json, gs_client).items()}
 
     def abort(self, *args, **kwargs):
         """Abort this workflow.
@@ -251,19 +407,39 @@ class Workflow(WorkflowBase):
         """
         return self.cromwell_server.abort_workflow(self.id, *args, **kwargs).json()
 
-    def wait_until_complete(self, *args, **kwargs):
+    def wait_until_complete(self, verbose=False, timeout=15, delay=3, watcher=None):
         """Wait until the workflow completes running.
 
+        To wait on many workflows, pass the same `WorkflowWatcher` to each call (or use the
+        watcher directly), so that their statuses are checked together.
+
         Optional Arguments:
-        :param str workflow_id: identifier hash code for a workflow
-        :param bool verbose: if True, print the requests made
-        :param int timeout: maximum time to wait
-        :param int delay: time between status queries
+        :param bool verbose: if True, print a message while waiting
+        :param int timeout: maximum time to wait, None to wait indefinitely
+        :param int delay: initial time between status queries, ignored if watcher is provided
+        :param WorkflowWatcher watcher: (optional) watcher to check the status through
 
-        :return requests.Response: status response from Cromwell
+        :return dict | None: cromwell query record for the completed workflow, or None if it did
+          not complete within timeout
         """
-        complete_status = ['Aborted', 'Failed', 'Succeeded']
-        self.cromwell_server.wait_for_status(complete_status, self.id, *args, **kwargs)
+        if watcher is None:
+            watcher = WorkflowWatcher(self.cromwell_server, delay=delay, max_delay=max(delay, 60))
+        if verbose:
+            print('Waiting for workflow to achieve {status} status ...'
+                  .format(status=set(watcher.statuses)))
+
+        future = watcher.watch(self.id)
+        try:
+            if watcher.is_running:
+                return future.result(timeout=timeout)
+            for _ in watcher.as_completed(timeout=timeout):
+                if future.done():
+                    break
+            return future.result(timeout=0)
+        except FutureTimeoutError:
+            print('Workflow took more than {n!s} seconds to achieve {status}'
+                  ''.format(n=timeout, status=set(watcher.statuses)))
+            return None
 
     # todo debug this; would be nice to get a list of currently-running tasks
     # def running_tasks(self):